@@ -13,6 +13,7 @@ import os
 from pathlib import Path
 import logging
 import socket
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -133,6 +134,30 @@ SPECTACULAR_SETTINGS = {
     ],
 }
 
+# Кэш. В проде — общий Redis (снимки заказов для поллинга оплаты и т.п. должны
+# быть видны всем воркерам); без REDIS_URL — локальный LocMem на процесс.
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_PREFIX": "wm",
+            "TIMEOUT": 300,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "whitemebel",
+        }
+    }
+
+# Снимки заказов (core/utils/order_cache.py) — только в общем кэше: снимок, записанный
+# WSGI-процессом, должен увидеть ASGI-сервис long-poll'а. С LocMem читаем заказ из БД.
+ORDER_SNAPSHOT_CACHE = bool(REDIS_URL)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -153,16 +178,43 @@ AUTH_PASSWORD_VALIDATORS = [
 
 
 
+# Логи: JSON-строки, форматирование и запись — в треде QueueListener (core/utils/log.py),
+# поток запроса только кладёт запись в очередь. LOG_JSON=0 — обычный текст для локалки.
+LOG_JSON = os.getenv("LOG_JSON", "1") in {"1", "true", "yes"}
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Какую долю входящих вебхуков CP логировать целиком (заголовки/тело/payload)
+LOG_CP_WEBHOOK_SAMPLE_RATE = float(os.getenv("LOG_CP_WEBHOOK_SAMPLE_RATE", "1" if DEBUG else "0.05"))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "json": {"()": "core.utils.log.JsonFormatter"},
+        "plain": {"()": "core.utils.log.PlainFormatter"},
+    },
+    "filters": {
+        "cp_webhook_sample": {
+            "()": "core.utils.log.SampleFilter",
+            "rate": LOG_CP_WEBHOOK_SAMPLE_RATE,
+            "prefixes": ["CP webhook <--", "CP webhook digest"],
+        },
+    },
     "handlers": {
-        "console": {"class": "logging.StreamHandler"},
+        "console": {
+            "()": "core.utils.log.QueueLogHandler",
+            "formatter": "json" if LOG_JSON else "plain",
+        },
     },
     "loggers": {
+        "core": {
+            "handlers": ["console"],
+            "level": LOG_LEVEL,
+            "propagate": False,
+        },
         # наш отдельный логгер для платежей
         "core.payments": {
             "handlers": ["console"],
+            "filters": ["cp_webhook_sample"],
             "level": "DEBUG" if DEBUG else "INFO",
             "propagate": False,
         },
@@ -195,6 +247,31 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# media именуется по sha256 содержимого (core/utils/storage.py): одинаковые загрузки — один файл,
+# имя никогда не переиспользуется — nginx отдаёт /media/ как immutable
+STORAGES = {
+    "default": {"BACKEND": "core.utils.storage.ContentHashStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+# Перекодирование загруженных картинок в фоне (задача images.process, воркер run_jobs).
+# 0 — по-старому, прямо в save() (удобно без воркера).
+IMAGE_PROCESS_ASYNC = os.getenv("IMAGE_PROCESS_ASYNC", "1") in {"1", "true", "yes"}
+# Оригинал ужимается до IMAGE_MAX_SIDE по большей стороне (JPEG — ещё при декодировании);
+# больше IMAGE_MAX_PIXELS пикселей (после такого ужатия) не декодируем вовсе — файл помечается failed
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "2560"))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))
+# Ресайзы картинок под srcset (core/utils/renditions.py): ширины и форматы по приоритету
+IMAGE_RENDITION_WIDTHS = [int(w) for w in os.getenv("IMAGE_RENDITION_WIDTHS", "320,640,960,1280").split(",") if w.strip()]
+IMAGE_RENDITION_FORMATS = [f.strip() for f in os.getenv("IMAGE_RENDITION_FORMATS", "avif,webp").split(",") if f.strip()]
+IMAGE_RENDITION_QUALITY = {"avif": 60, "webp": 78}
+# Ресайз по подписанной ссылке (/api/img/resize/): дисковый кэш и отдача через nginx (X-Accel-Redirect)
+IMAGE_RESIZE_CACHE_DIR = os.getenv("IMAGE_RESIZE_CACHE_DIR", str(MEDIA_ROOT / "resized"))
+# flock'и рендера — вне публичного кэша (общий для воркеров контейнера каталог)
+IMAGE_RESIZE_LOCK_DIR = os.getenv("IMAGE_RESIZE_LOCK_DIR", os.path.join(tempfile.gettempdir(), "whitemebel-resize-locks"))
+IMAGE_RESIZE_ACCEL = os.getenv("IMAGE_RESIZE_ACCEL", "0" if DEBUG else "1") in {"1", "true", "yes"}
+IMAGE_RESIZE_ACCEL_PREFIX = "/_resized/"  # internal-location в nginx.conf -> /media/resized/
+
 
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = os.getenv("EMAIL_HOST", "smtp.yandex.ru")
@@ -206,6 +283,10 @@ EMAIL_USE_SSL = os.getenv("EMAIL_USE_SSL", "0") in {"1","true","yes"}
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "revi.krim@yandex.ru")
 SERVER_EMAIL = os.getenv("SERVER_EMAIL", DEFAULT_FROM_EMAIL)
 EMAIL_TIMEOUT = 10  # сек
+# Пул SMTP (core/utils/mailer.py): темп под лимиты провайдера и длина одной сессии
+EMAIL_RATE_LIMIT_PER_MINUTE = int(os.getenv("EMAIL_RATE_LIMIT_PER_MINUTE", "30"))
+EMAIL_RATE_BURST = int(os.getenv("EMAIL_RATE_BURST", "5"))
+EMAIL_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("EMAIL_MAX_MESSAGES_PER_CONNECTION", "50"))
 
 if os.getenv("EMAIL_FORCE_IPV4", "1") in {"1", "true", "True"}:
     try:
@@ -214,7 +295,27 @@ if os.getenv("EMAIL_FORCE_IPV4", "1") in {"1", "true", "True"}:
         pass
 # Список email'ов, кого оповещать о новом заказе (через запятую)
 ORDER_NOTIFY_EMAILS = [e.strip() for e in os.getenv("ORDER_NOTIFY_EMAILS", "").split(",") if e.strip()]
+# Дайджест для админов: вместо письма на каждый заказ — сводка раз в N минут
+# или сразу по набору M заказов. 0 минут — старый режим, письмо на каждый заказ.
+# Покупатели получают подтверждение сразу в любом режиме.
+ORDER_ADMIN_DIGEST_MINUTES = int(os.getenv("ORDER_ADMIN_DIGEST_MINUTES", "0"))
+ORDER_ADMIN_DIGEST_MAX_ORDERS = int(os.getenv("ORDER_ADMIN_DIGEST_MAX_ORDERS", "50"))
+
+# Очередь фоновых задач (core/jobs.py, manage.py run_jobs)
+JOBS_RETRY_BASE_DELAY = int(os.getenv("JOBS_RETRY_BASE_DELAY", "30"))       # сек, дальше x2 на попытку
+JOBS_RETRY_MAX_DELAY = int(os.getenv("JOBS_RETRY_MAX_DELAY", "3600"))       # потолок backoff
+JOBS_VISIBILITY_TIMEOUT = int(os.getenv("JOBS_VISIBILITY_TIMEOUT", "600"))  # running дольше — воркер умер
+JOBS_KEEP_DONE_DAYS = int(os.getenv("JOBS_KEEP_DONE_DAYS", "7"))
+
+# Сколько живёт Idempotency-Key для POST /api/orders/ (часы)
+IDEMPOTENCY_KEY_TTL_HOURS = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", "24"))
 
 CLOUDPAYMENTS_PUBLIC_ID=os.getenv("CLOUDPAYMENTS_PUBLIC_ID","")
 CLOUDPAYMENTS_API_SECRET=os.getenv("CLOUDPAYMENTS_API_SECRET","")
 
+# Фид остатков/цен из учётки (POST /api/catalog/stock-feed/, core/stock_feed.py):
+# заголовок "Authorization: Token <STOCK_FEED_TOKEN>"; пустой токен — только staff-сессия
+STOCK_FEED_TOKEN = os.getenv("STOCK_FEED_TOKEN", "")
+STOCK_FEED_BATCH = int(os.getenv("STOCK_FEED_BATCH", "1000"))
+STOCK_FEED_MAX_ITEMS = int(os.getenv("STOCK_FEED_MAX_ITEMS", "20000"))
+
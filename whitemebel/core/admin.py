@@ -19,12 +19,17 @@ from .models import (
     Category,
     Collection,
     User,
-    ContactRequest
-    
+    ContactRequest,
+    Job,
+    PaymentNotification,
 )
+from django.db import transaction
+from django.utils import timezone
 from django.utils.html import format_html
 from mptt.admin import DraggableMPTTAdmin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from core.jobs import enqueue
+from core.payments import PROCESS_TASK
 
 
 @admin.register(Color)
@@ -43,7 +48,7 @@ class ColorAdmin(admin.ModelAdmin):
 class ProductImageInline(admin.TabularInline):
     model = ProductImage
     extra = 1
-    readonly_fields = ('image_preview',)
+    readonly_fields = ('image_preview', 'image_status')
 
     def image_preview(self, obj):
         if obj.image:
@@ -58,13 +63,13 @@ class ProductAttributeValueInline(admin.TabularInline):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ("title", "price", "discount_price", "stock", "is_active", "color")
-    list_filter = ("is_active", "tags", "color")
+    list_display = ("title", "price", "discount_price", "stock", "is_active", "color", "image_status")
+    list_filter = ("is_active", "tags", "color", "image_status")
     search_fields = ("title", "description", "sku")
     prepopulated_fields = {"slug": ("title",)}
     inlines = [ProductImageInline, ProductAttributeValueInline]
     filter_horizontal = ("tags", "related_by_color")
-    readonly_fields = ("created_at", "updated_at")
+    readonly_fields = ("created_at", "updated_at", "image_status")
     
     save_on_top = True
     list_per_page = 25
@@ -157,6 +162,7 @@ class OrderAdmin(admin.ModelAdmin):
     list_filter = ('status', 'payment_method', 'delivery_type')
     search_fields = ('full_name', 'phone', 'email')
     date_hierarchy = 'created_at'
+    readonly_fields = ('admin_notified_at',)
     inlines = [OrderItemInline, OrderServiceInline]
 
 
@@ -209,4 +215,44 @@ class OneClickRequestAdmin(admin.ModelAdmin):
     list_display = ("id", "name", "phone", "product", "status", "created_at")
     list_filter  = ("status", "created_at")
     search_fields = ("name", "phone", "product_url", "product__title")
-    readonly_fields = ("created_at",)
\ No newline at end of file
+    readonly_fields = ("created_at",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "task", "queue", "status", "attempts", "max_attempts", "run_at", "updated_at")
+    list_filter = ("status", "queue", "task")
+    search_fields = ("task", "last_error")
+    readonly_fields = ("created_at", "updated_at", "locked_at", "locked_by", "last_error", "dedupe_key")
+    actions = ("requeue",)
+
+    @admin.action(description="Перезапустить (вернуть в очередь)")
+    def requeue(self, request, queryset):
+        # dedupe_key сбрасываем: иначе упрёмся в уникальность, если такая задача уже ждёт в очереди
+        n = queryset.exclude(status=Job.Status.RUNNING).update(
+            status=Job.Status.QUEUED, attempts=0, run_at=timezone.now(), locked_at=None, locked_by="",
+            dedupe_key="",
+        )
+        self.message_user(request, f"В очередь возвращено: {n}")
+
+
+@admin.register(PaymentNotification)
+class PaymentNotificationAdmin(admin.ModelAdmin):
+    list_display = ("id", "event", "order_id", "transaction_id", "status", "result_code", "received_at", "processed_at")
+    list_filter = ("status", "event")
+    search_fields = ("order_id", "transaction_id")
+    readonly_fields = ("received_at", "processed_at", "result_code", "result_message")
+    actions = ("reprocess",)
+
+    @admin.action(description="Обработать повторно")
+    def reprocess(self, request, queryset):
+        n = 0
+        with transaction.atomic():
+            for note in queryset.exclude(status=PaymentNotification.Status.RECEIVED):
+                PaymentNotification.objects.filter(pk=note.pk).update(
+                    status=PaymentNotification.Status.RECEIVED, processed_at=None,
+                )
+                enqueue(PROCESS_TASK, notification_id=note.pk)
+                n += 1
+        self.message_user(request, f"Поставлено в обработку: {n}")
+
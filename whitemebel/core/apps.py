@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # регистрация фоновых задач (@task) для enqueue() и manage.py run_jobs
+        from core import tasks  # noqa: F401
@@ -0,0 +1,571 @@
+# core/catalog_import.py
+"""
+Импорт каталога из фидов поставщиков (CSV / JSON / JSON Lines / YML Яндекс.Маркета).
+
+    rows = read_feed("supplier.yml")
+    stats = CatalogImporter(batch_size=2000).run(rows)
+
+Фид читается потоком (YML — iterparse), строки нормализуются в общий вид и пишутся
+пачками: товары — bulk_create(update_conflicts) по sku, теги и характеристики —
+bulk_create в through-таблицы. Справочники (категории, цвета, теги, опции) и занятые
+слаги держатся в памяти, так что на пачку уходит константное число запросов.
+Картинки не качаются во время импорта: на каждую ставится задача catalog.fetch_image.
+
+Нормализованная строка:
+
+    {"sku", "title", "description", "price", "discount_price", "stock", "is_active",
+     "category": ["Шкафы", "Купе"], "color", "width", "height", "depth",
+     "tags": [...], "attributes": {"Материал": ["ЛДСП"]}, "images": [url, ...]}
+
+Ключа нет — поле у существующего товара не трогаем (tags/attributes/images — тоже),
+так что для обновления хватает sku и изменившихся полей. Новому товару нужны title и price.
+"""
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import posixpath
+import urllib.request
+import xml.etree.ElementTree as ET
+from collections import Counter, defaultdict
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from core.jobs import enqueue_many
+from core.models import (
+    AttributeOption,
+    Category,
+    Color,
+    Product,
+    ProductAttribute,
+    ProductAttributeValue,
+    ProductImage,
+    Tag,
+)
+from core.utils.catalog_cache import bump_catalog_version_on_commit
+from core.utils.slug import SlugAllocator
+
+log = logging.getLogger(__name__)
+
+FETCH_IMAGE_TASK = "catalog.fetch_image"
+
+# товарные поля, которые импорт обновляет у существующих товаров (если они есть в строке)
+PRODUCT_FIELDS = ("title", "description", "price", "discount_price", "stock", "is_active",
+                  "width", "height", "depth")
+# param'ы YML / колонки, которые на самом деле поля товара, а не характеристики
+PARAM_FIELDS = {"цвет": "color", "ширина": "width", "высота": "height", "глубина": "depth"}
+TRUE = {"1", "true", "yes", "да", "+"}
+
+
+class RowError(ValueError):
+    pass
+
+
+# ---------- чтение фидов ----------
+
+def _split(value, sep="|") -> list[str]:
+    if isinstance(value, (list, tuple)):
+        return [str(v).strip() for v in value if str(v).strip()]
+    return [v.strip() for v in str(value or "").split(sep) if v.strip()]
+
+
+def _read_csv(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        sample = f.read(4096)
+        f.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t") if sample else csv.excel
+        for raw in csv.DictReader(f, dialect=dialect):
+            row = {}
+            attrs = {}
+            for key, value in raw.items():
+                if not key:
+                    continue
+                key = key.strip()
+                if key.lower().startswith("attr:"):
+                    if _split(value):
+                        attrs[key[5:].strip()] = _split(value)
+                elif value is not None and value.strip() != "":
+                    row[key.lower()] = value.strip()
+            for key in ("tags", "images", "category"):
+                if key in row:
+                    row[key] = _split(row[key], "|" if key != "category" else "/")
+            if attrs:
+                row["attributes"] = attrs
+            yield row
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8-sig") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("products") or data.get("items") or []
+    yield from data
+
+
+def _read_yml(path):
+    """Яндекс.Маркет YML: <categories> в начале, потом <offers>. Разобранное сразу чистим."""
+    categories = {}  # id -> (name, parent_id)
+    root = None
+    for event, elem in ET.iterparse(path, events=("start", "end")):
+        if root is None:
+            root = elem
+        if event != "end":
+            continue
+        if elem.tag == "category":
+            categories[elem.get("id")] = ((elem.text or "").strip(), elem.get("parentId"))
+        elif elem.tag == "offer":
+            yield _yml_offer(elem, categories)
+            root.clear()  # iterparse иначе держит в памяти всё дерево
+
+
+def _yml_offer(elem, categories):
+    text = lambda tag: (elem.findtext(tag) or "").strip()  # noqa: E731
+    row = {"sku": text("vendorCode") or elem.get("id") or "", "title": text("name") or text("model")}
+    price, oldprice = text("price"), text("oldprice")
+    if oldprice:
+        row["price"], row["discount_price"] = oldprice, price
+    elif price:
+        row["price"] = price
+    if text("description"):
+        row["description"] = text("description")
+    count = text("count") or text("quantity")
+    if count:
+        row["stock"] = count
+    if elem.get("available") is not None:
+        row["is_active"] = elem.get("available")
+
+    path, cid, seen = [], text("categoryId"), set()
+    while cid and cid in categories and cid not in seen:
+        seen.add(cid)
+        name, cid = categories[cid]
+        path.insert(0, name)
+    if path:
+        row["category"] = path
+
+    attrs = defaultdict(list)
+    for param in elem.iter("param"):
+        name, value = (param.get("name") or "").strip(), (param.text or "").strip()
+        if not name or not value:
+            continue
+        field = PARAM_FIELDS.get(name.lower())
+        if field:
+            row[field] = value
+        else:
+            attrs[name].append(value)
+    if attrs:
+        row["attributes"] = dict(attrs)
+    pictures = [(p.text or "").strip() for p in elem.iter("picture") if (p.text or "").strip()]
+    if pictures:
+        row["images"] = pictures
+    return row
+
+
+def read_feed(path: str, fmt: str | None = None):
+    fmt = fmt or {".csv": "csv", ".tsv": "csv", ".yml": "yml", ".xml": "yml"}.get(
+        os.path.splitext(path)[1].lower(), "json",
+    )
+    return {"csv": _read_csv, "json": _read_json, "yml": _read_yml}[fmt](path)
+
+
+# ---------- нормализация ----------
+
+def _decimal(value, field, *, required=False):
+    if value in (None, ""):
+        if required:
+            raise RowError(f"{field}: пусто")
+        return None
+    try:
+        return Decimal(str(value).replace(" ", "").replace(",", ".")).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise RowError(f"{field}: не число «{value}»")
+
+
+def make_sku(row: dict) -> str:
+    # у фида нет артикула — детерминированный, чтобы повторный импорт попадал в тот же товар
+    key = "|".join([row.get("title", ""), "/".join(row.get("category") or [])])
+    return "IMP-" + hashlib.sha1(key.encode()).hexdigest()[:10].upper()
+
+
+def normalize(raw: dict) -> dict:
+    row = {str(k).lower(): v for k, v in raw.items()}
+    out = {}
+    # title/price обязательны только новому товару — это проверит _import_chunk, когда узнает, есть ли sku
+    title = str(row.get("title") or row.get("name") or "").strip()
+    if title:
+        out["title"] = title[:255]
+    if "category" in row:
+        out["category"] = _split(row["category"], "/")
+    sku = str(row.get("sku") or "").strip()[:64]
+    if not sku and not title:
+        raise RowError("sku и title: пусто")
+    out["sku"] = sku or make_sku(out)
+    if "price" in row:
+        out["price"] = _decimal(row["price"], "price", required=True)
+    if "discount_price" in row:
+        out["discount_price"] = _decimal(row["discount_price"], "discount_price")
+    for field in ("width", "height", "depth"):
+        if field in row:
+            out[field] = _decimal(row[field], field)
+    if "stock" in row:
+        try:
+            out["stock"] = max(0, int(Decimal(str(row["stock"]))))
+        except InvalidOperation:
+            raise RowError(f"stock: не число «{row['stock']}»")
+    if "is_active" in row:
+        out["is_active"] = str(row["is_active"]).strip().lower() in TRUE
+    if row.get("description"):
+        out["description"] = str(row["description"])
+    if row.get("color"):
+        out["color"] = str(row["color"]).strip()[:50]
+    if "tags" in row:
+        out["tags"] = [t[:100] for t in _split(row["tags"])]
+    if "attributes" in row:
+        out["attributes"] = {
+            str(k).strip()[:100]: [v[:255] for v in _split(vs)]
+            for k, vs in (row["attributes"] or {}).items() if str(k).strip()
+        }
+    if "images" in row:
+        out["images"] = [u[:500] for u in _split(row["images"])]
+    return out
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+# ---------- запись ----------
+
+class CatalogImporter:
+    def __init__(self, batch_size: int = 2000, images: bool = True, images_dir: str | None = None):
+        self.batch_size = max(1, batch_size)
+        self.images = images
+        self.images_dir = images_dir
+        self.stats = Counter()
+        self.errors: list[tuple[int, str]] = []
+        self._categories = None  # ("Шкафы", "Купе") -> id
+        self._colors = {c.name.lower(): c.id for c in Color.objects.all()}
+        self._tags = {t.name.lower(): t.id for t in Tag.objects.all()}
+        self._attrs = {a.name.lower(): a.id for a in ProductAttribute.objects.all()}
+        self._options = {(o.attribute_id, o.value.lower()): o.id for o in AttributeOption.objects.all()}
+        self._product_slugs = SlugAllocator(Product.objects.values_list("slug", flat=True))
+
+    def run(self, rows, progress=None) -> Counter:
+        def normalized():
+            for n, raw in enumerate(rows, 1):
+                try:
+                    row = normalize(raw)
+                except RowError as e:
+                    self._error(n, str(e))
+                else:
+                    row["_line"] = n
+                    yield row
+
+        for chunk in _chunks(normalized(), self.batch_size):
+            # строки с одним sku сливаются по ключам, как если бы их применили по очереди:
+            # {sku, stock} после {sku, price} не должна стереть цену
+            merged = {}
+            for r in chunk:
+                merged.setdefault(r["sku"], {}).update(r)
+            with transaction.atomic():
+                written = self._import_chunk(list(merged.values()))
+                bump_catalog_version_on_commit()  # одна новая версия каталога на пачку
+            self.stats["rows"] += written
+            if progress:
+                progress(self.stats)
+        return self.stats
+
+    def _error(self, line: int, message: str):
+        self.stats["errors"] += 1
+        self.errors.append((line, message))
+
+    # --- справочники ---
+
+    def _category_id(self, path: list[str]) -> int | None:
+        if not path:
+            return None
+        if self._categories is None:
+            nodes = {c.id: c for c in Category.objects.only("id", "name", "parent_id")}
+
+            def key(c):
+                names = []
+                while c is not None:
+                    names.insert(0, c.name.lower())
+                    c = nodes.get(c.parent_id)
+                return tuple(names)
+            self._categories = {key(c): c.id for c in nodes.values()}
+            self._category_slugs = SlugAllocator(Category.objects.values_list("slug", flat=True))
+        parent_id = None
+        for depth in range(1, len(path) + 1):
+            key = tuple(n.lower() for n in path[:depth])
+            if key not in self._categories:
+                # категорий единицы — через save(), чтобы MPTT сам посчитал lft/rght
+                cat = Category.objects.create(
+                    name=path[depth - 1][:255], parent_id=parent_id,
+                    slug=self._category_slugs.allocate("-".join(path[:depth])),
+                )
+                self._categories[key] = cat.id
+                self.stats["categories_created"] += 1
+            parent_id = self._categories[key]
+        return parent_id
+
+    def _ensure(self, cache: dict, model, names, build):
+        """Создать недостающие записи справочника одним bulk_create и дописать их id в cache."""
+        missing = {n.lower(): n for n in names if n and n.lower() not in cache}
+        if not missing:
+            return
+        model.objects.bulk_create([build(n) for n in missing.values()], ignore_conflicts=True)
+        for obj in model.objects.filter(name__in=list(missing.values())):
+            cache[obj.name.lower()] = obj.id
+        self.stats[f"{model._meta.model_name}_created"] += len(missing)
+
+    def _ensure_dictionaries(self, chunk):
+        self._ensure(self._colors, Color, {r["color"] for r in chunk if r.get("color")},
+                     lambda n: Color(name=n))
+        tag_names = {t for r in chunk for t in r.get("tags", ())}
+        if any(t.lower() not in self._tags for t in tag_names):
+            tag_slugs = SlugAllocator(Tag.objects.values_list("slug", flat=True), max_length=100)
+            self._ensure(self._tags, Tag, tag_names, lambda n: Tag(name=n, slug=tag_slugs.allocate(n)))
+
+        attr_names = {a for r in chunk for a in r.get("attributes", {})}
+        if any(a.lower() not in self._attrs for a in attr_names):
+            attr_slugs = SlugAllocator(ProductAttribute.objects.values_list("slug", flat=True), max_length=120)
+            self._ensure(self._attrs, ProductAttribute, attr_names,
+                         lambda n: ProductAttribute(name=n, slug=attr_slugs.allocate(n)))
+
+        missing = {
+            (self._attrs[a.lower()], v.lower()): v
+            for r in chunk for a, vs in r.get("attributes", {}).items() for v in vs
+            if (self._attrs[a.lower()], v.lower()) not in self._options
+        }
+        if missing:
+            AttributeOption.objects.bulk_create(
+                [AttributeOption(attribute_id=aid, value=v) for (aid, _k), v in missing.items()],
+                ignore_conflicts=True,
+            )
+            for o in AttributeOption.objects.filter(attribute_id__in={aid for aid, _k in missing},
+                                                    value__in=set(missing.values())):
+                self._options[(o.attribute_id, o.value.lower())] = o.id
+            self.stats["options_created"] += len(missing)
+
+    # --- товары ---
+
+    def _import_chunk(self, chunk) -> int:
+        existing = dict(Product.objects.filter(sku__in=[r["sku"] for r in chunk]).values_list("sku", "id"))
+        valid = []
+        for r in chunk:
+            missing = [f for f in ("title", "price") if f not in r]
+            if r["sku"] not in existing and missing:
+                self._error(r["_line"], f"{r['sku']}: новый товар, нет {', '.join(missing)}")
+            else:
+                valid.append(r)
+        chunk = valid
+        if not chunk:
+            return 0
+        self._ensure_dictionaries(chunk)
+
+        # поля, которые есть хоть в одной строке пачки; у строк без поля подставляем текущее
+        fields = [f for f in PRODUCT_FIELDS if any(f in r for r in chunk)]
+        if "price" in fields or "discount_price" in fields:
+            # скидку сверяем с итоговой ценой, так что нужны обе (у частичных строк — текущие)
+            fields = [f for f in PRODUCT_FIELDS if f in fields or f in ("price", "discount_price")]
+        has_category = any("category" in r for r in chunk)
+        has_color = any("color" in r for r in chunk)
+        # title/price — NOT NULL: их нужно вставить и в строку, которая уйдёт в ON CONFLICT UPDATE
+        loaded = list(dict.fromkeys([*fields, "title", "price"]))
+        current = {}
+        partial = [r["sku"] for r in chunk if r["sku"] in existing and (
+            any(f not in r for f in loaded) or (has_category and "category" not in r)
+            or (has_color and "color" not in r))]
+        if partial:
+            current = {p.sku: p for p in Product.objects.filter(sku__in=partial).only(
+                "sku", "category_id", "color_id", *loaded)}
+
+        now = timezone.now()
+        objs = []
+        for r in chunk:
+            old = current.get(r["sku"])
+            p = Product(sku=r["sku"], updated_at=now)
+            for f in loaded:
+                if f in r:
+                    setattr(p, f, r[f])
+                elif old is not None:
+                    setattr(p, f, getattr(old, f))
+            p.category_id = self._category_id(r["category"]) if "category" in r else (old.category_id if old else None)
+            if "color" in r:
+                p.color_id = self._colors.get(r["color"].lower())
+            elif old is not None:
+                p.color_id = old.color_id
+            if p.discount_price is not None and p.price is not None and p.discount_price >= p.price:
+                p.discount_price = None  # «скидка» не дешевле цены — не скидка
+            if r["sku"] not in existing:
+                p.slug = self._product_slugs.allocate(r["title"])
+            objs.append(p)
+
+        update_fields = [*fields, "updated_at"]
+        if has_category:
+            update_fields.append("category")
+        if has_color:
+            update_fields.append("color")
+        Product.objects.bulk_create(
+            objs, update_conflicts=True, unique_fields=["sku"], update_fields=update_fields,
+        )
+        ids = dict(Product.objects.filter(sku__in=[r["sku"] for r in chunk]).values_list("sku", "id"))
+        self.stats["created"] += sum(1 for r in chunk if r["sku"] not in existing)
+        self.stats["updated"] += sum(1 for r in chunk if r["sku"] in existing)
+
+        self._sync_tags(chunk, ids)
+        self._sync_attributes(chunk, ids)
+        if self.images:
+            self._schedule_images(chunk, ids)
+        return len(chunk)
+
+    def _sync_tags(self, chunk, ids):
+        rows = [r for r in chunk if "tags" in r]
+        if not rows:
+            return
+        through = Product.tags.through
+        through.objects.filter(product_id__in=[ids[r["sku"]] for r in rows]).delete()
+        through.objects.bulk_create([
+            through(product_id=ids[r["sku"]], tag_id=self._tags[t.lower()])
+            for r in rows for t in dict.fromkeys(r["tags"])
+        ], ignore_conflicts=True)
+
+    def _sync_attributes(self, chunk, ids):
+        rows = [r for r in chunk if "attributes" in r]
+        if not rows:
+            return
+        ProductAttributeValue.objects.filter(product_id__in=[ids[r["sku"]] for r in rows]).delete()
+        values = {
+            (ids[r["sku"]], self._attrs[a.lower()], self._options[(self._attrs[a.lower()], v.lower())])
+            for r in rows for a, vs in r["attributes"].items() for v in vs
+        }
+        ProductAttributeValue.objects.bulk_create(
+            [ProductAttributeValue(product_id=p, attribute_id=a, option_id=o) for p, a, o in values],
+            ignore_conflicts=True,
+        )
+
+    def _schedule_images(self, chunk, ids):
+        rows = [r for r in chunk if r.get("images")]
+        if not rows:
+            return
+        pids = [ids[r["sku"]] for r in rows]
+        main = dict(Product.objects.filter(id__in=pids).values_list("id", "image_source"))
+        gallery = set(ProductImage.objects.filter(product_id__in=pids).exclude(image_source="")
+                      .values_list("product_id", "image_source"))
+        payloads, keys = [], []
+        root = os.path.realpath(self.images_dir) if self.images_dir else ""
+        for r in rows:
+            pid = ids[r["sku"]]
+            for position, ref in enumerate(r["images"]):
+                try:
+                    src = resolve_image_source(ref, root)
+                except ValueError as e:
+                    self.stats["images_rejected"] += 1
+                    log.warning("catalog import: sku %s: %s", r["sku"], e)
+                    continue
+                if (position == 0 and main.get(pid) == src) or (position and (pid, src) in gallery):
+                    continue
+                payloads.append({"product_id": pid, "source": src, "position": position, "root": root})
+                keys.append(f"img:{pid}:{hashlib.sha1(src.encode()).hexdigest()[:16]}")
+        if payloads:
+            enqueue_many(FETCH_IMAGE_TASK, payloads, dedupe_keys=keys)
+            self.stats["images_queued"] += len(payloads)
+
+
+# ---------- задача: скачать картинку ----------
+
+def resolve_image_source(ref: str, root: str = "") -> str:
+    """
+    Откуда брать картинку из фида: http(s)-URL как есть, локальный файл — только относительный
+    путь внутри root (--images-dir, уже realpath). Абсолютные пути, ../ и симлинки наружу,
+    file:// и прочие схемы — ValueError: иначе фид публикует в media любой читаемый файл сервера.
+    """
+    scheme = urlparse(ref).scheme
+    if scheme in ("http", "https"):
+        return ref
+    if scheme and len(scheme) > 1:  # "C:" — не схема, но абсолютный путь, его отсечёт isabs ниже
+        raise ValueError(f"Схема {scheme}:// не поддерживается: {ref}")
+    if not root:
+        raise ValueError(f"Локальный путь без --images-dir: {ref}")
+    if os.path.isabs(ref) or ref.startswith(("/", "\\")):
+        raise ValueError(f"Абсолютный путь не принимается: {ref}")
+    path = os.path.realpath(os.path.join(root, ref))
+    if os.path.commonpath([path, root]) != root:
+        raise ValueError(f"Путь вне --images-dir: {ref}")
+    return path
+
+
+def _read_source(source: str, root: str = "") -> bytes:
+    limit = getattr(settings, "CATALOG_IMPORT_IMAGE_MAX_BYTES", 20 * 1024 * 1024)
+    if urlparse(source).scheme in ("http", "https"):
+        req = urllib.request.Request(source, headers={"User-Agent": "whitemebel-import/1.0"})
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            data = resp.read(limit + 1)
+    else:
+        # задача могла пролежать в очереди — проверяем путь ещё раз (симлинк могли подменить)
+        if not root or os.path.commonpath([os.path.realpath(source), root]) != root:
+            raise ValueError(f"Локальный файл вне --images-dir: {source}")
+        with open(os.path.realpath(source), "rb") as f:
+            data = f.read(limit + 1)
+    if len(data) > limit:
+        raise ValueError(f"Картинка больше {limit} байт: {source}")
+    return data
+
+
+def _check_image(data: bytes) -> None:
+    """Байты — картинка, которую PIL умеет открыть; иначе ValueError (в storage не пишем)."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise ValueError(f"не картинка: {e}") from e
+
+
+def fetch_catalog_image(product_id: int, source: str, position: int, root: str = "") -> str:
+    """
+    Скачать картинку товара и отдать её обычному пайплайну (save() -> images.process).
+    position 0 — главная картинка, остальные — галерея. Возвращает ready | skipped | failed.
+    failed — источник не разрешён или это не картинка: повтор не поможет, в media ничего не пишем.
+    Сетевые ошибки летят наружу — очередь повторит.
+    """
+    image_fields = ("image", "image_source", "image_status", "image_renditions",
+                    "image_width", "image_height", "image_placeholder")
+    product = Product.objects.filter(pk=product_id).only("id", "title", *image_fields).first()
+    if product is None:
+        return "skipped"
+    if position == 0 and product.image_source == source:
+        return "skipped"
+    if position and ProductImage.objects.filter(product_id=product_id, image_source=source).exists():
+        return "skipped"
+
+    try:
+        data = _read_source(source, root)
+        _check_image(data)
+    except ValueError as e:
+        log.warning("catalog.fetch_image: product #%s %s: %s", product_id, source, e)
+        return "failed"
+    name = posixpath.basename(urlparse(source).path) or "image.jpg"
+    if position == 0:
+        product.image = ContentFile(data, name=name)
+        product.image_source = source
+        product.save()  # загружен через only() — сохранятся только поля картинки
+    else:
+        ProductImage(product=product, image=ContentFile(data, name=name),
+                     image_source=source, alt_text=product.title).save()
+    return "ready"
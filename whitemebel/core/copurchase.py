@@ -0,0 +1,113 @@
+# core/copurchase.py
+"""
+«С этим товаром покупают» по истории заказов.
+
+    stats = compute_copurchases(days=365, top=8)
+
+OrderItem читается потоком (product_id по заказам), пары товаров из одного заказа
+копятся как int64-ключи a<<32|b и раз в CHUNK_PAIRS сворачиваются np.unique в разреженную
+матрицу совместных покупок (ключ -> число заказов). На выходе для каждого товара — top-N
+соседей по косинусу count(a,b) / sqrt(count(a)·count(b)): так популярные товары не
+попадают к каждому подряд. Таблица CoPurchase пересобирается целиком в одной транзакции.
+"""
+import logging
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import CoPurchase, OrderItem, Product
+
+log = logging.getLogger(__name__)
+
+CHUNK_PAIRS = 2_000_000  # пар в буфере до очередного свёртывания (~16 МБ ключей)
+MAX_BASKET = 50          # заказы крупнее — опт/переезд офиса, пар от них больше шума, чем сигнала
+SKIP_STATUSES = ("canceled",)
+
+
+def _basket_pairs(basket: list[int]) -> np.ndarray:
+    ids = np.array(sorted(set(basket)), dtype=np.int64)
+    a, b = np.triu_indices(len(ids), k=1)
+    # обе стороны: a покупают с b и b с a
+    return np.concatenate([(ids[a] << 32) | ids[b], (ids[b] << 32) | ids[a]])
+
+
+def _fold(keys: np.ndarray, counts: np.ndarray, buffer: list[np.ndarray]):
+    """Добавить накопленные пары к разреженной матрице (keys отсортированы, counts — число заказов)."""
+    fresh = np.concatenate(buffer)
+    all_keys = np.concatenate([keys, fresh])
+    all_counts = np.concatenate([counts, np.ones(len(fresh), dtype=np.int64)])
+    keys, inverse = np.unique(all_keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=all_counts, minlength=len(keys)).astype(np.int64)
+
+
+def _baskets(since, max_basket: int):
+    items = OrderItem.objects.filter(product__isnull=False).exclude(order__status__in=SKIP_STATUSES)
+    if since is not None:
+        items = items.filter(order__created_at__gte=since)
+    basket, current = [], None
+    for order_id, product_id in items.order_by("order_id").values_list("order_id", "product_id").iterator(chunk_size=10000):
+        if order_id != current:
+            if 1 < len(set(basket)) <= max_basket:
+                yield basket
+            basket, current = [], order_id
+        basket.append(product_id)
+    if 1 < len(set(basket)) <= max_basket:
+        yield basket
+
+
+def compute_copurchases(*, days: int | None = 365, top: int = 8, min_orders: int = 2,
+                        max_basket: int = MAX_BASKET, dry_run: bool = False) -> Counter:
+    since = timezone.now() - timedelta(days=days) if days else None
+    stats = Counter()
+    keys = np.empty(0, dtype=np.int64)
+    counts = np.empty(0, dtype=np.int64)
+    item_orders = Counter()  # товар -> в скольких (учтённых) заказах он был
+    buffer, buffered = [], 0
+    for basket in _baskets(since, max_basket):
+        stats["orders"] += 1
+        item_orders.update(set(basket))
+        pairs = _basket_pairs(basket)
+        buffer.append(pairs)
+        buffered += len(pairs)
+        if buffered >= CHUNK_PAIRS:
+            keys, counts = _fold(keys, counts, buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        keys, counts = _fold(keys, counts, buffer)
+
+    keep = counts >= min_orders
+    keys, counts = keys[keep], counts[keep]
+    rows = []
+    if len(keys):
+        a, b = keys >> 32, keys & 0xFFFFFFFF
+        support = np.vectorize(item_orders.__getitem__, otypes=[np.float64])
+        score = counts / np.sqrt(support(a) * support(b))
+        # по товару, внутри — по убыванию оценки, при равенстве — по числу заказов и id
+        order = np.lexsort((b, -counts, -score, a))
+        a, b, counts = a[order], b[order], counts[order]
+        starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]])
+        rank = np.arange(len(a)) - np.repeat(starts, np.diff(np.r_[starts, len(a)]))
+        top_mask = rank < top
+        rows = [
+            CoPurchase(product_id=int(p), other_id=int(o), rank=int(r) + 1, orders=int(c))
+            for p, o, r, c in zip(a[top_mask], b[top_mask], rank[top_mask], counts[top_mask])
+        ]
+    stats["pairs"] = int(len(keys))
+    stats["products"] = len({r.product_id for r in rows})
+    stats["rows"] = len(rows)
+
+    if not dry_run:
+        with transaction.atomic():
+            # товар могли удалить, пока считали
+            alive = set(Product.objects.filter(
+                pk__in={r.product_id for r in rows} | {r.other_id for r in rows},
+            ).values_list("pk", flat=True))
+            CoPurchase.objects.all().delete()
+            CoPurchase.objects.bulk_create(
+                [r for r in rows if r.product_id in alive and r.other_id in alive], batch_size=5000,
+            )
+    log.info("copurchase: %s", dict(stats))
+    return stats
@@ -1,15 +1,19 @@
 # core/emails.py
+from datetime import timedelta
 from decimal import Decimal
-import threading
+from functools import lru_cache
 import logging
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives, get_connection
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.db import connection
+from django.core.mail import EmailMultiAlternatives
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import get_template
+from django.utils import timezone
 
-from core.models import Order  # чтобы рефетчить заказ в воркере
+from core.jobs import enqueue
+from core.models import Order, OrderItem, OrderService
+from core.utils.mailer import mailer
 
 
 log = logging.getLogger(__name__)
@@ -19,98 +23,181 @@ def _money(x) -> Decimal:
     return Decimal(x).quantize(Decimal("0.01"))
 
 
-def send_order_notifications(order: Order) -> None:
-    """
-    Шлём админам и покупателю. HTML + текст.
-    ВАЖНО: это синхронная функция — вызывай её только из фонового воркера
-    или из transaction.on_commit (но лучше фоном).
-    """
-    items = list(order.items.select_related("product").all())
-    services = list(order.orderservice_set.select_related("service").all())
+# ---------- Рендеринг ----------
+
+@lru_cache(maxsize=None)
+def _template(name: str):
+    """Скомпилированный шаблон на процесс — без повторного поиска/парсинга (и в DEBUG тоже)."""
+    return get_template(name)
+
+
+def render_email(name: str, ctx: dict) -> tuple[str, str]:
+    """(text, html) для email/<name>.txt + email/<name>.html. Текст — свой шаблон, не strip_tags."""
+    return _template(f"email/{name}.txt").render(ctx), _template(f"email/{name}.html").render(ctx)
+
+
+def _with_lines(qs):
+    return qs.prefetch_related(
+        Prefetch("items", queryset=OrderItem.objects.select_related("product")),
+        Prefetch("orderservice_set", queryset=OrderService.objects.select_related("service")),
+    )
+
+
+def load_order_for_email(order_id: int) -> Order | None:
+    """Заказ + позиции с товарами + услуги: по запросу на каждую связь, без N+1."""
+    return _with_lines(Order.objects.filter(pk=order_id)).first()
+
+
+def order_email_context(order: Order) -> dict:
+    # .all() по префетчу (load_order_for_email) не ходит в БД
+    items = list(order.items.all())
+    services = list(order.orderservice_set.all())
 
-    ctx = {
+    subtotal = getattr(order, "_subtotal", None)
+    services_total = getattr(order, "_services_total", None)
+    delivery_base = getattr(order, "_delivery_base", None)
+    delivery_discount = getattr(order, "_delivery_discount", None)
+    if subtotal is None:
+        # в воркере заказ рефетчится — суммы восстанавливаем из позиций
+        subtotal = _money(sum((it.final_price for it in items), Decimal("0")))
+        services_total = _money(sum((s.price_at_moment for s in services), Decimal("0")))
+        if order.delivery_type == "delivery":
+            delivery_base = max(Decimal("0.00"), _money(order.total_price) - subtotal - services_total)
+
+    return {
         "order": order,
         "items": items,
         "services": services,
-        "subtotal": getattr(order, "_subtotal", None),
-        "services_total": getattr(order, "_services_total", None),
-        "delivery_base": getattr(order, "_delivery_base", None),
-        "delivery_discount": getattr(order, "_delivery_discount", None),
+        "subtotal": subtotal,
+        "services_total": services_total,
+        "delivery_base": delivery_base,
+        "delivery_discount": delivery_discount,
         "delivery_cost": getattr(order, "_delivery_cost", None),
         "total": _money(order.total_price),
     }
 
-    # === Админам ===
+
+def _message(subject: str, name: str, ctx: dict, to: list[str]) -> EmailMultiAlternatives:
+    text, html = render_email(name, ctx)
+    msg = EmailMultiAlternatives(
+        subject=subject,
+        body=text,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=to,
+    )
+    msg.attach_alternative(html, "text/html")
+    return msg
+
+
+def send_order_notifications(order: Order) -> None:
+    """
+    Шлём админам и покупателю. HTML + текст.
+    ВАЖНО: это синхронная функция — вызывается из фоновой задачи (core/tasks.py).
+    Если какое-то письмо не ушло — бросаем исключение, очередь повторит задачу.
+
+    Админам — первым, и сразу отмечаем admin_notified_at: если потом не уйдёт письмо
+    покупателю (адрес битый, сессия оборвалась), ретрай задачи админам второй раз не пишет.
+    """
+    digest = admin_digest_enabled()
+    ctx = order_email_context(order)
+
     admin_to = getattr(settings, "ORDER_NOTIFY_EMAILS", [])
-    if admin_to:
-        subject_admin = f"Новый заказ #{order.id} — {order.full_name}"
-        html_admin = render_to_string("email/order_admin.html", ctx)
-        text_admin = strip_tags(html_admin)
-        msg = EmailMultiAlternatives(
-            subject=subject_admin,
-            body=text_admin,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=admin_to,
+    if not digest and admin_to and order.admin_notified_at is None:
+        _send(order, [_message(f"Новый заказ #{order.id} — {order.full_name}", "order_admin", ctx, admin_to)])
+        order.admin_notified_at = timezone.now()
+        Order.objects.filter(pk=order.pk, admin_notified_at__isnull=True).update(
+            admin_notified_at=order.admin_notified_at,
         )
-        msg.attach_alternative(html_admin, "text/html")
-        try:
-            msg.send(fail_silently=False)
-        except Exception:
-            log.exception("Order #%s: admin email send failed", order.id)
 
-    # === Покупателю ===
     if order.email:
-        subject_user = f"Ваш заказ #{order.id} принят"
-        html_user = render_to_string("email/order_user.html", ctx)
-        text_user = strip_tags(html_user)
-        msg2 = EmailMultiAlternatives(
-            subject=subject_user,
-            body=text_user,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            to=[order.email],
-        )
-        msg2.attach_alternative(html_user, "text/html")
-        try:
-            msg2.send(fail_silently=False)
-        except Exception:
-            log.exception("Order #%s: customer email send failed", order.id)
+        _send(order, [_message(f"Ваш заказ #{order.id} принят", "order_user", ctx, [order.email])])
 
 
-# ---------- Асинхронная обёртка ----------
+def _send(order: Order, messages) -> None:
+    # по переиспользуемому соединению воркера
+    try:
+        mailer.send_messages(messages)
+    except Exception:
+        log.exception("Order #%s: email send failed", order.id)
+        raise
+
+
+# ---------- Дайджест для админов ----------
+
+ADMIN_DIGEST_TASK = "orders.admin_digest"
+
+
+def admin_digest_enabled() -> bool:
+    return getattr(settings, "ORDER_ADMIN_DIGEST_MINUTES", 0) > 0
+
+
+def _digest_max_orders() -> int:
+    return max(1, getattr(settings, "ORDER_ADMIN_DIGEST_MAX_ORDERS", 50))
+
 
-def _email_worker(order_id: int) -> None:
+def schedule_admin_digest() -> None:
     """
-    Фоновый воркер: рефетчит заказ и безопасно шлёт письма,
-    чтобы SMTP/шаблоны не блокировали веб-процесс.
+    В очереди всегда максимум один дайджест (dedupe_key): первый заказ открывает окно
+    на ORDER_ADMIN_DIGEST_MINUTES, набралось ORDER_ADMIN_DIGEST_MAX_ORDERS — шлём сразу.
     """
-    try:
-        order = Order.objects.get(pk=order_id)
-    except Order.DoesNotExist:
-        log.warning("email worker: order %s not found", order_id)
-        return
+    now = timezone.now()
+    pending = Order.objects.filter(admin_notified_at__isnull=True).count()
+    if pending >= _digest_max_orders():
+        run_at = now
+    else:
+        run_at = now + timedelta(minutes=settings.ORDER_ADMIN_DIGEST_MINUTES)
+    enqueue(ADMIN_DIGEST_TASK, run_at=run_at, dedupe_key=ADMIN_DIGEST_TASK)
 
-    try:
-        # Опционально: прогреть SMTP и использовать EMAIL_TIMEOUT из settings
-        get_connection()
-        send_order_notifications(order)
-    except Exception as e:
-        log.exception("email worker failed for order %s: %s", order_id, e)
-    finally:
-        # Закрыть подключение к БД в треде
+
+def send_admin_digest() -> int:
+    """
+    Одно письмо админам по накопившимся заказам (не больше MAX_ORDERS за раз).
+    Заказы помечаются до отправки короткой транзакцией (как claim() в очереди задач),
+    чтобы не держать блокировки строк на время SMTP; не ушло письмо — метки снимаем
+    и падаем, очередь повторит. Возвращает число заказов в письме.
+    """
+    limit = _digest_max_orders()
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(admin_notified_at__isnull=True)
+            .order_by("id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return 0
+        Order.objects.filter(id__in=ids).update(admin_notified_at=now)
+
+    admin_to = getattr(settings, "ORDER_NOTIFY_EMAILS", [])
+    if admin_to:
+        orders = list(_with_lines(Order.objects.filter(id__in=ids)).order_by("id"))
+        ctx = {
+            "orders": [order_email_context(o) for o in orders],
+            "count": len(orders),
+            "total": _money(sum((o.total_price for o in orders), Decimal("0"))),
+            "since": orders[0].created_at,
+            "until": orders[-1].created_at,
+        }
+        subject = f"Новые заказы: {len(orders)} шт. (#{orders[0].id}–#{orders[-1].id})"
         try:
-            connection.close()
+            mailer.send_messages([_message(subject, "order_admin_digest", ctx, admin_to)])
         except Exception:
-            pass
+            log.exception("Admin digest for %s orders failed", len(ids))
+            Order.objects.filter(id__in=ids, admin_notified_at=now).update(admin_notified_at=None)
+            raise
+
+    if len(ids) >= limit and Order.objects.filter(admin_notified_at__isnull=True).exists():
+        # хвост не влез в письмо — следующий дайджест сразу
+        enqueue(ADMIN_DIGEST_TASK, dedupe_key=ADMIN_DIGEST_TASK)
+    return len(ids)
 
 
+# ---------- Асинхронная обёртка ----------
+
 def send_order_notifications_async(order_id: int) -> None:
     """
-    Запустить отправку писем в отдельном daemon-треде. Возврат мгновенный.
+    Поставить письма по заказу в очередь фоновых задач. Возврат мгновенный.
+    Вызывать внутри транзакции заказа: задача закоммитится вместе с ним.
     """
-    t = threading.Thread(
-        target=_email_worker,
-        args=(order_id,),
-        daemon=True,
-        name=f"order-mail-{order_id}",
-    )
-    t.start()
+    enqueue("orders.send_notifications", order_id=order_id)
@@ -0,0 +1,143 @@
+# core/images.py
+"""
+Фоновая обработка загруженных картинок (Product, ProductImage, MainSlider).
+
+save() кладёт загрузку в storage как есть (image_status=pending) и ставит задачу
+images.process. Воркер перекодирует оригинал в WEBP, пишет ресайзы и подменяет
+файл в строке одним UPDATE — только если в поле всё ещё та же загрузка
+(пока он работал, в админке могли загрузить новую).
+
+Файлы из media синхронно не удаляются: ContentHashStorage отдаёт один файл всем
+одинаковым загрузкам, и «проверить ссылки → удалить» гоняется с загрузкой, чья строка
+ещё не закоммичена. Неиспользуемые файлы собирает collect_garbage (manage.py gc_media) —
+только старше grace-периода, а save() хранилища обновляет mtime переиспользованного файла.
+"""
+import logging
+import os
+import time
+
+from django.apps import apps
+from PIL import UnidentifiedImageError
+
+from core.jobs import enqueue
+from core.utils.image import compress_image
+from core.utils.renditions import RENDITIONS_DIR, build_renditions
+
+log = logging.getLogger(__name__)
+
+PROCESS_TASK = "images.process"
+IMAGE_MODELS = ("core.Product", "core.ProductImage", "core.MainSlider")
+
+
+def schedule_image_processing(obj) -> None:
+    enqueue(PROCESS_TASK, model=obj._meta.label, pk=obj.pk, file=obj.image.name)
+
+
+def process_stored_image(model: str, pk: int, name: str) -> str:
+    """
+    Перекодировать загрузку name у model#pk. Возвращает итог: ready | skipped | failed.
+    Битый файл — failed без ретраев; прочие ошибки (storage, БД) летят наружу — очередь повторит.
+    """
+    Model = apps.get_model(model)
+    obj = Model.objects.filter(pk=pk).only("id", "image").first()
+    if obj is None or obj.image.name != name:
+        return "skipped"  # удалили или уже загрузили другую картинку
+
+    field = Model._meta.get_field("image")
+    upload_to = field.upload_to if isinstance(field.upload_to, str) else ""
+    try:
+        with obj.image.open("rb") as f:
+            content = compress_image(f, format="WEBP", quality=80)
+        renditions, (width, height), placeholder = build_renditions(content, upload_dir=upload_to, storage=field.storage)
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        log.warning("images.process: %s #%s %s: %s", model, pk, name, e)
+        Model.objects.filter(pk=pk, image=name).update(image_status=Model.ImageStatus.FAILED)
+        return "failed"
+
+    storage = field.storage
+    new_name = storage.save(field.generate_filename(obj, content.name), content)
+    updated = Model.objects.filter(pk=pk, image=name).update(
+        image=new_name,
+        image_renditions=renditions,
+        image_width=width,
+        image_height=height,
+        image_placeholder=placeholder,
+        image_status=Model.ImageStatus.READY,
+    )
+    # ни результат (если строку успели поменять), ни исходник JPEG/PNG сразу не удаляем:
+    # storage дедуплицирует, файл может быть нужен параллельной загрузке — их соберёт gc_media
+    if not updated:
+        return "skipped"
+    return "ready"
+
+
+# ---------- сборка мусора ----------
+
+def referenced_names() -> set[str]:
+    """Все файлы, на которые ссылаются строки: картинки и их ресайзы."""
+    names = set()
+    for label in IMAGE_MODELS:
+        for image, renditions in apps.get_model(label).objects.values_list("image", "image_renditions").iterator():
+            if image:
+                names.add(image)
+            for by_width in (renditions or {}).values():
+                names.update(by_width.values())
+    return names
+
+
+def _media_dirs() -> list[str]:
+    dirs = {RENDITIONS_DIR}
+    for label in IMAGE_MODELS:
+        upload_to = apps.get_model(label)._meta.get_field("image").upload_to
+        if isinstance(upload_to, str) and upload_to.strip("/"):
+            dirs.add(upload_to.strip("/"))
+    return sorted(dirs)
+
+
+def _reclaim(path: str, cutoff: float) -> bool:
+    """
+    Удалить файл, если его не «трогали» после cutoff. Сначала атомарный rename в сторону:
+    загрузка, которая переиспользует файл в этот момент, получит FileNotFoundError на utime и
+    запишет его заново, а успевшая до rename — видна по свежему mtime, и файл возвращается.
+    """
+    trash = f"{path}.gc-{os.getpid()}"
+    try:
+        os.rename(path, trash)
+    except FileNotFoundError:
+        return False
+    if os.stat(trash).st_mtime >= cutoff:
+        try:
+            os.link(trash, path)
+        except FileExistsError:  # уже записали заново — тот же контент
+            pass
+        os.unlink(trash)
+        return False
+    os.unlink(trash)
+    return True
+
+
+def collect_garbage(storage, *, grace_hours: float = 24, dry_run: bool = False):
+    """
+    Удалить из каталогов картинок файлы, на которые не ссылается ни одна строка и которые
+    не менялись/не переиспользовались последние grace_hours. Генератор (name, size) удалённого.
+    """
+    cutoff = time.time() - grace_hours * 3600
+    referenced = referenced_names()
+    for media_dir in _media_dirs():
+        root = storage.path(media_dir)
+        for dirpath, _dirs, files in os.walk(root):
+            for filename in files:
+                if filename.startswith(".") or ".gc-" in filename:
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, storage.location).replace(os.sep, "/")
+                if name in referenced:
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if st.st_mtime >= cutoff:
+                    continue
+                if dry_run or _reclaim(path, cutoff):
+                    yield name, st.st_size
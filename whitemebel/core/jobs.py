@@ -0,0 +1,182 @@
+# core/jobs.py
+"""
+Простая очередь фоновых задач поверх Postgres (модель Job).
+
+    @task("orders.send_notifications", max_attempts=6)
+    def send_notifications(order_id): ...
+
+    enqueue("orders.send_notifications", order_id=order.id)
+
+enqueue() пишет строку в текущей транзакции — задача появится у воркера только
+после коммита и не потеряется, если процесс умрёт. Выполняет их
+``manage.py run_jobs``: ограниченный пул потоков, SKIP LOCKED, экспоненциальный
+ретрай и dead letter (status=dead) после max_attempts.
+"""
+import logging
+import random
+import traceback
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import Job
+
+log = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class TaskSpec:
+    name: str
+    func: Callable
+    queue: str
+    max_attempts: int
+
+
+_registry: dict[str, TaskSpec] = {}
+
+
+def task(name: str, *, queue: str = "default", max_attempts: int = 5):
+    """Регистрирует функцию как задачу. Параметры задачи — JSON-совместимые kwargs."""
+    def decorator(func):
+        _registry[name] = TaskSpec(name=name, func=func, queue=queue, max_attempts=max_attempts)
+        return func
+    return decorator
+
+
+def get_task(name: str) -> TaskSpec:
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"Неизвестная задача: {name}")
+
+
+def enqueue(name: str, *, run_at=None, dedupe_key: str = "", **payload) -> Job:
+    """
+    Поставить задачу. С dedupe_key в очереди держится максимум одна такая задача:
+    повторный enqueue её не дублирует, а только подтягивает run_at, если новый раньше.
+    """
+    spec = get_task(name)
+    job = Job(
+        queue=spec.queue,
+        task=name,
+        payload=payload,
+        max_attempts=spec.max_attempts,
+        run_at=run_at or timezone.now(),
+        dedupe_key=dedupe_key,
+    )
+    if not dedupe_key:
+        job.save()
+        return job
+    # ON CONFLICT DO NOTHING по частичному уникальному индексу — без исключений и гонок
+    Job.objects.bulk_create([job], ignore_conflicts=True)
+    queued = Job.objects.filter(status=Job.Status.QUEUED, dedupe_key=dedupe_key)
+    queued.filter(run_at__gt=job.run_at).update(run_at=job.run_at, updated_at=timezone.now())
+    return queued.first() or job
+
+
+def enqueue_many(name: str, payloads, *, dedupe_keys=None) -> int:
+    """
+    Поставить пачку задач одним INSERT (импорт каталога — тысячи задач за раз).
+    dedupe_keys — параллельный payloads список; уже стоящие в очереди с тем же ключом пропускаются.
+    Возвращает, сколько строк передано в INSERT (с конфликтами реально вставится меньше).
+    """
+    spec = get_task(name)
+    now = timezone.now()
+    keys = dedupe_keys or [""] * len(payloads)
+    jobs = [
+        Job(queue=spec.queue, task=name, payload=payload, max_attempts=spec.max_attempts,
+            run_at=now, dedupe_key=key)
+        for payload, key in zip(payloads, keys)
+    ]
+    Job.objects.bulk_create(jobs, batch_size=1000, ignore_conflicts=any(keys))
+    return len(jobs)
+
+
+# ---------- воркер ----------
+
+def backoff(attempt: int) -> timedelta:
+    """30с, 1м, 2м, 4м … но не больше JOBS_RETRY_MAX_DELAY, плюс немного джиттера."""
+    base = getattr(settings, "JOBS_RETRY_BASE_DELAY", 30)
+    cap = getattr(settings, "JOBS_RETRY_MAX_DELAY", 60 * 60)
+    delay = min(cap, base * (2 ** max(0, attempt - 1)))
+    return timedelta(seconds=delay * random.uniform(0.9, 1.1))
+
+
+def claim(queues: list[str], limit: int, worker_id: str) -> list[Job]:
+    """Атомарно забрать до limit готовых задач (параллельные воркеры не пересекаются)."""
+    if limit <= 0:
+        return []
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.Status.QUEUED, queue__in=queues, run_at__lte=now)
+            .order_by("run_at", "id")
+            .values_list("id", flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids).update(
+            status=Job.Status.RUNNING, locked_at=now, locked_by=worker_id,
+            attempts=F("attempts") + 1,
+        )
+    return list(Job.objects.filter(id__in=ids).order_by("run_at", "id"))
+
+
+def run_job(job: Job) -> None:
+    """Выполнить одну задачу и записать результат. Исключения наружу не выпускает."""
+    close_old_connections()
+    try:
+        spec = get_task(job.task)
+        spec.func(**job.payload)
+    except Exception as e:
+        err = "".join(traceback.format_exception(e))[-4000:]
+        if job.attempts >= job.max_attempts:
+            log.error("job %s #%s dead after %s attempts: %s", job.task, job.id, job.attempts, e)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.Status.DEAD, locked_at=None, last_error=err, updated_at=timezone.now(),
+            )
+        else:
+            retry_at = timezone.now() + backoff(job.attempts)
+            log.warning("job %s #%s failed (attempt %s/%s), retry at %s: %s",
+                        job.task, job.id, job.attempts, job.max_attempts, retry_at, e)
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.Status.QUEUED, locked_at=None, locked_by="",
+                run_at=retry_at, last_error=err, updated_at=timezone.now(),
+            )
+    else:
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.Status.DONE, locked_at=None, last_error="", updated_at=timezone.now(),
+        )
+    finally:
+        close_old_connections()
+
+
+def requeue_stale(queues: list[str]) -> int:
+    """
+    Задачи, зависшие в running дольше JOBS_VISIBILITY_TIMEOUT (воркер убили посреди работы),
+    возвращаем в очередь; если попытки кончились — в dead letter.
+    """
+    timeout = getattr(settings, "JOBS_VISIBILITY_TIMEOUT", 10 * 60)
+    stale = Job.objects.filter(
+        status=Job.Status.RUNNING, queue__in=queues,
+        locked_at__lt=timezone.now() - timedelta(seconds=timeout),
+    )
+    dead = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.Status.DEAD, locked_at=None, last_error="visibility timeout",
+    )
+    back = stale.update(status=Job.Status.QUEUED, locked_at=None, locked_by="")
+    return dead + back
+
+
+def purge_done(days: int | None = None) -> int:
+    days = getattr(settings, "JOBS_KEEP_DONE_DAYS", 7) if days is None else days
+    deleted, _ = Job.objects.filter(
+        status=Job.Status.DONE, updated_at__lt=timezone.now() - timedelta(days=days),
+    ).delete()
+    return deleted
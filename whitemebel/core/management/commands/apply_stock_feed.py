@@ -0,0 +1,49 @@
+# core/management/commands/apply_stock_feed.py
+"""
+Остатки и цены из выгрузки учётки — то же, что POST /api/catalog/stock-feed/, но из файла.
+
+    python manage.py apply_stock_feed stock.csv
+    python manage.py apply_stock_feed stock.jsonl --batch 2000
+
+CSV: sku;stock;price;discount_price (лишние колонки игнорируются, пустая ячейка — поле не трогаем).
+JSON — список / {"items": […]}, JSON Lines — по объекту на строку.
+"""
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalog_import import read_feed
+from core.stock_feed import FIELDS, apply_stock_deltas
+
+
+class Command(BaseCommand):
+    help = "Применить дельты остатков/цен из файла (CSV/JSON) пачками по sku."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл выгрузки")
+        parser.add_argument("--format", choices=["csv", "json"], help="По умолчанию — по расширению")
+        parser.add_argument("--batch", type=int, default=None, help="SKU на один UPDATE (по умолчанию STOCK_FEED_BATCH)")
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        try:
+            # CSV: пустая ячейка не попадает в строку — значит, и discount_price не снимается
+            items = [{k: v for k, v in row.items() if k in ("sku", *FIELDS)}
+                     for row in read_feed(opts["path"], opts["format"])]
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Не удалось прочитать файл: {e}")
+
+        results = apply_stock_deltas(items, batch_size=opts["batch"])
+
+        counts = Counter(r["status"] for r in results)
+        problems = [r for r in results if r["status"] in ("invalid", "not_found")]
+        for r in problems[:20]:
+            self.stderr.write(f"{r['sku']}: {r.get('error') or r['status']}")
+        if len(problems) > 20:
+            self.stderr.write(f"… и ещё {len(problems) - 20}")
+        dt = time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {dt:.1f} с ({len(items) / max(dt, 1e-9):.0f} строк/с): "
+            + ", ".join(f"{k}={v}" for k, v in sorted(counts.items()))
+        ))
@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import hmac
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Job, Order, Payment, PaymentNotification
+from core.payments import PROCESS_TASK, process_notification
+from core.views import CloudPaymentsWebhookView
+
+
+class Command(BaseCommand):
+    help = (
+        "Реплей вебхуков CloudPayments: одно настоящее pay-уведомление и тысячи его дублей. "
+        "Меряет время ответа и число SQL-запросов на дубль, потом обрабатывает входящие "
+        "так же, как воркер. Создаёт временный заказ и удаляет его."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=5000, help="Сколько дублей отправить")
+        parser.add_argument("--threads", type=int, default=1, help="Параллельных отправителей")
+
+    def handle(self, *args, **opts):
+        secret = settings.CLOUDPAYMENTS_API_SECRET
+        if not secret:
+            raise CommandError("CLOUDPAYMENTS_API_SECRET не задан — подписывать нечем")
+        n, threads = max(1, opts["events"]), max(1, opts["threads"])
+
+        order = Order.objects.create(
+            full_name="bench_cp_webhook", phone="+70000000000", city="-", address="-",
+            payment_method="online", delivery_type="pickup", total_price=Decimal("1990.00"),
+        )
+        body = json.dumps({
+            "NotificationType": "pay", "TransactionId": f"bench-{order.id}",
+            "InvoiceId": str(order.id), "Amount": "1990.00", "Currency": "RUB",
+            "AccountId": "bench@example.com", "CardFirstSix": "424242", "CardLastFour": "4242",
+            "Data": {"order_id": order.id},
+        }).encode()
+        sign = base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+        rf = RequestFactory()
+        view = CloudPaymentsWebhookView.as_view()
+
+        def call():
+            req = rf.post("/api/payments/cloudpayments/webhook/", data=body,
+                          content_type="application/json", HTTP_CONTENT_HMAC=sign)
+            t0 = time.perf_counter()
+            resp = view(req)
+            dt = time.perf_counter() - t0
+            if resp.data.get("code") != 0:
+                raise CommandError(f"Неожиданный ответ: {resp.data}")
+            return dt
+
+        try:
+            with CaptureQueriesContext(connection) as first_q:
+                first = call()
+            with CaptureQueriesContext(connection) as dup_q:
+                call()
+            self.stdout.write(
+                f"первое уведомление: {first * 1000:.2f} мс, {len(first_q.captured_queries)} SQL; "
+                f"дубль: {len(dup_q.captured_queries)} SQL"
+            )
+
+            def worker(k):
+                try:
+                    return [call() for _ in range(k)]
+                finally:
+                    close_old_connections()
+
+            per = [n // threads + (1 if i < n % threads else 0) for i in range(threads)]
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                timings = [t for chunk in pool.map(worker, per) for t in chunk]
+            wall = time.perf_counter() - t0
+
+            timings.sort()
+            p = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))] * 1000  # noqa: E731
+            self.stdout.write(
+                f"{n} дублей в {threads} потоков: {wall:.2f} с, {n / wall:.0f} rps; "
+                f"mean {statistics.mean(timings) * 1000:.2f} мс, p50 {p(0.5):.2f}, p95 {p(0.95):.2f}, p99 {p(0.99):.2f}"
+            )
+            notes = list(PaymentNotification.objects.filter(order_id=str(order.id)).values_list("id", flat=True))
+            t0 = time.perf_counter()
+            for note_id in notes:
+                process_notification(note_id)
+            self.stdout.write(f"воркер: входящих {len(notes)}, обработка {(time.perf_counter() - t0) * 1000:.2f} мс")
+
+            payments = Payment.objects.filter(order=order).count()
+            order.refresh_from_db(fields=["status"])
+            self.stdout.write(f"итог: заказ {order.status}, строк Payment: {payments}")
+        finally:
+            note_ids = list(PaymentNotification.objects.filter(order_id=str(order.id)).values_list("id", flat=True))
+            Job.objects.filter(task=PROCESS_TASK, payload__notification_id__in=note_ids).delete()
+            PaymentNotification.objects.filter(id__in=note_ids).delete()
+            order.delete()
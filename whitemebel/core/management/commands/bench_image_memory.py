@@ -0,0 +1,104 @@
+# core/management/commands/bench_image_memory.py
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from io import BytesIO
+
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from core.utils.image import compress_image
+
+
+def _legacy(path):
+    # как было до open_bounded(): полное декодирование + весь результат в BytesIO
+    with open(path, "rb") as f:
+        img = Image.open(f)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        out = BytesIO()
+        img.save(out, format="WEBP", quality=80, optimize=True)
+        return len(out.getvalue())
+
+
+def _bounded(path):
+    with open(path, "rb") as f:
+        content = compress_image(File(f, name=os.path.basename(path)), format="WEBP", quality=80)
+        return content.size
+
+
+VARIANTS = {"legacy": _legacy, "bounded": _bounded}
+
+
+def _measure(variant, path, conn):
+    # отдельный процесс на замер: ru_maxrss — пик за жизнь процесса, в общем процессе он не сбрасывается
+    try:
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        t0 = time.perf_counter()
+        size = VARIANTS[variant](path)
+        dt = time.perf_counter() - t0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        conn.send((peak - before, dt, size, None))
+    except Exception as e:
+        conn.send((0, 0, 0, f"{type(e).__name__}: {e}"))
+
+
+class Command(BaseCommand):
+    help = (
+        "Пиковая память на перекодирование больших фото: старый путь (полное декодирование в BytesIO) "
+        "против compress_image (draft/reduce, лимит пикселей, spool во временный файл). "
+        "Каждый замер — в отдельном процессе."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="*", help="Свои фото; без них генерируется синтетическая «камера»")
+        parser.add_argument("--size", default="6000x4000", help="Размер синтетического JPEG, WxH")
+        parser.add_argument("--png", action="store_true", help="Сгенерировать ещё и PNG того же размера")
+
+    def handle(self, *args, **opts):
+        tmpdir = None
+        files = opts["files"]
+        if not files:
+            tmpdir = tempfile.TemporaryDirectory()
+            files = self._synthetic(tmpdir.name, opts["size"], opts["png"])
+        ctx = multiprocessing.get_context("fork")
+        try:
+            for path in files:
+                self.stdout.write(f"{os.path.basename(path)}: {os.path.getsize(path) / 2**20:.1f} МБ")
+                for variant in VARIANTS:
+                    parent, child = ctx.Pipe(duplex=False)
+                    proc = ctx.Process(target=_measure, args=(variant, path, child))
+                    proc.start()
+                    rss_kb, dt, size, err = parent.recv()
+                    proc.join()
+                    if err:
+                        self.stdout.write(f"  {variant:8} ошибка: {err}")
+                        continue
+                    self.stdout.write(
+                        f"  {variant:8} пик +{rss_kb / 1024:7.1f} МБ RSS, {dt * 1000:7.0f} мс, WEBP {size / 1024:.0f} КБ"
+                    )
+        finally:
+            if tmpdir is not None:
+                tmpdir.cleanup()
+
+    @staticmethod
+    def _synthetic(dirname, size, png):
+        try:
+            w, h = (int(x) for x in size.lower().split("x"))
+        except ValueError:
+            raise CommandError("--size в формате WxH, например 6000x4000")
+        # шум поверх градиента — чтобы JPEG весил как настоящее фото, а не как заливка
+        img = Image.merge("RGB", [
+            Image.linear_gradient("L").resize((w, h)),
+            Image.effect_noise((w, h), 64),
+            Image.radial_gradient("L").resize((w, h)),
+        ])
+        paths = [os.path.join(dirname, f"camera_{w}x{h}.jpg")]
+        img.save(paths[0], quality=92)
+        if png:
+            paths.append(os.path.join(dirname, f"camera_{w}x{h}.png"))
+            img.save(paths[1], compress_level=1)
+        return paths
@@ -0,0 +1,62 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import strip_tags
+
+from core.emails import _money, render_email
+from core.models import Order, OrderItem, Product
+
+
+def _fake_ctx(i: int, items_per_order: int) -> dict:
+    """Контекст письма без БД: несохранённые объекты, как после load_order_for_email."""
+    order = Order(
+        id=i, full_name=f"Покупатель {i}", phone="+79991234567", email=f"user{i}@example.com",
+        city="Москва", address="ул. Пушкина, д. 10", comment="Позвонить за час",
+        payment_method="online", delivery_type="delivery", status="new",
+        total_price=Decimal("0.00"), created_at=timezone.now(),
+    )
+    items = []
+    for j in range(items_per_order):
+        p = Product(id=j, title=f"Шкаф-купе Alpha {j}", sku=f"WM-{100000 + j}", price=Decimal("24990.00"))
+        items.append(OrderItem(order=order, product=p, quantity=1 + j % 3,
+                               price_at_moment=p.price, final_price=p.price * (1 + j % 3)))
+    subtotal = sum((it.final_price for it in items), Decimal("0"))
+    order.total_price = subtotal + Decimal("1500.00")
+    return {
+        "order": order, "items": items, "services": [],
+        "subtotal": _money(subtotal), "services_total": None,
+        "delivery_base": Decimal("1500.00"), "delivery_discount": None, "delivery_cost": Decimal("1500.00"),
+        "total": _money(order.total_price),
+    }
+
+
+class Command(BaseCommand):
+    help = "Микробенчмарк рендеринга писем по заказу: render_to_string+strip_tags против render_email()."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=1000, help="Сколько заказов рендерить")
+        parser.add_argument("--items", type=int, default=3, help="Позиций в заказе")
+
+    def handle(self, *args, **opts):
+        count, n_items = opts["count"], opts["items"]
+        contexts = [_fake_ctx(i, n_items) for i in range(1, count + 1)]
+
+        def legacy(ctx):
+            for name in ("order_admin", "order_user"):
+                html = render_to_string(f"email/{name}.html", ctx)
+                strip_tags(html)
+
+        def current(ctx):
+            for name in ("order_admin", "order_user"):
+                render_email(name, ctx)
+
+        current(contexts[0])  # прогрев кэша шаблонов
+        for title, fn in (("render_to_string + strip_tags", legacy), ("render_email (кэш + .txt)", current)):
+            t0 = time.perf_counter()
+            for ctx in contexts:
+                fn(ctx)
+            dt = time.perf_counter() - t0
+            self.stdout.write(f"{title:32s} {count} заказов: {dt:.3f} с, {dt / count * 1000:.2f} мс/заказ")
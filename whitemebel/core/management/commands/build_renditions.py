@@ -0,0 +1,35 @@
+# core/management/commands/build_renditions.py
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import MainSlider, Product, ProductImage
+from core.utils.renditions import build_renditions
+
+
+class Command(BaseCommand):
+    help = "Дописать ресайзы под srcset (WEBP/AVIF) и плейсхолдер картинкам, у которых их ещё нет"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="Пересобрать и там, где ресайзы уже есть")
+
+    def handle(self, *args, **opts):
+        for model in (Product, ProductImage, MainSlider):
+            qs = model.objects.exclude(image="").exclude(image__isnull=True).only("id", "image")
+            if not opts["force"]:
+                qs = qs.filter(Q(image_renditions={}) | Q(image_placeholder=""))
+            done = failed = 0
+            for obj in qs.iterator(chunk_size=200):
+                try:
+                    with obj.image.open("rb") as f:
+                        renditions, (w, h), placeholder = build_renditions(f)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{model.__name__} #{obj.pk} {obj.image.name}: {e}")
+                    continue
+                # update() мимо save(): сам файл не трогаем
+                model.objects.filter(pk=obj.pk).update(
+                    image_renditions=renditions, image_width=w, image_height=h, image_placeholder=placeholder,
+                )
+                done += 1
+            self.stdout.write(f"{model.__name__}: готово {done}, ошибок {failed}")
+        self.stdout.write(self.style.SUCCESS("Готово"))
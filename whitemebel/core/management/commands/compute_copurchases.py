@@ -0,0 +1,35 @@
+# core/management/commands/compute_copurchases.py
+"""
+Пересобрать «покупают вместе» (core/copurchase.py) — для cron, раз в сутки хватает.
+
+    python manage.py compute_copurchases
+    python manage.py compute_copurchases --days 0 --top 12 --min-orders 3
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.copurchase import MAX_BASKET, compute_copurchases
+
+
+class Command(BaseCommand):
+    help = "Посчитать по заказам, какие товары покупают вместе, и записать top-N на товар."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=365, help="Заказы за последние N дней (0 — все)")
+        parser.add_argument("--top", type=int, default=8, help="Сколько соседей хранить на товар")
+        parser.add_argument("--min-orders", type=int, default=2, help="Пара должна встретиться хотя бы в стольких заказах")
+        parser.add_argument("--max-basket", type=int, default=MAX_BASKET, help="Заказы с большим числом товаров не учитывать")
+        parser.add_argument("--dry-run", action="store_true", help="Посчитать, но не записывать")
+
+    def handle(self, *args, **opts):
+        t0 = time.perf_counter()
+        stats = compute_copurchases(
+            days=opts["days"] or None, top=max(1, opts["top"]), min_orders=max(1, opts["min_orders"]),
+            max_basket=opts["max_basket"], dry_run=opts["dry_run"],
+        )
+        dt = time.perf_counter() - t0
+        verb = "посчитано (dry-run)" if opts["dry_run"] else "записано"
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {dt:.1f} с, {verb}: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.items()))
+        ))
@@ -0,0 +1,61 @@
+# core/management/commands/compute_related.py
+"""
+Пересчитать related_by_color и related_products (core/related.py).
+
+    python manage.py compute_related                 # весь каталог
+    python manage.py compute_related --since 1d      # категории, где что-то менялось за сутки (для cron)
+    python manage.py compute_related --since 2025-09-01T00:00 --limit 12 --dry-run
+"""
+import re
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.related import SIZE_WEIGHT, compute_related
+
+UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_since(value: str):
+    m = re.fullmatch(r"(\d+)([mhd])", value.strip())
+    if m:
+        return timezone.now() - timedelta(**{UNITS[m.group(2)]: int(m.group(1))})
+    dt = parse_datetime(value)
+    if dt is None:
+        raise CommandError(f"--since: ожидалось 30m/6h/1d или ISO-дата, а не «{value}»")
+    return timezone.make_aware(dt) if timezone.is_naive(dt) else dt
+
+
+class Command(BaseCommand):
+    help = "Посчитать связанные товары: другие цвета того же товара и похожие по характеристикам/габаритам."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Только категории с товарами, изменёнными после (30m/6h/1d или ISO-дата)")
+        parser.add_argument("--limit", type=int, default=8, help="Сколько похожих на товар (related_products)")
+        parser.add_argument("--color-limit", type=int, default=8, help="Сколько других цветов (related_by_color)")
+        parser.add_argument("--size-weight", type=float, default=SIZE_WEIGHT,
+                            help="Вес близости габаритов, 0…1 (остальное — характеристики)")
+        parser.add_argument("--dry-run", action="store_true", help="Посчитать, но не записывать")
+
+    def handle(self, *args, **opts):
+        if not 0 <= opts["size_weight"] <= 1:
+            raise CommandError("--size-weight: от 0 до 1")
+        since = parse_since(opts["since"]) if opts["since"] else None
+        t0 = time.perf_counter()
+
+        def progress(done, total, stats):
+            if done % 20 == 0 or done == total:
+                self.stdout.write(f"  … категорий {done}/{total}, товаров {stats['products']}")
+
+        stats = compute_related(
+            since=since, limit=max(0, opts["limit"]), color_limit=max(0, opts["color_limit"]),
+            size_weight=opts["size_weight"], dry_run=opts["dry_run"], progress=progress,
+        )
+        dt = time.perf_counter() - t0
+        verb = "посчитано (dry-run)" if opts["dry_run"] else "записано"
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {dt:.1f} с, {verb}: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.items()))
+        ))
@@ -0,0 +1,41 @@
+# core/management/commands/gc_media.py
+"""
+Удалить из media файлы картинок, на которые не ссылается ни одна строка (core.images.collect_garbage).
+
+    python manage.py gc_media --dry-run
+    python manage.py gc_media --grace-hours 48      # для cron, раз в сутки
+
+Файлы моложе grace-периода не трогаются: их может держать незакоммиченная загрузка
+(storage дедуплицирует и «трогает» переиспользованный файл). Исходники после images.process
+и optimize_media удаляются тоже здесь.
+"""
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core.images import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Собрать неиспользуемые файлы картинок в media (старше grace-периода)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--grace-hours", type=float, default=24, help="Не трогать файлы моложе (часы)")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что удалится")
+
+    def handle(self, *args, **opts):
+        if opts["grace_hours"] < 1:
+            raise CommandError("--grace-hours: не меньше часа (загрузка может ещё не закоммититься)")
+        t0 = time.perf_counter()
+        count = size = 0
+        for name, file_size in collect_garbage(default_storage, grace_hours=opts["grace_hours"],
+                                               dry_run=opts["dry_run"]):
+            count += 1
+            size += file_size
+            if opts["dry_run"] or opts["verbosity"] > 1:
+                self.stdout.write(f"  {name}")
+        verb = "удалится" if opts["dry_run"] else "удалено"
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {time.perf_counter() - t0:.1f} с: {verb} {count} файлов, {size / 2**20:.1f} МБ"
+        ))
@@ -0,0 +1,53 @@
+# core/management/commands/import_catalog.py
+"""
+Импорт фида поставщика: CSV, JSON / JSON Lines или YML (Яндекс.Маркет).
+
+    python manage.py import_catalog supplier.yml
+    python manage.py import_catalog feed.csv --batch 5000 --images-dir /data/photos
+    python manage.py import_catalog feed.jsonl --no-images
+
+CSV: sku;title;description;price;discount_price;stock;is_active;category;color;width;height;depth;tags;images
+и колонки attr:<Характеристика>. Несколько значений — через «|», путь категории — через «/».
+Товары сопоставляются по sku; картинки качает воркер (задачи catalog.fetch_image).
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.catalog_import import CatalogImporter, read_feed
+
+
+class Command(BaseCommand):
+    help = "Импортировать товары из фида (CSV/JSON/YML) пачками: upsert по sku, теги, характеристики, картинки в очередь."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Файл фида")
+        parser.add_argument("--format", choices=["csv", "json", "yml"], help="По умолчанию — по расширению")
+        parser.add_argument("--batch", type=int, default=2000, help="Строк на транзакцию")
+        parser.add_argument("--images-dir", help="Каталог с картинками: локальные пути в фиде — только внутри него "
+                                                 "(без него принимаются только http(s)-ссылки)")
+        parser.add_argument("--no-images", action="store_true", help="Не ставить задачи на картинки")
+
+    def handle(self, *args, **opts):
+        importer = CatalogImporter(
+            batch_size=opts["batch"], images=not opts["no_images"], images_dir=opts["images_dir"],
+        )
+        t0 = time.perf_counter()
+
+        def progress(stats):
+            dt = time.perf_counter() - t0
+            self.stdout.write(f"  … {stats['rows']} строк, {stats['rows'] / dt:.0f} строк/с")
+
+        try:
+            stats = importer.run(read_feed(opts["path"], opts["format"]), progress=progress)
+        except (OSError, ValueError) as e:  # нет файла, битый JSON/XML
+            raise CommandError(f"Не удалось прочитать фид: {e}")
+
+        for line, err in importer.errors[:20]:
+            self.stderr.write(f"строка {line}: {err}")
+        if len(importer.errors) > 20:
+            self.stderr.write(f"… и ещё {len(importer.errors) - 20} ошибок")
+        dt = time.perf_counter() - t0
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово за {dt:.1f} с: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.items()))
+        ))
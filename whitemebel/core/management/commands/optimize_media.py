@@ -0,0 +1,193 @@
+# core/management/commands/optimize_media.py
+"""
+Пережать старые JPEG/PNG из media/ в WEBP (+ ресайзы под srcset) на всех ядрах.
+
+    python manage.py optimize_media
+    python manage.py optimize_media --workers 8 --batch 500
+    python manage.py optimize_media --dry-run
+
+Обходит каталоги upload_to моделей с картинкой (products/, product_images/, main_slider/),
+кодирует в ProcessPoolExecutor, а поля в БД правит bulk_update'ом пачками — только у строк,
+где всё ещё лежит тот же файл. Готовое дописывается в манифест (JSON lines), повторный
+запуск пропускает то, что в нём уже есть. Сами файлы не удаляются (ни исходники, ни
+лишние результаты): storage дедуплицирует, их после grace-периода соберёт gc_media.
+"""
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections, transaction
+
+from core.models import MainSlider, Product, ProductImage
+from core.utils.image import compress_image
+from core.utils.renditions import build_renditions
+
+MODELS = (Product, ProductImage, MainSlider)
+LEGACY_EXT = {".jpg", ".jpeg", ".png"}
+
+
+def _optimize(name: str, upload_dir: str, quality: int) -> dict:
+    """Работает в дочернем процессе: только storage, без БД."""
+    try:
+        old_size = default_storage.size(name)
+        with default_storage.open(name, "rb") as f:
+            content = compress_image(f, format="WEBP", quality=quality)
+        renditions, (w, h), placeholder = build_renditions(content, upload_dir=upload_dir)
+        new_name = default_storage.save(os.path.join(upload_dir, content.name), content)
+        return {"src": name, "dst": new_name, "old": old_size, "new": content.size,
+                "width": w, "height": h, "renditions": renditions, "placeholder": placeholder}
+    except Exception as e:  # битый файл не должен ронять весь прогон
+        return {"src": name, "error": f"{type(e).__name__}: {e}"}
+
+
+def _walk(root: str, rel: str):
+    top = os.path.join(root, rel)
+    for dirpath, _dirs, files in os.walk(top):
+        for fn in files:
+            if os.path.splitext(fn)[1].lower() in LEGACY_EXT:
+                yield os.path.relpath(os.path.join(dirpath, fn), root).replace(os.sep, "/")
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = "Пережать старые JPEG/PNG в WEBP с ресайзами параллельно (можно прервать и продолжить)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Процессов (по умолчанию — все ядра)")
+        parser.add_argument("--batch", type=int, default=200, help="Сколько готовых файлов сохранять в БД за раз")
+        parser.add_argument("--quality", type=int, default=80)
+        parser.add_argument("--limit", type=int, default=0, help="Обработать не больше N файлов")
+        parser.add_argument("--manifest", help="Файл прогресса (по умолчанию MEDIA_ROOT/.optimize_media.jsonl)")
+        parser.add_argument("--retry-failed", action="store_true", help="Повторить файлы, упавшие в прошлых запусках")
+        parser.add_argument("--dry-run", action="store_true", help="Только посчитать, что будет обработано")
+
+    def handle(self, *args, **opts):
+        root = str(settings.MEDIA_ROOT)
+        manifest_path = opts["manifest"] or os.path.join(root, ".optimize_media.jsonl")
+        done = self._load_manifest(manifest_path, opts["retry_failed"])
+
+        # файл -> [(модель, pk)]; pending не трогаем — его сейчас обрабатывает очередь
+        refs, orphans = defaultdict(list), 0
+        for model in MODELS:
+            names = [n for n in _walk(root, model._meta.get_field("image").upload_to) if n not in done]
+            for chunk in _chunks(names, 1000):
+                rows = list(model.objects.filter(image__in=chunk).exclude(
+                    image_status=model.ImageStatus.PENDING,
+                ).values_list("pk", "image"))
+                for pk, name in rows:
+                    refs[name].append((model, pk))
+                orphans += len(set(chunk) - {name for _pk, name in rows})
+
+        todo = sorted(refs)
+        if opts["limit"]:
+            todo = todo[: opts["limit"]]
+        total_bytes = sum(default_storage.size(n) for n in todo)
+        self.stdout.write(
+            f"К обработке: {len(todo)} файлов, {total_bytes / 2**20:.1f} МБ; "
+            f"уже в манифесте: {len(done)}; без ссылок из БД (не трогаем): {orphans}"
+        )
+        if opts["dry_run"] or not todo:
+            return
+
+        upload_dirs = {n: refs[n][0][0]._meta.get_field("image").upload_to.strip("/") for n in todo}
+        stats = Counter()
+        batch = []
+        t0 = time.perf_counter()
+        # дочерним процессам соединение родителя не нужно (и делить его нельзя)
+        connections.close_all()
+        with open(manifest_path, "a", encoding="utf-8") as manifest, \
+                ProcessPoolExecutor(max_workers=max(1, opts["workers"])) as pool:
+            futures = [pool.submit(_optimize, n, upload_dirs[n], opts["quality"]) for n in todo]
+            for fut in as_completed(futures):
+                batch.append(fut.result())
+                if len(batch) >= opts["batch"]:
+                    self._flush(batch, refs, manifest, stats)
+                    batch = []
+                    self._progress(stats, len(todo), t0)
+            if batch:
+                self._flush(batch, refs, manifest, stats)
+        self._progress(stats, len(todo), t0)
+
+        saved = stats["bytes_old"] - stats["bytes_new"]
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {stats['done']} файлов, ошибок {stats['failed']}, пропущено (файл сменился) {stats['stale']}; "
+            f"{stats['bytes_old'] / 2**20:.1f} МБ -> {stats['bytes_new'] / 2**20:.1f} МБ, "
+            f"сэкономится {saved / 2**20:.1f} МБ ({saved / max(1, stats['bytes_old']):.0%}) — "
+            f"исходники удалит gc_media после grace-периода"
+        ))
+
+    @staticmethod
+    def _load_manifest(path: str, retry_failed: bool) -> set[str]:
+        done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # хвост, недописанный при прерывании
+                    if rec.get("status") == "done" or not retry_failed:
+                        done.add(rec["src"])
+        return done
+
+    def _progress(self, stats, total, t0):
+        dt = time.perf_counter() - t0
+        n = stats["done"] + stats["failed"] + stats["stale"]
+        self.stdout.write(
+            f"  … {n}/{total}, {n / dt:.1f} файлов/с, {stats['bytes_old'] / 2**20 / dt:.1f} МБ/с исходников"
+        )
+
+    def _flush(self, results, refs, manifest, stats):
+        ok = [r for r in results if "error" not in r]
+        by_model = defaultdict(list)
+        for r in ok:
+            for model, pk in refs[r["src"]]:
+                by_model[model].append((pk, r))
+
+        applied = set()
+        with transaction.atomic():
+            for model, items in by_model.items():
+                # строки, где за время работы загрузили другую картинку, не перетираем
+                current = set(model.objects.select_for_update().filter(
+                    pk__in=[pk for pk, _r in items], image__in={r["src"] for _pk, r in items},
+                ).values_list("pk", "image"))
+                objs = []
+                for pk, r in items:
+                    if (pk, r["src"]) not in current:
+                        continue
+                    objs.append(model(
+                        pk=pk, image=r["dst"], image_renditions=r["renditions"],
+                        image_width=r["width"], image_height=r["height"], image_placeholder=r["placeholder"],
+                        image_status=model.ImageStatus.READY,
+                    ))
+                    applied.add(r["src"])
+                model.objects.bulk_update(
+                    objs, ["image", "image_renditions", "image_width", "image_height", "image_placeholder", "image_status"],
+                )
+
+        for r in results:
+            if "error" in r:
+                stats["failed"] += 1
+                self.stderr.write(f"{r['src']}: {r['error']}")
+                rec = {"src": r["src"], "status": "failed", "error": r["error"]}
+            elif r["src"] in applied:
+                stats["done"] += 1
+                stats["bytes_old"] += r["old"]
+                stats["bytes_new"] += r["new"]
+                rec = {"src": r["src"], "status": "done", "dst": r["dst"], "old": r["old"], "new": r["new"]}
+            else:
+                stats["stale"] += 1
+                rec = {"src": r["src"], "status": "stale"}
+            manifest.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        manifest.flush()
@@ -0,0 +1,247 @@
+# core/management/commands/reconcile_payments.py
+"""
+Сверка заказов и журнала платежей с отчётом CloudPayments.
+
+    python manage.py reconcile_payments --report cp_2025.csv --since 2025-01-01
+    python manage.py reconcile_payments --report http://localhost:9000/payments.json --fix --out diff.csv
+
+Отчёт — CSV (заголовки как в выгрузке CP: TransactionId, InvoiceId, Amount, Currency, Status)
+или JSON (список транзакций либо ответ API {"Model": [...]}). CSV читается построчно, в памяти
+остаётся только компактный индекс order_id -> транзакции. Заказы идут из БД потоком
+(.iterator() — на Postgres это серверный курсор), платежи подтягиваются на пачку одним
+запросом. Без --fix только отчёт; с --fix статусы правятся bulk_update'ом по пачкам.
+Расхождения по сумме и «оплачен у нас, но не в CP» никогда не чинятся автоматически — только в отчёт.
+"""
+import csv
+import io
+import json
+import urllib.request
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time as dtime
+from decimal import Decimal, InvalidOperation
+from itertools import chain, islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import Order, Payment
+from core.payments import to_minor
+from core.utils.order_cache import forget_orders
+from core.utils.order_events import publish_order_status
+
+# статус транзакции в отчёте CP -> статус в журнале Payment
+CP_STATUS = {
+    "completed": Payment.Status.PAID,
+    "authorized": Payment.Status.AUTHORIZED,
+    "declined": Payment.Status.FAILED,
+    "refunded": Payment.Status.REFUNDED,
+    "reversed": Payment.Status.REFUNDED,
+    "voided": Payment.Status.REFUNDED,
+    "cancelled": Payment.Status.CANCELED,
+}
+
+PAID_LIKE = {"paid", "shipped", "delivered"}
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+@contextmanager
+def _open_report(src: str, fmt: str | None):
+    """(текстовый поток, формат): файл или HTTP-ответ читаются по мере разбора, а не целиком."""
+    if src.startswith(("http://", "https://")):
+        with urllib.request.urlopen(src, timeout=60) as resp:
+            ctype = resp.headers.get("Content-Type", "")
+            fmt = fmt or ("json" if "json" in ctype or src.split("?")[0].endswith(".json") else "csv")
+            yield io.TextIOWrapper(resp, encoding="utf-8-sig", newline=""), fmt
+        return
+    with open(src, encoding="utf-8-sig", newline="") as f:
+        yield f, fmt or ("json" if src.endswith(".json") else "csv")
+
+
+def _rows(stream, fmt: str):
+    if fmt == "json":
+        # JSON целиком (stdlib не умеет потоково); большие выгрузки — в CSV
+        data = json.load(stream)
+        if isinstance(data, dict):
+            data = data.get("Model") or data.get("model") or []
+        yield from data
+    else:
+        # разделитель угадываем по первым строкам, остальное DictReader читает построчно
+        head = list(islice(stream, 20))
+        sample = "".join(head)
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t") if sample else csv.excel
+        yield from csv.DictReader(chain(head, stream), dialect=dialect)
+
+
+def load_report(src: str, fmt: str | None = None) -> dict[int, list[dict]]:
+    """order_id -> [{tx, status, amount, currency}] — компактно, без сырых строк отчёта."""
+    by_order = defaultdict(list)
+    with _open_report(src, fmt) as (stream, fmt):
+        for raw in _rows(stream, fmt):
+            _add_row(by_order, raw)
+    return by_order
+
+
+def _add_row(by_order, raw) -> None:
+    row = {str(k).strip().lower(): v for k, v in raw.items() if k}
+    inv = str(row.get("invoiceid") or "").strip()
+    status = CP_STATUS.get(str(row.get("status") or "").strip().lower())
+    if not inv.isdigit() or status is None:
+        return
+    try:
+        amount = Decimal(str(row.get("amount") or "0").replace(",", "."))
+    except InvalidOperation:
+        amount = None
+    by_order[int(inv)].append({
+        "tx": str(row.get("transactionid") or "").strip(),
+        "status": status,
+        "amount": amount,
+        "currency": str(row.get("currency") or "RUB").strip().upper()[:3],
+    })
+
+
+def expected_order_status(txs: list[dict]) -> str | None:
+    """Каким должен быть заказ по данным CP. None — CP денег не получил (отказы/холд)."""
+    statuses = {t["status"] for t in txs}
+    if Payment.Status.PAID in statuses:
+        return "paid"
+    if Payment.Status.REFUNDED in statuses:
+        return "canceled"
+    return None
+
+
+class Command(BaseCommand):
+    help = "Сверить заказы и платежи с отчётом CloudPayments (файл или URL); --fix — починить статусы."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--report", required=True, help="Путь к CSV/JSON или http(s) URL")
+        parser.add_argument("--format", choices=["csv", "json"], help="Формат отчёта (по умолчанию — по расширению)")
+        parser.add_argument("--since", help="Заказы с даты YYYY-MM-DD (по created_at)")
+        parser.add_argument("--until", help="Заказы по дату YYYY-MM-DD включительно")
+        parser.add_argument("--chunk", type=int, default=2000, help="Размер пачки")
+        parser.add_argument("--fix", action="store_true", help="Исправить статусы заказов и журнал Payment")
+        parser.add_argument("--out", help="CSV с расхождениями")
+
+    def handle(self, *args, **opts):
+        try:
+            report = load_report(opts["report"], opts["format"])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Не удалось прочитать отчёт: {e}")
+        self.stdout.write(f"Отчёт: заказов {len(report)}, транзакций {sum(map(len, report.values()))}")
+
+        qs = Order.objects.filter(payment_method="online")
+        if opts["since"]:
+            qs = qs.filter(created_at__gte=self._day(opts["since"], dtime.min))
+        if opts["until"]:
+            qs = qs.filter(created_at__lte=self._day(opts["until"], dtime.max))
+        orders = qs.only("id", "status", "total_price").order_by("id").iterator(chunk_size=opts["chunk"])
+
+        out = None
+        if opts["out"]:
+            out_file = open(opts["out"], "w", newline="", encoding="utf-8")
+            out = csv.writer(out_file)
+            out.writerow(["order_id", "problem", "db", "cp", "fixed"])
+
+        stats = Counter()
+        try:
+            for chunk in _chunks(orders, max(1, opts["chunk"])):
+                self._reconcile_chunk(chunk, report, opts["fix"], stats, out)
+                stats["orders"] += len(chunk)
+                self.stdout.write(f"  … {stats['orders']} заказов, расхождений {stats['mismatch']}")
+        finally:
+            if out is not None:
+                out_file.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Готово: " + ", ".join(f"{k}={v}" for k, v in sorted(stats.items()))
+        ))
+
+    @staticmethod
+    def _day(value: str, t) -> datetime:
+        try:
+            return timezone.make_aware(datetime.combine(datetime.strptime(value, "%Y-%m-%d").date(), t))
+        except ValueError:
+            raise CommandError(f"Дата в формате YYYY-MM-DD: {value}")
+
+    def _reconcile_chunk(self, chunk, report, fix, stats, out):
+        txs = [t for o in chunk for t in report.get(o.id, ()) if t["tx"]]
+        ledger = {
+            p.transaction_id: p
+            for p in Payment.objects.filter(transaction_id__in=[t["tx"] for t in txs]).only(
+                "id", "order_id", "transaction_id", "status", "amount", "currency",
+            )
+        } if txs else {}
+
+        orders_fix, pay_fix, pay_new = [], [], []
+        now = timezone.now()
+
+        def flag(order, problem, db, cp, fixed=False):
+            stats["mismatch"] += 1
+            stats[problem] += 1
+            if out is not None:
+                out.writerow([order.id, problem, db, cp, int(fixed)])
+
+        for order in chunk:
+            cp_txs = report.get(order.id, [])
+            expected = expected_order_status(cp_txs)
+
+            # --- сумма ---
+            amount_ok = True
+            for t in cp_txs:
+                if t["status"] == Payment.Status.PAID and t["amount"] is not None \
+                        and to_minor(t["amount"]) != to_minor(order.total_price):
+                    amount_ok = False
+                    flag(order, "amount", order.total_price, t["amount"])
+
+            # --- статус заказа ---
+            if expected is None:
+                if order.status in PAID_LIKE:
+                    flag(order, "paid_not_in_cp", order.status, ",".join(t["status"] for t in cp_txs) or "-")
+            elif expected == "paid" and order.status not in PAID_LIKE:
+                # оплачено не той суммой — в оплаченные не переводим, пусть смотрит человек
+                flag(order, "status", order.status, expected, fix and amount_ok)
+                if amount_ok:
+                    order.status, order.updated_at = expected, now
+                    orders_fix.append(order)
+            elif expected == "canceled" and order.status != "canceled":
+                flag(order, "status", order.status, expected, fix)
+                order.status, order.updated_at = expected, now
+                orders_fix.append(order)
+
+            # --- журнал Payment ---
+            for t in cp_txs:
+                if not t["tx"]:
+                    continue
+                p = ledger.get(t["tx"])
+                if p is None:
+                    flag(order, "payment_missing", "-", f"{t['tx']}:{t['status']}", fix)
+                    pay_new.append(Payment(
+                        order_id=order.id, transaction_id=t["tx"], invoice_id=str(order.id),
+                        status=t["status"], amount=t["amount"] or order.total_price, currency=t["currency"],
+                    ))
+                elif p.status != t["status"]:
+                    flag(order, "payment_status", f"{p.transaction_id}:{p.status}", t["status"], fix)
+                    p.status, p.updated_at = t["status"], now
+                    pay_fix.append(p)
+
+        if not fix or not (orders_fix or pay_fix or pay_new):
+            return
+        with transaction.atomic():
+            if orders_fix:
+                Order.objects.bulk_update(orders_fix, ["status", "updated_at"])
+            if pay_fix:
+                Payment.objects.bulk_update(pay_fix, ["status", "updated_at"])
+            if pay_new:
+                Payment.objects.bulk_create(pay_new, ignore_conflicts=True)
+            for o in orders_fix:
+                publish_order_status(o.id, o.status)
+        # bulk_update мимо Order.save() — снимки в кэше сбрасываем руками
+        forget_orders([o.id for o in orders_fix])
+        stats["fixed_orders"] += len(orders_fix)
+        stats["fixed_payments"] += len(pay_fix) + len(pay_new)
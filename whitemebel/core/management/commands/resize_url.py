@@ -0,0 +1,24 @@
+# core/management/commands/resize_url.py
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.resize import FITS, FORMATS, signed_resize_url
+
+
+class Command(BaseCommand):
+    help = "Выдать подписанную ссылку на ресайз картинки из media (для фидов, баннеров, соцсетей)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("src", nargs="+", help="Имя файла относительно MEDIA_ROOT, напр. products/x.webp")
+        parser.add_argument("--w", type=int, default=0, help="Ширина, px")
+        parser.add_argument("--h", type=int, default=0, help="Высота, px")
+        parser.add_argument("--fit", choices=FITS, default="cover")
+        parser.add_argument("--fmt", choices=list(FORMATS), default="webp")
+        parser.add_argument("--base", default="", help="Префикс, напр. https://white-mebel.com")
+
+    def handle(self, *args, **opts):
+        for src in opts["src"]:
+            try:
+                url = signed_resize_url(src, opts["w"], opts["h"], opts["fit"], opts["fmt"])
+            except ValueError as e:
+                raise CommandError(f"{src}: {e}")
+            self.stdout.write(opts["base"].rstrip("/") + url)
@@ -1,28 +1,76 @@
 # core/management/commands/reslug_ascii.py
+import time
+
 from django.core.management.base import BaseCommand
-from core.utils.slug import ascii_slug
+from django.db import transaction
+
 from core.models import Category, Tag, ProductAttribute, Product
+from core.utils.slug import SlugAllocator, ascii_slug
+
+MODELS = {
+    "category": (Category, "name"),
+    "tag": (Tag, "name"),
+    "attribute": (ProductAttribute, "name"),
+    "product": (Product, "title"),
+}
+
+
+def reslug(model, field="name", *, chunk=1000, dry_run=False, progress=None):
+    """
+    Все слаги модели — в ASCII. Таблица читается одним запросом (только pk, slug, field),
+    коллизии решаются в памяти, изменения пишутся bulk_update'ом пачками в одной транзакции.
+
+    Уже правильные слаги (ASCII и совпадают с ascii_slug от самих себя) остаются как есть и
+    занимают своё место первыми; остальные получают свободный вариант -2, -3, … в порядке pk.
+    Новый слаг всегда валидный ASCII, а старые у переименуемых — нет, поэтому внутри
+    одного UPDATE уникальность не нарушается. Возвращает список (pk, старый, новый).
+    """
+    rows = list(model.objects.order_by("pk").values_list("pk", "slug", field))
+    max_length = model._meta.get_field("slug").max_length
+    valid = {pk for pk, slug, _ in rows if slug and slug == ascii_slug(slug)[:max_length]}
+    slugs = SlugAllocator((slug for pk, slug, _ in rows if pk in valid), max_length=max_length)
+
+    changes = [
+        (pk, slug, slugs.allocate(slug or value))
+        for pk, slug, value in rows if pk not in valid
+    ]
+    if dry_run:
+        return changes
+
+    with transaction.atomic():
+        for start in range(0, len(changes), chunk):
+            part = changes[start:start + chunk]
+            model.objects.bulk_update([model(pk=pk, slug=new) for pk, _old, new in part], ["slug"])
+            if progress:
+                progress(start + len(part), len(changes))
+    return changes
 
-def reslug(model, field="name"):
-    seen = set()
-    for obj in model.objects.all():
-        base = getattr(obj, "slug") or getattr(obj, field)
-        s = ascii_slug(base)
-        if not s: s = "item"
-        orig = s; i = 2
-        while s in seen or model.objects.exclude(pk=obj.pk).filter(slug=s).exists():
-            s = f"{orig}-{i}"; i += 1
-        if obj.slug != s:
-            obj.slug = s
-            obj.save(update_fields=["slug"])
-        seen.add(s)
 
 class Command(BaseCommand):
     help = "Перегенерить слаги в ASCII"
 
-    def handle(self, *args, **kwargs):
-        reslug(Category)
-        reslug(Tag)
-        reslug(ProductAttribute)
-        reslug(Product, field="title")
+    def add_arguments(self, parser):
+        parser.add_argument("--model", action="append", choices=list(MODELS),
+                            help="Только эти модели (можно несколько раз). По умолчанию — все")
+        parser.add_argument("--chunk", type=int, default=1000, help="Строк на один bulk_update")
+        parser.add_argument("--dry-run", action="store_true", help="Только показать, что поменяется")
+
+    def handle(self, *args, **opts):
+        verbose = opts["verbosity"] > 1
+        for key in opts["model"] or MODELS:
+            model, field = MODELS[key]
+            t0 = time.perf_counter()
+
+            def progress(done, total, name=model.__name__):
+                self.stdout.write(f"  {name}: {done}/{total}")
+
+            changes = reslug(model, field, chunk=max(1, opts["chunk"]), dry_run=opts["dry_run"],
+                             progress=progress)
+            if opts["dry_run"] or verbose:
+                for pk, old, new in changes[: None if verbose else 20]:
+                    self.stdout.write(f"  #{pk}: {old!r} -> {new}")
+                if not verbose and len(changes) > 20:
+                    self.stdout.write(f"  … и ещё {len(changes) - 20}")
+            verb = "поменяется" if opts["dry_run"] else "обновлено"
+            self.stdout.write(f"{model.__name__}: {verb} {len(changes)} за {time.perf_counter() - t0:.2f} с")
         self.stdout.write(self.style.SUCCESS("Готово"))
@@ -0,0 +1,64 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import claim, purge_done, requeue_stale, run_job
+from core.utils.mailer import mailer
+
+
+class Command(BaseCommand):
+    help = "Воркер фоновых задач (модель Job): пул потоков, ретраи с backoff, dead letter."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queue", action="append", dest="queues",
+                            help="Очередь (можно несколько раз). По умолчанию: default и mail")
+        parser.add_argument("--concurrency", type=int, default=4, help="Сколько задач выполнять параллельно")
+        parser.add_argument("--poll", type=float, default=1.0, help="Пауза, если задач нет (сек)")
+        parser.add_argument("--once", action="store_true", help="Выбрать очередь до дна и выйти")
+
+    def handle(self, *args, **opts):
+        queues = opts["queues"] or ["default", "mail"]
+        concurrency = max(1, opts["concurrency"])
+        poll = max(0.1, opts["poll"])
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        stopping = False
+
+        def _stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+            self.stdout.write("Останавливаюсь: дожидаюсь текущих задач…")
+
+        signal.signal(signal.SIGTERM, _stop)
+        signal.signal(signal.SIGINT, _stop)
+
+        self.stdout.write(f"run_jobs {worker_id}: queues={','.join(queues)} concurrency={concurrency}")
+        inflight = set()
+        last_maintenance = 0.0
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="job") as pool:
+            while not stopping:
+                now = time.monotonic()
+                if now - last_maintenance > 60:
+                    requeue_stale(queues)
+                    purge_done()
+                    last_maintenance = now
+
+                jobs = claim(queues, concurrency - len(inflight), worker_id)
+                for job in jobs:
+                    inflight.add(pool.submit(run_job, job))
+
+                if inflight:
+                    done, inflight = wait(inflight, timeout=poll if not jobs else 0, return_when=FIRST_COMPLETED)
+                    inflight = set(inflight)
+                elif opts["once"]:
+                    break
+                else:
+                    time.sleep(poll)
+
+            wait(inflight)
+        mailer.close_all()
+        self.stdout.write(self.style.SUCCESS("run_jobs: остановлен"))
@@ -1,7 +1,12 @@
+import math
 import random
+import time
+from itertools import accumulate
 from io import BytesIO
 from pathlib import Path
-from core.utils.slug import ascii_slug
+from core.utils.slug import SlugAllocator, ascii_slug
+from core.utils.image import compress_image
+from core.utils.renditions import build_renditions
 
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
@@ -9,6 +14,8 @@ from faker import Faker
 from PIL import Image, ImageDraw
 import uuid
 from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast, Substr
 from django.core.management.base import CommandError
 
 from core.models import (
@@ -125,6 +132,30 @@ def cf(name="placeholder.jpg"):
     return ContentFile(IMG_BYTES, name=name)
 
 
+def shared_image(content: ContentFile, model) -> dict:
+    """
+    Обработать картинку один раз и вернуть значения полей image* — их получают все строки сразу.
+    Иначе каждая строка перекодирует ту же заглушку (storage по хэшу и так хранит один файл).
+    """
+    field = model._meta.get_field("image")
+    webp = compress_image(content, format="WEBP", quality=80)
+    renditions, (w, h), placeholder = build_renditions(webp, upload_dir=field.upload_to, storage=field.storage)
+    return {
+        "image": field.storage.save(field.generate_filename(None, webp.name), webp),
+        "image_renditions": renditions,
+        "image_width": w,
+        "image_height": h,
+        "image_placeholder": placeholder,
+        "image_status": model.ImageStatus.READY,
+    }
+
+
+def zipf_weights(n, s=1.1):
+    # популярность «как в жизни»: несколько ходовых значений и длинный хвост;
+    # накопленные — для random.choices(cum_weights=...), чтобы не суммировать на каждый вызов
+    return list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
 def unique_slug(base, existing_qs, field="slug"):
     s = ascii_slug(base)
     if not s:
@@ -143,12 +174,10 @@ def make_sku(prefix="WM"):
     return f"{prefix}-{random.randint(100000, 999999)}"
 
 def generate_unique_sku(used, prefix="WM", max_tries=20):
-    # 1) быстрые попытки в памяти + БД
+    # 1) быстрые попытки в памяти (used — все SKU из БД; гонку ловит IntegrityError при save)
     for _ in range(max_tries):
         sku = make_sku(prefix)
-        if sku in used:
-            continue
-        if not Product.objects.filter(sku=sku).exists():
+        if sku not in used:
             used.add(sku)
             return sku
     # 2) fallback — вообще уникальный
@@ -165,10 +194,22 @@ class Command(BaseCommand):
         parser.add_argument("--fresh", action="store_true")
         parser.add_argument("--slides-dir", type=str, help="Папка со слайдами slide1/2/3.*")
         parser.add_argument("--product-image", type=str, help="Путь к картинке товара (product.*)")
+        parser.add_argument("--seed", type=int, help="Зерно генератора: одинаковое зерно — одинаковый каталог")
+        # массовый режим для нагрузочных замеров: 100k–1M товаров bulk-вставками
+        parser.add_argument("--bulk", action="store_true", help="Массовая генерация (bulk_create, общая картинка)")
+        parser.add_argument("--batch", type=int, default=5000, help="--bulk: товаров на транзакцию")
+        parser.add_argument("--depth", type=int, default=3, help="--bulk: глубина дерева категорий (2–4)")
+        parser.add_argument("--tags", type=int, default=60, help="--bulk: сколько всего тегов")
+        parser.add_argument("--extra-attributes", type=int, default=10,
+                            help="--bulk: синтетических характеристик сверх базовых (2–60 опций)")
+        parser.add_argument("--discount-ratio", type=float, default=0.35, help="Доля товаров со скидкой")
 
     def handle(self, *args, **opts):
         products_count = max(1, int(opts["products"]))
         fresh = opts["fresh"]
+        if opts["seed"] is not None:
+            random.seed(opts["seed"])
+            Faker.seed(opts["seed"])
 
         slides_dir = Path(opts["slides_dir"]).resolve() if opts.get("slides_dir") else None
         product_img_path = Path(opts["product_image"]).resolve() if opts.get("product_image") else None
@@ -321,21 +362,29 @@ class Command(BaseCommand):
                 is_active=True,
             )
 
+        if opts["bulk"]:
+            self._bulk_products(products_count, attr_map, collections, product_image_cf, opts)
+            return
+
         self.stdout.write(f"📦 Генерю товары: {products_count} шт…")
         all_colors = list(Color.objects.all())
         all_tags = list(Tag.objects.all())
         leaf_categories = list(Category.objects.filter(children__isnull=True)) or list(Category.objects.all())
         used_skus = set(Product.objects.values_list("sku", flat=True))
+        slugs = SlugAllocator(Product.objects.values_list("slug", flat=True))
+        options_by_attr = {a.id: list(a.options.all()) for a in attr_map.values()}
+        # одна и та же заглушка: обрабатываем один раз, товарам раздаём готовые поля
+        product_image = shared_image(product_image_cf(), Product)
+        gallery_image = shared_image(cf(), ProductImage)
         created_products = []
         for _ in range(products_count):
             cat = random.choice(leaf_categories)
             base_title = f"{cat.name} {fake.word().capitalize()} {random.randint(100, 999)}"
-            p_slug = unique_slug(base_title, Product.objects)
+            p_slug = slugs.allocate(base_title)
             price = random.randint(12000, 120000)
-            has_disc = random.random() < 0.35
+            has_disc = random.random() < opts["discount_ratio"]
             disc = round(price * random.uniform(0.85, 0.97), 2) if has_disc else None
             color = random.choice(all_colors)
-            sku = generate_unique_sku(used_skus, prefix="WM")
 
             p = Product(
                 title=base_title,
@@ -343,7 +392,6 @@ class Command(BaseCommand):
                 description=fake.paragraph(nb_sentences=3),
                 price=price,
                 discount_price=disc,
-                sku=sku,
                 is_active=True,
                 stock=random.randint(0, 50),
                 width=random.choice([60, 80, 100, 120, 150, 180]),
@@ -351,24 +399,21 @@ class Command(BaseCommand):
                 depth=random.choice([40, 45, 50, 60]),
                 color=color,
                 category=cat,
+                **product_image,
             )
-            p.image = product_image_cf()
-            p.save()
-            created_products.append(p)
-            
             for attempt in range(3):
+                p.sku = generate_unique_sku(used_skus, prefix="WM")
                 try:
                     with transaction.atomic():
                         p.save()
                     break
                 except IntegrityError as e:
-                    if "core_product_sku_key" in str(e) and attempt < 2:
-                        # пересоздаём SKU и пробуем ещё раз
-                        sku = generate_unique_sku(used_skus, prefix="WM")
-                        p.sku = sku
+                    # SKU мог занять параллельный процесс — берём другой
+                    if "sku" in str(e) and attempt < 2:
                         continue
                     raise
-                        
+            created_products.append(p)
+
             # теги
             if all_tags:
                 k = random.randint(0, min(3, len(all_tags)))
@@ -376,17 +421,13 @@ class Command(BaseCommand):
                     p.tags.add(*random.sample(all_tags, k=k))
 
             # доп. картинка
-            ProductImage.objects.create(product=p, image=cf(f"{p_slug}_1.jpg"), alt_text=p.title)
-
-            # атрибуты (устойчиво к рассинхрону)
-            for attr_name in ATTRS.keys():
-                attr = attr_map.get(attr_name) or ProductAttribute.objects.filter(name=attr_name).first()
-                if not attr:
-                    continue
-                opt = AttributeOption.objects.filter(attribute=attr).order_by("?").first()
-                if not opt:
-                    continue
-                ProductAttributeValue.objects.get_or_create(product=p, attribute=attr, option=opt)
+            ProductImage.objects.create(product=p, alt_text=p.title, **gallery_image)
+
+            # атрибуты: по одной случайной опции каждой характеристики
+            ProductAttributeValue.objects.bulk_create([
+                ProductAttributeValue(product=p, attribute_id=attr_id, option=random.choice(opts_))
+                for attr_id, opts_ in options_by_attr.items() if opts_
+            ], ignore_conflicts=True)
 
         # немножко связок по цвету/related
         self.stdout.write("🔗 Линкую товары между собой…")
@@ -411,3 +452,144 @@ class Command(BaseCommand):
             p.collections.add(random.choice(collections))
 
         self.stdout.write(self.style.SUCCESS(f"Готово. Создано товаров: {len(created_products)}"))
+
+    # ---------- массовый режим ----------
+
+    def _bulk_products(self, count, attr_map, collections, product_image_cf, opts):
+        """
+        Каталог под нагрузочные замеры: товары и связи — bulk_create пачками по --batch,
+        одна обработанная картинка на всех, распределения близкие к боевым:
+        глубокое дерево категорий с «ходовыми» ветками, характеристики с разной кардинальностью,
+        пересекающиеся теги (Zipf), доля скидок --discount-ratio. С --seed результат повторяем.
+        """
+        rng = random.Random(opts["seed"])
+        batch_size = max(100, opts["batch"])
+
+        self.stdout.write("🌲 Углубляю дерево категорий…")
+        # order_by везде, где по выборке ходит rng: иначе порядок строк от БД ломает --seed
+        leaves = list(Category.objects.filter(children__isnull=True).order_by("id"))
+        cat_slugs = SlugAllocator(Category.objects.values_list("slug", flat=True))
+        for level in range(3, max(2, min(4, opts["depth"])) + 1):
+            new_leaves = []
+            for parent in leaves:
+                for k in range(rng.randint(2, 6)):
+                    name = f"Серия {chr(ord('A') + k)}" if level == 3 else f"Модель {k + 1}"
+                    new_leaves.append(Category.objects.create(
+                        name=name, parent=parent, slug=cat_slugs.allocate(f"{parent.slug}-{name}"),
+                    ))
+            leaves = new_leaves
+        rng.shuffle(leaves)
+        leaf_weights = zipf_weights(len(leaves))
+
+        self.stdout.write("🏷 Теги…")
+        tag_slugs = SlugAllocator(Tag.objects.values_list("slug", flat=True), max_length=100)
+        have = set(Tag.objects.values_list("name", flat=True))
+        Tag.objects.bulk_create([
+            Tag(name=f"тег-{i}", slug=tag_slugs.allocate(f"teg-{i}"))
+            for i in range(1, opts["tags"] - len(TAGS) + 1) if f"тег-{i}" not in have
+        ])
+        tag_ids = list(Tag.objects.order_by("id").values_list("id", flat=True))
+        tag_weights = zipf_weights(len(tag_ids), s=1.2)
+
+        self.stdout.write("⚙️  Синтетические характеристики…")
+        attr_slugs = SlugAllocator(ProductAttribute.objects.values_list("slug", flat=True), max_length=120)
+        for i in range(1, opts["extra_attributes"] + 1):
+            # кардинальность лог-равномерно от 2 до 60: пара «да/нет» и длинные справочники
+            n_opts = int(round(math.exp(rng.uniform(math.log(2), math.log(60)))))
+            attr, _ = ProductAttribute.objects.get_or_create(
+                name=f"Параметр {i}",
+                defaults={"slug": attr_slugs.allocate(f"parametr-{i}"), "filter_order": 100 + i,
+                          "is_multiselect": n_opts > 6,
+                          "filter_widget": "select" if n_opts > 12 else "checkbox"},
+            )
+            AttributeOption.objects.bulk_create(
+                [AttributeOption(attribute=attr, value=f"Вариант {j}") for j in range(1, n_opts + 1)],
+                ignore_conflicts=True,
+            )
+            attr_map[attr.name] = attr
+        base_attrs = set(ATTRS)
+        attributes = []  # (attr_id, мульти?, вероятность наличия, [option_id], веса)
+        for name, attr in attr_map.items():
+            option_ids = list(attr.options.order_by("id").values_list("id", flat=True))
+            if option_ids:
+                attributes.append((attr.id, attr.is_multiselect, 0.95 if name in base_attrs else 0.45,
+                                   option_ids, zipf_weights(len(option_ids), s=0.9)))
+
+        color_ids = list(Color.objects.order_by("id").values_list("id", flat=True))
+        color_weights = zipf_weights(len(color_ids), s=0.8)
+        collection_ids = [c.id for c in collections]
+        # тексты генерим заранее: Faker на каждую строку — основное время на миллионе
+        words = [fake.word().capitalize() for _ in range(400)]
+        descriptions = [fake.paragraph(nb_sentences=3) for _ in range(200)]
+        product_image = shared_image(product_image_cf(), Product)
+        gallery_image = shared_image(cf(), ProductImage)
+        leaf_names = {c.id: c.name for c in leaves}
+        leaf_ids = [c.id for c in leaves]
+
+        # продолжаем с наибольшего номера, а не с count(): удалённые WMB- дали бы повторы артикулов
+        start = Product.objects.filter(sku__regex=r"^WMB-[0-9]+$").aggregate(
+            n=Max(Cast(Substr("sku", 5), BigIntegerField())))["n"] or 0
+        slugs = SlugAllocator(Product.objects.values_list("slug", flat=True))
+        TagThrough = Product.tags.through
+        CollectionThrough = Product.collections.through
+
+        self.stdout.write(f"📦 Генерю товары пачками по {batch_size}: {count} шт…")
+        t0 = time.perf_counter()
+        done = 0
+        while done < count:
+            n = min(batch_size, count - done)
+            products = []
+            for i in range(start + done, start + done + n):
+                cat_id = rng.choices(leaf_ids, cum_weights=leaf_weights)[0]
+                title = f"{leaf_names[cat_id]} {rng.choice(words)} {i + 1}"
+                # цена лог-нормальная вокруг ~40 тыс., скидка неглубокая чаще, чем глубокая
+                price = min(500000, max(990, round(math.exp(rng.gauss(10.6, 0.6)), -1)))
+                disc = None
+                if rng.random() < opts["discount_ratio"]:
+                    disc = round(price * (1 - 0.03 - rng.betavariate(2, 5) * 0.3), 2)
+                products.append(Product(
+                    title=title, slug=slugs.allocate(title), sku=f"WMB-{i + 1:07d}",
+                    description=rng.choice(descriptions), price=price, discount_price=disc,
+                    is_active=rng.random() > 0.03,
+                    stock=0 if rng.random() < 0.15 else int(rng.expovariate(1 / 12)) + 1,
+                    width=rng.choice([60, 80, 100, 120, 150, 180, 200, 240]),
+                    height=rng.choice([200, 210, 220, 240, 260]),
+                    depth=rng.choice([40, 45, 50, 60, 65]),
+                    color_id=rng.choices(color_ids, cum_weights=color_weights)[0] if color_ids else None,
+                    category_id=cat_id,
+                    **product_image,
+                ))
+
+            with transaction.atomic():
+                Product.objects.bulk_create(products, batch_size=1000)
+                tags, values, gallery, in_collections = [], [], [], []
+                for p in products:
+                    k = rng.choice((0, 0, 1, 1, 1, 2, 2, 3, 4))
+                    for tag_id in set(rng.choices(tag_ids, cum_weights=tag_weights, k=k)) if tag_ids else ():
+                        tags.append(TagThrough(product_id=p.id, tag_id=tag_id))
+                    for attr_id, multi, presence, option_ids, weights in attributes:
+                        if rng.random() >= presence:
+                            continue
+                        k = rng.choice((1, 1, 2, 3)) if multi else 1
+                        for option_id in set(rng.choices(option_ids, cum_weights=weights, k=k)):
+                            values.append(ProductAttributeValue(product_id=p.id, attribute_id=attr_id,
+                                                                option_id=option_id))
+                    for _ in range(rng.choice((0, 1, 1, 2, 3, 4))):
+                        gallery.append(ProductImage(product_id=p.id, alt_text=p.title, **gallery_image))
+                    if collection_ids:
+                        in_collections.append(CollectionThrough(product_id=p.id,
+                                                                collection_id=rng.choice(collection_ids)))
+                TagThrough.objects.bulk_create(tags, batch_size=5000)
+                ProductAttributeValue.objects.bulk_create(values, batch_size=5000)
+                ProductImage.objects.bulk_create(gallery, batch_size=5000)
+                CollectionThrough.objects.bulk_create(in_collections, batch_size=5000)
+
+            done += n
+            dt = time.perf_counter() - t0
+            self.stdout.write(f"  … {done}/{count}, {done / dt:.0f} товаров/с")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово. Создано товаров: {count} за {time.perf_counter() - t0:.1f} с "
+            f"(категорий-листьев {len(leaves)}, тегов {len(tag_ids)}, характеристик {len(attributes)})"
+        ))
+
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:13
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_notified(apps, schema_editor):
+    # старые заказы уже разосланы по одному — в первый дайджест они попадать не должны
+    Order = apps.get_model('core', 'Order')
+    Order.objects.filter(admin_notified_at__isnull=True).update(admin_notified_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='dedupe_key',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Ключ дедупликации'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='admin_notified_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Админы оповещены'),
+        ),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'queued'), models.Q(('dedupe_key', ''), _negated=True)), fields=('dedupe_key',), name='job_unique_queued_dedupe_key'),
+        ),
+        migrations.RunPython(mark_existing_notified, migrations.RunPython.noop),
+    ]
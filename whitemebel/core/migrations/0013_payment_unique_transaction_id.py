@@ -0,0 +1,17 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_order_admin_notified_at_job_dedupe_key'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('transaction_id', ''), _negated=True), fields=('transaction_id',), name='payment_unique_transaction_id'),
+        ),
+    ]
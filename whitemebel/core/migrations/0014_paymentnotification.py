@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:18
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_payment_unique_transaction_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=16, verbose_name='Событие')),
+                ('transaction_id', models.CharField(blank=True, max_length=64)),
+                ('order_id', models.CharField(blank=True, max_length=64, verbose_name='Заказ')),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('received', 'Получено'), ('processed', 'Обработано'), ('rejected', 'Отклонено')], default='received', max_length=16)),
+                ('result_code', models.SmallIntegerField(blank=True, null=True, verbose_name='Код результата')),
+                ('result_message', models.CharField(blank=True, max_length=255, verbose_name='Результат')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Получено')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Обработано')),
+            ],
+            options={
+                'verbose_name': 'Уведомление CloudPayments',
+                'verbose_name_plural': 'Уведомления CloudPayments',
+                'indexes': [models.Index(fields=['status', 'received_at'], name='core_paymen_status_8ac5bd_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('transaction_id', ''), _negated=True), fields=('event', 'transaction_id'), name='payment_notification_unique_event_tx')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mainslider',
+            name='image_status',
+            field=models.CharField(choices=[('ready', 'Готово'), ('pending', 'Обрабатывается'), ('failed', 'Ошибка обработки')], default='ready', editable=False, max_length=16, verbose_name='Обработка картинки'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_status',
+            field=models.CharField(choices=[('ready', 'Готово'), ('pending', 'Обрабатывается'), ('failed', 'Ошибка обработки')], default='ready', editable=False, max_length=16, verbose_name='Обработка картинки'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_status',
+            field=models.CharField(choices=[('ready', 'Готово'), ('pending', 'Обрабатывается'), ('failed', 'Ошибка обработки')], default='ready', editable=False, max_length=16, verbose_name='Обработка картинки'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_image_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mainslider',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Плейсхолдер (LQIP)'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Плейсхолдер (LQIP)'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_placeholder',
+            field=models.TextField(blank=True, default='', editable=False, verbose_name='Плейсхолдер (LQIP)'),
+        ),
+    ]
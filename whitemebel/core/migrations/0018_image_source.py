@@ -0,0 +1,28 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_image_placeholder'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mainslider',
+            name='image_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500, verbose_name='Источник картинки'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='image_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500, verbose_name='Источник картинки'),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='image_source',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500, verbose_name='Источник картинки'),
+        ),
+    ]
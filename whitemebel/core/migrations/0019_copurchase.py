@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-19 05:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_image_source'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField(verbose_name='Место')),
+                ('orders', models.PositiveIntegerField(verbose_name='Заказов вместе')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_purchased_in', to='core.product')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_purchases', to='core.product')),
+            ],
+            options={
+                'verbose_name': 'Покупают вместе',
+                'verbose_name_plural': 'Покупают вместе',
+                'constraints': [models.UniqueConstraint(fields=('product', 'rank'), name='copurchase_unique_product_rank')],
+            },
+        ),
+    ]
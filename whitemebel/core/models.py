@@ -5,12 +5,21 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseU
 import slugify
 
 from core.utils.slug import ascii_slug
-from .utils.image import compress_image
+from .utils.image import compress_image, image_changed
+from .utils.renditions import build_renditions
+from .utils.order_cache import cache_order_on_commit
+from .utils.catalog_cache import bump_catalog_version_on_commit
 from decimal import Decimal
 from django.core.validators import MinValueValidator
+from django.conf import settings
 from django.utils import timezone
 
 
+def touch_products(**filters) -> None:
+    """Поднять updated_at товарам, которые изменились не через свой save() (характеристики, цвет)."""
+    Product.objects.filter(**filters).update(updated_at=timezone.now())
+
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -78,6 +87,17 @@ class Color(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        renamed = self.pk is not None and Color.objects.filter(pk=self.pk).exclude(name=self.name).exists()
+        super().save(*args, **kwargs)
+        if renamed:
+            # название цвета вырезается из названия товара при поиске «семейства» (core/related.py)
+            touch_products(color_id=self.pk)
+
+    def delete(self, *args, **kwargs):
+        touch_products(color_id=self.pk)  # у товаров color станет NULL мимо save()
+        return super().delete(*args, **kwargs)
+
     class Meta:
         verbose_name = "Цвет"
         verbose_name_plural = "Цвета"
@@ -95,7 +115,63 @@ class Tag(models.Model):
         verbose_name_plural = "Теги"
 
 
-class Product(models.Model):
+class ImageRenditionsMixin(models.Model):
+    """
+    Общая обработка поля image (Product, ProductImage, MainSlider): новый файл
+    перекодируется в WEBP, рядом пишутся ресайзы под srcset (core/utils/renditions.py).
+
+    По умолчанию (IMAGE_PROCESS_ASYNC) save() сохраняет загрузку как есть и ставит
+    задачу images.process — перекодирует воркер (core/images.py), запрос админки не ждёт.
+    """
+    class ImageStatus(models.TextChoices):
+        READY   = "ready",   "Готово"
+        PENDING = "pending", "Обрабатывается"
+        FAILED  = "failed",  "Ошибка обработки"
+
+    image_width = models.PositiveIntegerField("Ширина картинки, px", null=True, blank=True, editable=False)
+    image_height = models.PositiveIntegerField("Высота картинки, px", null=True, blank=True, editable=False)
+    image_renditions = models.JSONField("Ресайзы", default=dict, blank=True, editable=False)
+    image_placeholder = models.TextField("Плейсхолдер (LQIP)", blank=True, default="", editable=False)
+    # URL/путь, откуда картинку взял импорт каталога — повторный импорт не качает её заново
+    image_source = models.CharField("Источник картинки", max_length=500, blank=True, default="", editable=False)
+    image_status = models.CharField(
+        "Обработка картинки", max_length=16, choices=ImageStatus.choices,
+        default=ImageStatus.READY, editable=False,
+    )
+
+    class Meta:
+        abstract = True
+
+    def process_image(self) -> None:
+        self.image = compress_image(self.image, format="WEBP", quality=80)
+        upload_to = self._meta.get_field("image").upload_to
+        self.image_renditions, (self.image_width, self.image_height), self.image_placeholder = build_renditions(
+            self.image, upload_dir=upload_to if isinstance(upload_to, str) else "",
+        )
+        self.image_status = self.ImageStatus.READY
+
+    def save(self, *args, **kwargs):
+        # перекодируем только новый файл; сохранённый (в т.ч. уже WEBP) не трогаем
+        schedule = False
+        if image_changed(self.image):
+            if getattr(settings, "IMAGE_PROCESS_ASYNC", True):
+                self.image_renditions, self.image_width, self.image_height = {}, None, None
+                self.image_placeholder = ""
+                self.image_status = self.ImageStatus.PENDING
+                schedule = True
+            else:
+                self.process_image()
+        elif not self.image:
+            self.image_renditions, self.image_width, self.image_height = {}, None, None
+            self.image_placeholder = ""
+            self.image_status = self.ImageStatus.READY
+        super().save(*args, **kwargs)
+        if schedule:
+            from core.images import schedule_image_processing  # core.images -> core.jobs -> models
+            schedule_image_processing(self)
+
+
+class Product(ImageRenditionsMixin):
     title = models.CharField("Название", max_length=255)
     slug = models.SlugField("Слаг", max_length=255, unique=True)
     description = models.TextField("Описание", blank=True)
@@ -141,28 +217,30 @@ class Product(models.Model):
     def has_discount(self):
         return self.discount_percent > 0
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # закэшированное по версии каталога устаревает — новая версия после коммита
+        bump_catalog_version_on_commit()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        bump_catalog_version_on_commit()
+        return result
+
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
-        
-    def save(self, *args, **kwargs):
-        if self.image:
-            self.image = compress_image(self.image, format="WEBP", quality=80)
-        super().save(*args, **kwargs)
 
 
-class ProductImage(models.Model):
+
+class ProductImage(ImageRenditionsMixin):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='product_images/')
     alt_text = models.CharField(max_length=255, blank=True)
 
     def __str__(self):
         return f"Image for {self.product.title}"
-    
-    def save(self, *args, **kwargs):
-        if self.image:
-            self.image = compress_image(self.image, format="WEBP", quality=80)
-        super().save(*args, **kwargs)
+
 
 
 class ProductAttribute(models.Model):
@@ -229,6 +307,16 @@ class ProductAttributeValue(models.Model):
     def clean(self):
         if self.option and self.attribute_id != self.option.attribute_id:
             raise ValidationError("Опция не принадлежит выбранной характеристике.")
+
+    # характеристики — часть товара: compute_related --since ищет изменения по Product.updated_at
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        touch_products(pk=self.product_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        touch_products(pk=self.product_id)
+        return result
         
 
 class Collection(models.Model):
@@ -289,10 +377,17 @@ class Order(models.Model):
     total_price = models.DecimalField("Сумма заказа", max_digits=10, decimal_places=2)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # когда админы получили письмо о заказе (отдельное или в дайджесте); NULL — ещё ждёт
+    admin_notified_at = models.DateTimeField("Админы оповещены", null=True, blank=True, db_index=True)
     services = models.ManyToManyField('Service', through='OrderService', blank=True, related_name='orders')
 
     def __str__(self):
         return f"Заказ #{self.id} от {self.full_name}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # снимок для ручек оплаты/поллинга — сквозная запись в кэш после коммита
+        cache_order_on_commit(self)
     
     class Meta:
         verbose_name = "Заказ"
@@ -315,8 +410,26 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.product} x {self.quantity}"
+
+
+class CoPurchase(models.Model):
+    """
+    «С этим товаром покупают»: top-N на товар, считает manage.py compute_copurchases
+    (core/copurchase.py) по OrderItem. Карточка читает одним запросом по (product, rank).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="co_purchases")
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="co_purchased_in")
+    rank = models.PositiveSmallIntegerField("Место")
+    orders = models.PositiveIntegerField("Заказов вместе")
+
+    class Meta:
+        verbose_name = "Покупают вместе"
+        verbose_name_plural = "Покупают вместе"
+        constraints = [
+            models.UniqueConstraint(fields=["product", "rank"], name="copurchase_unique_product_rank"),
+        ]
     
-class MainSlider(models.Model):
+class MainSlider(ImageRenditionsMixin):
     image = models.ImageField("Картинка", upload_to="main_slider/")
     link = models.URLField("Ссылка", blank=True, help_text="Ссылка при клике на слайд")
     title = models.CharField("Заголовок", max_length=255, blank=True)
@@ -333,11 +446,7 @@ class MainSlider(models.Model):
 
     def __str__(self):
         return self.title or f"Слайд #{self.id}"
-    
-    def save(self, *args, **kwargs):
-        if self.image:
-            self.image = compress_image(self.image, format="WEBP", quality=80)
-        super().save(*args, **kwargs)
+
     
 
 
@@ -507,11 +616,58 @@ class Payment(models.Model):
             models.Index(fields=["transaction_id"]),
             models.Index(fields=["status"]),
         ]
+        constraints = [
+            # одна транзакция CP — одна строка журнала (повторы вебхука обновляют её, а не плодят новые)
+            models.UniqueConstraint(
+                fields=["transaction_id"],
+                condition=~models.Q(transaction_id=""),
+                name="payment_unique_transaction_id",
+            ),
+        ]
         verbose_name = "Платёж"
         verbose_name_plural = "Платежи"
 
     def __str__(self):
         return f"Payment #{self.id} for order #{self.order_id} [{self.status}]"
+
+
+class PaymentNotification(models.Model):
+    """
+    Входящее уведомление CloudPayments (inbox): вебхук проверяет подпись, пишет сырое
+    событие сюда и сразу отвечает {"code": 0}; смену статуса делает фоновая задача
+    payments.process_notification (core/tasks.py). Повтор того же события не создаёт дубль.
+    """
+    class Status(models.TextChoices):
+        RECEIVED  = "received",  "Получено"
+        PROCESSED = "processed", "Обработано"
+        REJECTED  = "rejected",  "Отклонено"
+
+    event = models.CharField("Событие", max_length=16)  # pay|confirm|fail|refund
+    transaction_id = models.CharField(max_length=64, blank=True)
+    order_id = models.CharField("Заказ", max_length=64, blank=True)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.RECEIVED)
+    result_code = models.SmallIntegerField("Код результата", null=True, blank=True)
+    result_message = models.CharField("Результат", max_length=255, blank=True)
+    received_at = models.DateTimeField("Получено", default=timezone.now)
+    processed_at = models.DateTimeField("Обработано", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Уведомление CloudPayments"
+        verbose_name_plural = "Уведомления CloudPayments"
+        indexes = [
+            models.Index(fields=["status", "received_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["event", "transaction_id"],
+                condition=~models.Q(transaction_id=""),
+                name="payment_notification_unique_event_tx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"CP {self.event} tx={self.transaction_id or '-'} order={self.order_id} [{self.status}]"
     
     
     
@@ -538,4 +694,69 @@ class OneClickRequest(models.Model):
         ordering = ("-created_at",)
 
     def __str__(self):
-        return f"{self.name} {self.phone} → {self.product or self.product_url}"
\ No newline at end of file
+        return f"{self.name} {self.phone} → {self.product or self.product_url}"
+
+class IdempotencyKey(models.Model):
+    """
+    Ключ идемпотентности для POST-ручек (заголовок Idempotency-Key).
+    Храним отпечаток тела запроса и уже отрендеренный ответ — ретрай получает его как есть.
+    """
+    scope = models.CharField("Ручка", max_length=64)
+    key = models.CharField("Ключ", max_length=255)
+    fingerprint = models.CharField("Отпечаток запроса", max_length=64)
+    response_status = models.PositiveSmallIntegerField("HTTP-статус", null=True, blank=True)
+    response_body = models.JSONField("Тело ответа", null=True, blank=True)
+    created_at = models.DateTimeField("Создан", default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = "Ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        unique_together = (("scope", "key"),)
+
+    def __str__(self):
+        return f"{self.scope}: {self.key}"
+
+
+class Job(models.Model):
+    """
+    Фоновая задача в БД-очереди (см. core/jobs.py и manage.py run_jobs).
+    Пишется в той же транзакции, что и бизнес-данные, поэтому не теряется
+    при рестарте веб-воркера.
+    """
+    class Status(models.TextChoices):
+        QUEUED  = "queued",  "В очереди"
+        RUNNING = "running", "Выполняется"
+        DONE    = "done",    "Выполнена"
+        DEAD    = "dead",    "Отказ (dead letter)"
+
+    queue = models.CharField("Очередь", max_length=32, default="default")
+    task = models.CharField("Задача", max_length=100)
+    payload = models.JSONField("Параметры", default=dict, blank=True)
+    status = models.CharField("Статус", max_length=16, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Макс. попыток", default=5)
+    run_at = models.DateTimeField("Запустить не раньше", default=timezone.now)
+    locked_at = models.DateTimeField("Взята в работу", null=True, blank=True)
+    locked_by = models.CharField("Воркер", max_length=64, blank=True)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    # не больше одной задачи с таким ключом в очереди (например, один дайджест на окно)
+    dedupe_key = models.CharField("Ключ дедупликации", max_length=100, blank=True)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+    updated_at = models.DateTimeField("Обновлена", auto_now=True)
+
+    class Meta:
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+        indexes = [
+            models.Index(fields=["status", "queue", "run_at"]),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedupe_key"],
+                condition=models.Q(status="queued") & ~models.Q(dedupe_key=""),
+                name="job_unique_queued_dedupe_key",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.id} [{self.status}]"
@@ -0,0 +1,293 @@
+# core/payments.py
+"""
+Обработка уведомлений CloudPayments (check/pay/fail/refund/confirm) поверх журнала Payment.
+
+check решается синхронно. pay/confirm/fail/refund вебхук только кладёт во входящие
+(PaymentNotification) и сразу отвечает {"code": 0} — ответ CP всё равно не зависит от
+результата; смену статуса и всё, что за ней, делает воркер (задача payments.process_notification).
+
+Каждая транзакция CP — одна строка Payment (уникальна по transaction_id). Повторные
+и запоздавшие уведомления отсекаются одним индексным чтением, ДО блокировок:
+если платёж уже в том же или «более позднем» статусе — отвечаем OK и ничего не делаем.
+Всё остальное — в транзакции с select_for_update() по заказу, так что параллельные
+доставки одного события сериализуются на строке заказа.
+"""
+import logging
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.jobs import enqueue
+from core.models import Order, Payment, PaymentNotification
+from core.utils.order_events import publish_order_status
+
+logger = logging.getLogger("core.payments")
+
+# Код ответа CP: 0 — принято, 10 — неверный заказ/инвойс, 11 — неверная сумма,
+# 12 — прочее (битый запрос), 13 — платёж нельзя принять
+CP_OK, CP_BAD_AMOUNT, CP_BAD_REQUEST, CP_DECLINE = 0, 11, 12, 13
+
+# событие -> статус платежа в журнале
+EVENT_PAYMENT_STATUS = {
+    "pay": Payment.Status.PAID,
+    "confirm": Payment.Status.PAID,
+    "fail": Payment.Status.FAILED,
+    "refund": Payment.Status.REFUNDED,
+}
+
+# «Зрелость» статуса: событие, которое не двигает платёж вперёд, — дубль или пришло не по порядку
+_RANK = {
+    Payment.Status.NEW: 0,
+    Payment.Status.AUTHORIZED: 1,
+    Payment.Status.FAILED: 2,
+    Payment.Status.PAID: 2,
+    Payment.Status.REFUNDED: 3,
+    Payment.Status.CANCELED: 3,
+}
+
+
+@dataclass(frozen=True)
+class CPResult:
+    code: int
+    message: str
+
+    @property
+    def ok(self) -> bool:
+        return self.code == CP_OK
+
+
+def to_minor(amount) -> int:
+    # безопасно переводим в копейки
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1")))
+
+
+def detect_event(payload: dict) -> str:
+    """
+    Унифицируем тип события:
+      - notificationType: check|pay|fail|refund|confirm
+      - либо OperationType=Payment + Status=Completed/Authorized/Declined/Refunded/Reversed/Voided
+    Возвращаем одну из: check|pay|fail|refund|confirm|unknown
+    """
+    ntype = (payload.get("NotificationType") or payload.get("notificationType") or "").lower()
+    if ntype:
+        return ntype
+
+    operation = (payload.get("OperationType") or "").lower()
+    status = (payload.get("Status") or "").lower()
+
+    if operation == "payment":
+        if status in {"completed", "authorized"}:
+            return "pay"
+        if status in {"refunded", "reversed", "voided"}:
+            return "refund"
+        if status in {"declined", "failed"}:
+            return "fail"
+    return "unknown"
+
+
+def order_id_of(payload: dict) -> str:
+    data = payload.get("Data") or {}
+    invoice_id = payload.get("InvoiceId") or payload.get("InvoiceID") or payload.get("invoiceId")
+    return str(data.get("order_id") or invoice_id or "")
+
+
+def transaction_id_of(event: str, payload: dict) -> str:
+    """
+    Ключ строки в журнале. У refund в CP своя TransactionId, а исходный платёж —
+    в PaymentTransactionId: возврат должен двигать ту же строку, что и оплата.
+    """
+    tx = None
+    if event == "refund":
+        tx = payload.get("PaymentTransactionId") or payload.get("PaymentTransactionID")
+    tx = tx or payload.get("TransactionId") or payload.get("TransactionID")
+    return str(tx) if tx not in (None, "") else ""
+
+
+def _amount_of(payload: dict):
+    """Decimal | None, ValueError на мусоре."""
+    raw = payload.get("Amount")
+    if raw in (None, ""):
+        return None
+    try:
+        return Decimal(str(raw))
+    except Exception:
+        raise ValueError(raw)
+
+
+def is_duplicate(event: str, tx_id: str) -> bool:
+    """Одно индексное чтение: платёж уже дошёл до этого статуса или дальше."""
+    target = EVENT_PAYMENT_STATUS.get(event)
+    if not tx_id or target is None:
+        return False
+    current = Payment.objects.filter(transaction_id=tx_id).values_list("status", flat=True).first()
+    return current is not None and _RANK[current] >= _RANK[target]
+
+
+def check_cp_event(payload: dict) -> CPResult:
+    """check — синхронное решение: можно ли принять оплату по заказу."""
+    order_id = order_id_of(payload)
+    if not order_id.isdigit():
+        return CPResult(CP_BAD_REQUEST, "No order_id")
+    order = Order.objects.filter(pk=int(order_id)).only("id", "status", "total_price").first()
+    if order is None:
+        return CPResult(CP_BAD_REQUEST, "Order not found")
+    currency = (payload.get("Currency") or "").upper()
+    if currency and currency != "RUB":
+        return CPResult(CP_DECLINE, "Invalid currency")
+    try:
+        amount = _amount_of(payload)
+    except ValueError:
+        return CPResult(CP_BAD_REQUEST, "Invalid amount")
+    if amount is not None and to_minor(amount) != to_minor(order.total_price):
+        logger.warning(
+            "CP CHECK mismatch: order=%s got_minor=%s expected_minor=%s",
+            order.id, to_minor(amount), to_minor(order.total_price),
+        )
+        return CPResult(CP_BAD_AMOUNT, "Invalid amount")
+    if order.status in ("paid", "canceled"):
+        return CPResult(CP_DECLINE, "Order already closed")
+    return CPResult(CP_OK, "Check OK")
+
+
+def _next_order_status(event: str, current: str) -> str | None:
+    if event in ("pay", "confirm"):
+        return "paid" if current != "paid" else None
+    if event == "refund":
+        return "canceled" if current != "canceled" else None
+    if event == "fail":
+        # необязательно отменять, но логично
+        return "canceled" if current not in ("canceled", "paid") else None
+    return None
+
+
+def _ledger_fields(payload: dict, status: str, amount, currency: str) -> dict:
+    fields = {
+        "status": status,
+        "invoice_id": str(payload.get("InvoiceId") or payload.get("InvoiceID") or "")[:64],
+        "account_id": str(payload.get("AccountId") or payload.get("AccountID") or "")[:190],
+        "card_first_six": str(payload.get("CardFirstSix") or "")[:6],
+        "card_last_four": str(payload.get("CardLastFour") or "")[:4],
+        "card_type": str(payload.get("CardType") or "")[:32],
+        "raw_payload": payload,
+    }
+    if amount is not None:
+        fields["amount"] = amount
+    if currency:
+        fields["currency"] = currency[:3]
+    return fields
+
+
+def apply_cp_event(event: str, payload: dict) -> CPResult:
+    """
+    pay/confirm/fail/refund: записать событие в журнал Payment и перевести заказ.
+    Идемпотентно: повтор того же уведомления ничего не меняет и отвечает OK.
+    """
+    if event == "check":
+        return check_cp_event(payload)
+    if event not in EVENT_PAYMENT_STATUS:
+        logger.warning("CP webhook: unknown/ignored event=%s", event)
+        return CPResult(CP_OK, "Ignored")
+
+    label = f"{event.capitalize()} OK"
+    tx_id = transaction_id_of(event, payload)
+    if is_duplicate(event, tx_id):
+        logger.debug("CP %s duplicate: tx=%s", event, tx_id)
+        return CPResult(CP_OK, label)
+
+    order_id = order_id_of(payload)
+    if not order_id.isdigit():
+        return CPResult(CP_BAD_REQUEST, "No order_id")
+    try:
+        amount = _amount_of(payload)
+    except ValueError:
+        return CPResult(CP_BAD_REQUEST, "Invalid amount")
+    currency = (payload.get("Currency") or "").upper()
+    target = EVENT_PAYMENT_STATUS[event]
+
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(pk=int(order_id)).first()
+        if order is None:
+            return CPResult(CP_BAD_REQUEST, "Order not found")
+
+        if event == "pay" and amount is not None and to_minor(amount) != to_minor(order.total_price):
+            logger.warning(
+                "CP PAY mismatch: order=%s got_minor=%s expected_minor=%s",
+                order.id, to_minor(amount), to_minor(order.total_price),
+            )
+            return CPResult(CP_BAD_AMOUNT, "Invalid amount")
+
+        if tx_id:
+            # под блокировкой заказа: параллельный дубль уже прошёл и записал платёж?
+            payment = Payment.objects.filter(transaction_id=tx_id).first()
+            if payment is not None and _RANK[payment.status] >= _RANK[target]:
+                return CPResult(CP_OK, label)
+            # сумма возврата — не сумма платежа, в журнале оставляем исходную
+            fields = _ledger_fields(payload, target, None if event == "refund" else amount, currency)
+            if payment is None:
+                fields.setdefault("amount", order.total_price)
+                Payment.objects.create(order=order, transaction_id=tx_id, **fields)
+            else:
+                Payment.objects.filter(pk=payment.pk).update(updated_at=timezone.now(), **fields)
+
+        new_status = _next_order_status(event, order.status)
+        if new_status:
+            order.status = new_status
+            order.save(update_fields=["status"])
+            publish_order_status(order.id, order.status)
+
+    return CPResult(CP_OK, label)
+
+
+# ---------- Входящие (inbox) ----------
+
+PROCESS_TASK = "payments.process_notification"
+
+
+def receive_cp_event(event: str, payload: dict) -> CPResult:
+    """
+    Точка входа вебхука после проверки подписи. check — сразу, остальное — во входящие
+    и задачу в той же транзакции. Повтор уведомления (тот же event + TransactionId)
+    упирается в уникальность и новую задачу не ставит.
+    """
+    if event == "check":
+        return check_cp_event(payload)
+    if event not in EVENT_PAYMENT_STATUS:
+        logger.warning("CP webhook: unknown/ignored event=%s", event)
+        return CPResult(CP_OK, "Ignored")
+
+    tx_id = transaction_id_of(event, payload)
+    if tx_id and PaymentNotification.objects.filter(event=event, transaction_id=tx_id).exists():
+        # повтор доставки — одно индексное чтение, без транзакции
+        logger.debug("CP %s already received: tx=%s", event, tx_id)
+        return CPResult(CP_OK, "Accepted")
+
+    defaults = {"order_id": order_id_of(payload)[:64], "payload": payload}
+    with transaction.atomic():
+        if tx_id:
+            note, created = PaymentNotification.objects.get_or_create(
+                event=event, transaction_id=tx_id, defaults=defaults,
+            )
+        else:
+            note, created = PaymentNotification.objects.create(event=event, **defaults), True
+        if created:  # параллельный дубль мог успеть между exists() и вставкой
+            enqueue(PROCESS_TASK, notification_id=note.id)
+    return CPResult(CP_OK, "Accepted")
+
+
+def process_notification(notification_id: int) -> None:
+    """Воркер: применить уведомление из входящих. Исключение — ретрай задачи очередью."""
+    note = PaymentNotification.objects.filter(pk=notification_id).first()
+    if note is None or note.status != PaymentNotification.Status.RECEIVED:
+        return
+    result = apply_cp_event(note.event, note.payload)
+    if not result.ok:
+        logger.warning("CP %s rejected: order=%s tx=%s code=%s %s",
+                       note.event, note.order_id, note.transaction_id, result.code, result.message)
+    PaymentNotification.objects.filter(pk=note.pk).update(
+        status=PaymentNotification.Status.PROCESSED if result.ok else PaymentNotification.Status.REJECTED,
+        result_code=result.code,
+        result_message=result.message[:255],
+        processed_at=timezone.now(),
+    )
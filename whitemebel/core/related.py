@@ -0,0 +1,182 @@
+# core/related.py
+"""
+Автоматические related_by_color и related_products.
+
+    stats = compute_related()                      # весь каталог
+    stats = compute_related(since=timezone.now() - timedelta(days=1))  # только изменившееся
+
+Кандидаты — активные товары той же категории. Считается блоками по категории:
+
+- похожесть: косинус по one-hot характеристикам (опции AttributeOption) плюс близость
+  габаритов exp(-Σ|ln a - ln b|) по width/height/depth — матрицы NumPy, без цикла по парам;
+- «семейство»: та же категория и то же название без названий цветов
+  («Шкаф Марк белый» / «Шкаф Марк дуб сонома»). Из семейства с другим цветом берутся
+  related_by_color (по одному лучшему на цвет), а в related_products семейство не попадает —
+  там «другие товары», а не тот же в другом цвете.
+
+Списки пересчитанных товаров перезаписываются целиком (ручные правки из админки тоже):
+delete + bulk_create в through-таблицы, пачка — одна транзакция. Строки вставляются
+лучшими вперёд, и карточка (ProductDetailSerializer) читает их в порядке id through-таблицы.
+
+Инкрементально (since) пересчитываются категории, где с тех пор менялся хоть один товар:
+список товара зависит от соседей по категории, так что меньше брать нельзя. Правки
+характеристик товара и переименование цвета тоже поднимают Product.updated_at (touch_products).
+Товар, переехавший в другую категорию, из списков старой уйдёт при полном прогоне.
+"""
+import logging
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+
+from core.models import Color, Product, ProductAttributeValue
+from core.utils.catalog_cache import bump_catalog_version_on_commit
+
+log = logging.getLogger(__name__)
+
+SIZE_FIELDS = ("width", "height", "depth")
+SIZE_WEIGHT = 0.3   # доля близости габаритов в итоговой оценке (остальное — характеристики)
+CHUNK_CELLS = 4_000_000  # строк × товаров категории за раз: матрица разниц габаритов — ×3×4 байта ≈ 48 МБ
+
+
+def family_key(title: str, color_re) -> str:
+    stem = title.lower().replace("ё", "е")
+    if color_re is not None:
+        stem = color_re.sub(" ", stem)
+    return " ".join(re.findall(r"\w+", stem))
+
+
+def _color_re():
+    names = sorted({c.lower().replace("ё", "е") for c in Color.objects.values_list("name", flat=True)},
+                   key=len, reverse=True)
+    names = [n for n in names if n.strip()]
+    return re.compile(r"\b(?:" + "|".join(map(re.escape, names)) + r")\b") if names else None
+
+
+def _option_matrix(ids: list[int], options: dict[int, list[int]]) -> np.ndarray:
+    """one-hot по опциям, которые встречаются в блоке; строки нормированы под косинус."""
+    columns = {}
+    for pid in ids:
+        for opt in options.get(pid, ()):
+            columns.setdefault(opt, len(columns))
+    x = np.zeros((len(ids), max(1, len(columns))), dtype=np.float32)
+    for row, pid in enumerate(ids):
+        for opt in options.get(pid, ()):
+            x[row, columns[opt]] = 1.0
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.where(norms > 0, norms, 1.0)
+
+
+def _size_matrix(rows: list[dict]) -> np.ndarray:
+    """ln габаритов; неизвестный или нулевой — NaN (в близости не участвует)."""
+    sizes = np.array([[float(r[f] or 0) for f in SIZE_FIELDS] for r in rows], dtype=np.float32)
+    with np.errstate(divide="ignore"):
+        return np.where(sizes > 0, np.log(sizes), np.nan)
+
+
+def _scores(x, logs, start, stop, size_weight):
+    """Оценки строк [start, stop) против всего блока: (stop-start) × n."""
+    cos = x[start:stop] @ x.T
+    diff = np.abs(logs[start:stop, None, :] - logs[None, :, :])   # b × n × 3
+    known = ~np.isnan(diff)
+    dist = np.where(known, diff, 0).sum(axis=2)
+    # близость считаем, только если у обоих известны все габариты
+    prox = np.where(known.all(axis=2), np.exp(-dist), 0.0)
+    return (1 - size_weight) * cos + size_weight * prox
+
+
+def _block(rows, options, color_re, *, limit, color_limit, size_weight):
+    """Все товары одной категории -> {id: [похожие]}, {id: [другие цвета]}."""
+    ids = [r["id"] for r in rows]
+    n = len(ids)
+    families = [family_key(r["title"], color_re) for r in rows]
+    colors = np.array([r["color_id"] or 0 for r in rows])
+    family_idx = defaultdict(list)
+    for i, fam in enumerate(families):
+        family_idx[fam].append(i)
+    x = _option_matrix(ids, options)
+    logs = _size_matrix(rows)
+
+    similar, by_color = {}, {}
+    chunk = max(1, CHUNK_CELLS // n)
+    for start in range(0, n, chunk):
+        stop = min(n, start + chunk)
+        scores = _scores(x, logs, start, stop, size_weight)
+        for i in range(start, stop):
+            row = scores[i - start]
+            members = family_idx[families[i]]
+
+            # другие цвета того же семейства: лучший по оценке на каждый цвет
+            if color_limit and colors[i] and len(members) > 1:
+                best = {}
+                for j in sorted(members, key=lambda j: (-row[j], ids[j])):
+                    if colors[j] and colors[j] != colors[i] and colors[j] not in best:
+                        best[colors[j]] = ids[j]
+                by_color[ids[i]] = list(best.values())[:color_limit]
+
+            # похожие: всё, кроме себя и своего семейства
+            if limit and n > 1:
+                masked = row.copy()
+                masked[members] = -np.inf
+                k = min(limit, n - 1)
+                top = [j for j in np.argpartition(-masked, k - 1)[:k] if masked[j] > 0]
+                top.sort(key=lambda j: (-masked[j], ids[j]))
+                similar[ids[i]] = [ids[j] for j in top]
+    return similar, by_color
+
+
+def _write(field: str, lists: dict[int, list[int]]) -> int:
+    through = Product._meta.get_field(field).remote_field.through
+    through.objects.filter(from_product_id__in=list(lists)).delete()
+    objs = [through(from_product_id=pid, to_product_id=other)
+            for pid, others in lists.items() for other in others]
+    through.objects.bulk_create(objs, batch_size=5000)
+    return len(objs)
+
+
+def compute_related(*, since=None, limit: int = 8, color_limit: int = 8,
+                    size_weight: float = SIZE_WEIGHT, dry_run: bool = False, progress=None) -> Counter:
+    products = Product.objects.filter(is_active=True)
+    if since is not None:
+        dirty = set(Product.objects.filter(updated_at__gte=since).values_list("category_id", flat=True))
+        if not dirty:
+            return Counter()
+        cond = Q(category_id__in=[c for c in dirty if c is not None])
+        if None in dirty:
+            cond |= Q(category__isnull=True)
+        products = products.filter(cond)
+
+    blocks = defaultdict(list)
+    for row in products.order_by("id").values("id", "title", "category_id", "color_id", *SIZE_FIELDS):
+        blocks[row["category_id"]].append(row)
+    options = defaultdict(list)
+    attr_values = ProductAttributeValue.objects.filter(option__isnull=False)
+    if since is not None:
+        attr_values = attr_values.filter(product__in=products)
+    for pid, opt in attr_values.values_list("product_id", "option_id").iterator(chunk_size=10000):
+        options[pid].append(opt)
+
+    color_re = _color_re()
+    stats = Counter()
+    for done, (category_id, rows) in enumerate(blocks.items(), 1):
+        similar, by_color = _block(rows, options, color_re, limit=limit,
+                                   color_limit=color_limit, size_weight=size_weight)
+        # у товаров блока без пары список тоже перезаписываем — пустым
+        similar = {r["id"]: similar.get(r["id"], []) for r in rows}
+        by_color = {r["id"]: by_color.get(r["id"], []) for r in rows}
+        stats["products"] += len(rows)
+        stats["categories"] += 1
+        if dry_run:
+            stats["related_products"] += sum(map(len, similar.values()))
+            stats["related_by_color"] += sum(map(len, by_color.values()))
+        else:
+            with transaction.atomic():
+                stats["related_products"] += _write("related_products", similar)
+                stats["related_by_color"] += _write("related_by_color", by_color)
+                bump_catalog_version_on_commit()
+        if progress:
+            progress(done, len(blocks), stats)
+    log.info("related: %s", dict(stats))
+    return stats
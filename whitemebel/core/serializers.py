@@ -6,6 +6,7 @@ from decimal import Decimal
 from core.models import DeliveryRegion, DeliveryDiscount, OneClickRequest
 from core.models import ContactRequest
 from core.utils.phone import normalize_ru_phone
+from core.utils.renditions import image_set
 from core.models import (
     MainSlider, Product, ProductImage, Tag, Color, Category,
     ProductAttributeValue
@@ -104,17 +105,52 @@ class FiltersResponseSerializer(serializers.Serializer):
 
 
 
+class ImageSourceSerializer(serializers.Serializer):
+    type = serializers.CharField()    # image/avif | image/webp
+    srcset = serializers.CharField()  # "url 320w, url 640w, ..."
+
+
+class ImageSetSerializer(serializers.Serializer):
+    src = serializers.URLField()
+    width = serializers.IntegerField(allow_null=True)
+    height = serializers.IntegerField(allow_null=True)
+    placeholder = serializers.CharField(allow_blank=True)  # data:image/webp;base64,… ~20px, пусто — ещё не готов
+    sources = ImageSourceSerializer(many=True)
+
+
+@extend_schema_field(ImageSetSerializer(allow_null=True))
+class ImageSetField(serializers.Field):
+    """
+    Картинка под <picture>/srcset: оригинал + ресайзы по форматам (core/utils/renditions.py).
+    Работает с моделями на ImageRenditionsMixin.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, obj):
+        req = self.context.get("request")
+        build_url = req.build_absolute_uri if req else (lambda url: url)
+        return image_set(
+            obj.image, obj.image_renditions, obj.image_width, obj.image_height, build_url,
+            placeholder=obj.image_placeholder,
+        )
+
+
 class ProductListSerializer(serializers.ModelSerializer):
     color_name = serializers.CharField(source="color.name", read_only=True)
     color_hex = serializers.CharField(source="color.hex_code", read_only=True)
     category_slug = serializers.CharField(source="category.slug", read_only=True)
     discount_percent = serializers.IntegerField(read_only=True)
+    image_set = ImageSetField()
 
     class Meta:
         model = Product
         fields = (
             "id", "title", "slug", "price", "discount_price", "discount_percent",
-            "sku", "image", "is_active", "stock",
+            "sku", "image", "image_set", "is_active", "stock",
             "width", "height", "depth",
             "color", "color_name", "color_hex",
             "category", "category_slug",
@@ -133,9 +169,11 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    image_set = ImageSetField()
+
     class Meta:
         model = ProductImage
-        fields = ("id", "image", "alt_text")
+        fields = ("id", "image", "image_set", "alt_text")
 
 class TagBriefSerializer(serializers.ModelSerializer):
     class Meta:
@@ -178,11 +216,13 @@ class ProductDetailSerializer(serializers.ModelSerializer):
     color = ColorBriefSerializer(read_only=True)
     category = CategoryCrumbSerializer(read_only=True)
     breadcrumbs = serializers.SerializerMethodField()
+    image_set = ImageSetField()
     images = ProductImageSerializer(many=True, read_only=True)
     tags = TagBriefSerializer(many=True, read_only=True)
     attributes = AttributeKVSerializer(many=True, read_only=True)
     related_products = serializers.SerializerMethodField()
     related_by_color = serializers.SerializerMethodField()
+    frequently_bought_together = serializers.SerializerMethodField()
     discount_percent = serializers.IntegerField(read_only=True)
     effective_price = serializers.SerializerMethodField()
     in_stock = serializers.SerializerMethodField()
@@ -195,9 +235,9 @@ class ProductDetailSerializer(serializers.ModelSerializer):
             "sku", "is_active", "in_stock", "stock",
             "width", "height", "depth",
             "color", "category", "breadcrumbs",
-            "image", "images", "tags", "attributes",
+            "image", "image_set", "images", "tags", "attributes",
             "created_at", "updated_at",
-            "related_products", "related_by_color",
+            "related_products", "related_by_color", "frequently_bought_together",
         )
 
     def get_effective_price(self, obj):
@@ -221,19 +261,40 @@ class ProductDetailSerializer(serializers.ModelSerializer):
         except Exception:
             return default
 
-    def get_related_products(self, obj):
-        limit = self._limit("related_limit", 8)
-        qs = obj.related_products.all()
-        if limit:
-            qs = qs[:limit]
+    def _related(self, obj, field, limit_key):
+        limit = self._limit(limit_key, 8)
+        if not limit:  # include_related=0 или явный 0
+            return []
+        # compute_related пишет строки through-таблицы по убыванию оценки, так что порядок id в ней —
+        # это ранг; без order_by Postgres вернул бы любые limit из top-K, а не лучшие
+        through = Product._meta.get_field(field).remote_field.through._meta.db_table
+        qs = (
+            getattr(obj, field).filter(is_active=True)
+            .select_related("color", "category")
+            .prefetch_related("tags")
+            .extra(order_by=[f"{through}.id"])[:limit]
+        )
         # карточки ТОЧНО как в /api/products
         return ProductListSerializer(qs, many=True, context=self.context).data
 
+    def get_related_products(self, obj):
+        return self._related(obj, "related_products", "related_limit")
+
     def get_related_by_color(self, obj):
-        limit = self._limit("related_by_color_limit", 8)
-        qs = obj.related_by_color.all()
-        if limit:
-            qs = qs[:limit]
+        return self._related(obj, "related_by_color", "related_by_color_limit")
+
+    @extend_schema_field(ProductListSerializer(many=True))
+    def get_frequently_bought_together(self, obj):
+        # посчитано заранее (manage.py compute_copurchases) — один запрос по индексу (product, rank)
+        limit = self._limit("bought_together_limit", 8)
+        if not limit:
+            return []
+        qs = (
+            Product.objects.filter(is_active=True, co_purchased_in__product=obj)
+            .select_related("color", "category")
+            .prefetch_related("tags")
+            .order_by("co_purchased_in__rank")[:limit]
+        )
         return ProductListSerializer(qs, many=True, context=self.context).data
     
     # core/serializers.py (добавь в конец рядом с ProductListSerializer)
@@ -251,10 +312,11 @@ class ProductListPageSerializer(serializers.Serializer):
 # core/serializers.py
 class MainSliderSerializer(serializers.ModelSerializer):
     image_url = serializers.SerializerMethodField()
+    image_set = ImageSetField()
 
     class Meta:
         model = MainSlider
-        fields = ("id", "title", "link", "order", "is_active", "image", "image_url")
+        fields = ("id", "title", "link", "order", "is_active", "image", "image_url", "image_set")
 
     def get_image_url(self, obj):
         req = self.context.get("request")
@@ -816,4 +878,27 @@ class OneClickRequestSerializer(serializers.ModelSerializer):
             product=product,
             comment=validated.get("comment", ""),
         )
-        return instance
\ No newline at end of file
+        return instance
+
+class StockDeltaSerializer(serializers.Serializer):
+    # только для схемы: разбирает core.stock_feed.parse_delta (serializer на 20k строк — секунды)
+    sku = serializers.CharField(max_length=64)
+    stock = serializers.IntegerField(min_value=0, required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    discount_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+
+
+class StockFeedRequestSerializer(serializers.Serializer):
+    items = StockDeltaSerializer(many=True)
+
+
+class StockFeedResultSerializer(serializers.Serializer):
+    sku = serializers.CharField(allow_null=True)
+    status = serializers.ChoiceField(choices=["updated", "unchanged", "not_found", "invalid"])
+    error = serializers.CharField(required=False)
+
+
+class StockFeedResponseSerializer(serializers.Serializer):
+    received = serializers.IntegerField()
+    counts = serializers.DictField(child=serializers.IntegerField())
+    results = StockFeedResultSerializer(many=True)
@@ -0,0 +1,212 @@
+# core/stock_feed.py
+"""
+Фид остатков и цен из учётки: тысячи дельт {sku, stock, price, discount_price} за раз.
+
+    results = apply_stock_deltas([{"sku": "A-1", "stock": 3}, {"sku": "B-2", "price": "12990"}])
+
+Поля, которых нет в дельте, не трогаются; "discount_price": null — снять скидку.
+Скидка не дешевле цены (новой из дельты или текущей в БД) — строка invalid; если новая
+цена опустилась до текущей скидки или ниже, скидка снимается — как в импорте каталога.
+Пишется мимо Product.save() (картинки, слаги и т.п. тут ни при чём): на Postgres — один
+UPDATE … FROM (VALUES …) на пачку, который заодно пропускает строки без изменений,
+на остальных базах — bulk_update. Версия каталога поднимается один раз на пачку.
+
+Результат — по строке на каждую входную дельту, в том же порядке:
+    {"sku", "status": "updated" | "unchanged" | "not_found" | "invalid", "error"?}
+"""
+import logging
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import Product
+from core.utils.catalog_cache import bump_catalog_version_on_commit
+
+log = logging.getLogger(__name__)
+
+FIELDS = ("stock", "price", "discount_price")
+MAX_PRICE = Decimal("99999999.99")  # DecimalField(max_digits=10, decimal_places=2)
+MAX_STOCK = 2147483647  # PositiveIntegerField
+
+
+class DeltaError(ValueError):
+    pass
+
+
+def _price(value, field, *, nullable=False):
+    if value in (None, ""):
+        if nullable:
+            return None
+        raise DeltaError(f"{field}: пусто")
+    try:
+        price = Decimal(str(value).replace(" ", "").replace(",", ".")).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise DeltaError(f"{field}: не число «{value}»")
+    if not 0 < price <= MAX_PRICE:
+        raise DeltaError(f"{field}: вне диапазона «{value}»")
+    return price
+
+
+def parse_delta(raw) -> dict:
+    if not isinstance(raw, dict):
+        raise DeltaError("ожидался объект")
+    sku = str(raw.get("sku") or "").strip()
+    if not sku or len(sku) > 64:
+        raise DeltaError("sku: пусто или длиннее 64")
+    delta = {"sku": sku}
+    if raw.get("stock") not in (None, ""):
+        try:
+            value = Decimal(str(raw["stock"]))
+        except InvalidOperation:
+            raise DeltaError(f"stock: не число «{raw['stock']}»")
+        if not value.is_finite() or value != value.to_integral_value():  # NaN, Infinity, 2.5
+            raise DeltaError(f"stock: не целое «{raw['stock']}»")
+        stock = int(value)
+        if not 0 <= stock <= MAX_STOCK:
+            raise DeltaError(f"stock: вне диапазона «{raw['stock']}»")
+        delta["stock"] = stock
+    if raw.get("price") not in (None, ""):
+        delta["price"] = _price(raw["price"], "price")
+    if "discount_price" in raw:
+        delta["discount_price"] = _price(raw["discount_price"], "discount_price", nullable=True)
+    if len(delta) == 1:
+        raise DeltaError("нет ни stock, ни price, ни discount_price")
+    _check_discount(delta, delta.get("price"))
+    return delta
+
+
+def _check_discount(delta: dict, price) -> None:
+    discount = delta.get("discount_price")
+    if discount is not None and price is not None and discount >= price:
+        raise DeltaError(f"discount_price: {discount} не меньше цены {price}")
+
+
+# ---------- запись пачки ----------
+
+def _update_values(deltas: list[dict]) -> set[str]:
+    """Postgres: один UPDATE … FROM (VALUES …). Флаг set_<поле> — есть ли поле в дельте."""
+    qn = connection.ops.quote_name
+    columns = {f: qn(Product._meta.get_field(f).column) for f in (*FIELDS, "sku", "updated_at")}
+    sets = ", ".join(
+        f"{columns[f]} = CASE WHEN v.set_{f} THEN v.{f} ELSE p.{columns[f]} END" for f in FIELDS
+    )
+    changed = " OR ".join(
+        f"(v.set_{f} AND p.{columns[f]} IS DISTINCT FROM v.{f})" for f in FIELDS
+    )
+    row = "(%s, %s::integer, %s, %s::numeric, %s, %s::numeric, %s)"
+    sql = (
+        f"UPDATE {qn(Product._meta.db_table)} AS p SET {sets}, {columns['updated_at']} = %s "
+        f"FROM (VALUES {', '.join([row] * len(deltas))}) "
+        f"AS v(sku, stock, set_stock, price, set_price, discount_price, set_discount_price) "
+        f"WHERE p.{columns['sku']} = v.sku AND ({changed}) "
+        f"RETURNING p.{columns['sku']}"
+    )
+    params = [timezone.now()]
+    for d in deltas:
+        params.append(d["sku"])
+        for f in FIELDS:
+            params += [d.get(f), f in d]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return {sku for (sku,) in cursor.fetchall()}
+
+
+def _update_orm(deltas: list[dict]) -> set[str]:
+    by_sku = {d["sku"]: d for d in deltas}
+    now = timezone.now()
+    changed = []
+    for p in Product.objects.filter(sku__in=by_sku).only("pk", "sku", *FIELDS):
+        d = by_sku[p.sku]
+        diff = [f for f in FIELDS if f in d and getattr(p, f) != d[f]]
+        if diff:
+            for f in diff:
+                setattr(p, f, d[f])
+            p.updated_at = now
+            changed.append(p)
+    Product.objects.bulk_update(changed, [*FIELDS, "updated_at"])
+    return {p.sku for p in changed}
+
+
+def _check_prices(deltas: list[dict]) -> dict[str, str]:
+    """
+    Сверить скидки с текущими ценами: sku -> ошибка для дельт со скидкой без цены, которая
+    не меньше цены в БД. Дельте с новой ценой не выше текущей скидки дописывает
+    discount_price=None. Несуществующие sku пропускает — они станут not_found.
+    """
+    need = [d["sku"] for d in deltas if ("price" in d) != ("discount_price" in d)]
+    if not need:
+        return {}
+    current = {sku: (price, discount) for sku, price, discount in
+               Product.objects.filter(sku__in=need).values_list("sku", "price", "discount_price")}
+    errors = {}
+    for d in deltas:
+        if d["sku"] not in current:
+            continue
+        price, discount = current[d["sku"]]
+        if "price" not in d:
+            try:
+                _check_discount(d, price)
+            except DeltaError as e:
+                errors[d["sku"]] = str(e)
+        elif "discount_price" not in d and discount is not None and discount >= d["price"]:
+            d["discount_price"] = None
+    return errors
+
+
+def _apply_batch(deltas: list[dict]) -> tuple[set[str], set[str]]:
+    """Вернёт (обновлённые sku, существующие sku)."""
+    if connection.vendor == "postgresql":
+        updated = _update_values(deltas)
+    else:
+        updated = _update_orm(deltas)
+    rest = [d["sku"] for d in deltas if d["sku"] not in updated]
+    found = updated | set(Product.objects.filter(sku__in=rest).values_list("sku", flat=True)) if rest else updated
+    return updated, found
+
+
+def apply_stock_deltas(items, *, batch_size: int | None = None) -> list[dict]:
+    batch_size = max(1, batch_size or settings.STOCK_FEED_BATCH)
+    results: list[dict] = []
+    deltas: dict[str, dict] = {}  # sku -> дельта; повтор sku — поля сливаются, позднее побеждает
+    errors: dict[str, str] = {}   # sku -> ошибка, найденная после слияния
+    for raw in items:
+        try:
+            delta = parse_delta(raw)
+        except DeltaError as e:
+            sku = (str(raw.get("sku") or "")[:64] or None) if isinstance(raw, dict) else None
+            results.append({"sku": sku, "status": "invalid", "error": str(e)})
+            continue
+        deltas.setdefault(delta["sku"], {}).update(delta)
+        results.append({"sku": delta["sku"], "status": None})
+    # цена и скидка могли прийти разными строками
+    for sku, delta in deltas.items():
+        try:
+            _check_discount(delta, delta.get("price"))
+        except DeltaError as e:
+            errors[sku] = str(e)
+
+    status = {}
+    skus = [sku for sku in deltas if sku not in errors]
+    for start in range(0, len(skus), batch_size):
+        part = [deltas[sku] for sku in skus[start:start + batch_size]]
+        with transaction.atomic():
+            errors.update(_check_prices(part))
+            part = [d for d in part if d["sku"] not in errors]
+            updated, found = _apply_batch(part) if part else (set(), set())
+            if updated:
+                bump_catalog_version_on_commit()
+        for d in part:
+            sku = d["sku"]
+            status[sku] = "updated" if sku in updated else "unchanged" if sku in found else "not_found"
+
+    for r in results:
+        if r["status"] is None:
+            if r["sku"] in errors:
+                r["status"], r["error"] = "invalid", errors[r["sku"]]
+            else:
+                r["status"] = status[r["sku"]]
+    log.info("stock feed: %s", dict(Counter(r["status"] for r in results)))
+    return results
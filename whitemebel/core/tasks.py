@@ -0,0 +1,54 @@
+# core/tasks.py
+"""Фоновые задачи (регистрируются при старте приложения, см. CoreConfig.ready)."""
+import logging
+
+from core.catalog_import import FETCH_IMAGE_TASK, fetch_catalog_image
+from core.emails import (
+    ADMIN_DIGEST_TASK,
+    admin_digest_enabled,
+    load_order_for_email,
+    schedule_admin_digest,
+    send_admin_digest,
+    send_order_notifications,
+)
+from core.images import PROCESS_TASK as IMAGE_PROCESS_TASK, process_stored_image
+from core.jobs import task
+from core.payments import PROCESS_TASK, process_notification
+
+log = logging.getLogger(__name__)
+
+
+@task("orders.send_notifications", queue="mail", max_attempts=6)
+def send_order_notifications_task(order_id: int) -> None:
+    order = load_order_for_email(order_id)
+    if order is None:
+        log.warning("orders.send_notifications: order %s not found", order_id)
+        return
+    if admin_digest_enabled():
+        # админам — сводкой; ставим до отправки, ретрай задачи дубля не создаст (dedupe_key)
+        schedule_admin_digest()
+    send_order_notifications(order)
+
+
+@task(ADMIN_DIGEST_TASK, queue="mail", max_attempts=6)
+def send_admin_digest_task() -> None:
+    n = send_admin_digest()
+    log.info("orders.admin_digest: %s orders", n)
+
+
+@task(PROCESS_TASK, queue="default", max_attempts=8)
+def process_payment_notification_task(notification_id: int) -> None:
+    # статус заказа, журнал Payment, NOTIFY для long-poll'а страниц оплаты — см. core/payments.py
+    process_notification(notification_id)
+
+
+@task(IMAGE_PROCESS_TASK, queue="default", max_attempts=4)
+def process_image_task(model: str, pk: int, file: str) -> None:
+    result = process_stored_image(model, pk, file)
+    log.info("images.process: %s #%s %s -> %s", model, pk, file, result)
+
+
+@task(FETCH_IMAGE_TASK, queue="default", max_attempts=5)
+def fetch_catalog_image_task(product_id: int, source: str, position: int, root: str = "") -> None:
+    result = fetch_catalog_image(product_id, source, position, root)
+    log.info("catalog.fetch_image: product #%s %s -> %s", product_id, source, result)
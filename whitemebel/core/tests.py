@@ -1,3 +1,717 @@
-from django.test import TestCase
+import os
+import smtplib
+import tempfile
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail.backends.locmem import EmailBackend as LocMemBackend
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+
+from core.catalog_import import CatalogImporter, fetch_catalog_image, resolve_image_source
+from core.copurchase import compute_copurchases
+from core.jobs import backoff, claim, enqueue, run_job, task
+from core.management.commands.reconcile_payments import load_report
+from core.models import (
+    AttributeOption, Category, Color, CoPurchase, IdempotencyKey, Job, Order, OrderItem, Payment,
+    PaymentNotification, Product, ProductAttribute, ProductAttributeValue, ProductImage,
+)
+from core.payments import (
+    CP_BAD_AMOUNT, CP_OK, PROCESS_TASK, apply_cp_event, process_notification, receive_cp_event,
+)
+from core.related import compute_related
+from core.stock_feed import DeltaError, apply_stock_deltas, parse_delta
+from core.utils import catalog_cache, order_cache
+from core.utils.idempotency import IDEMPOTENCY_HEADER, run_idempotent
+from core.utils.mailer import PooledMailer
+from core.utils.slug import SlugAllocator, ascii_slug
+
+
+def make_order(**kwargs):
+    fields = {"full_name": "Иван", "phone": "+79990000000", "email": "ivan@example.com", "city": "Москва",
+              "address": "ул. Ленина, 1", "payment_method": "online", "delivery_type": "delivery",
+              "total_price": Decimal("1000")}
+    fields.update(kwargs)
+    return Order.objects.create(**fields)
+
+
+class ResolveImageSourceTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.realpath(tmp.name)
+        os.makedirs(os.path.join(self.root, "sofa"))
+
+    def test_url(self):
+        url = "https://cdn.example.com/a.jpg"
+        self.assertEqual(resolve_image_source(url), url)
+        self.assertEqual(resolve_image_source(url, self.root), url)
+
+    def test_relative_inside_root(self):
+        self.assertEqual(resolve_image_source("sofa/1.jpg", self.root), os.path.join(self.root, "sofa", "1.jpg"))
+        self.assertEqual(resolve_image_source("sofa/../2.jpg", self.root), os.path.join(self.root, "2.jpg"))
+
+    def test_traversal_rejected(self):
+        for ref in ("../../etc/hostname", "sofa/../../etc/passwd", ".."):
+            with self.subTest(ref=ref), self.assertRaises(ValueError):
+                resolve_image_source(ref, self.root)
+
+    def test_symlink_outside_rejected(self):
+        os.symlink("/etc", os.path.join(self.root, "etc"))
+        with self.assertRaises(ValueError):
+            resolve_image_source("etc/hostname", self.root)
+
+    def test_absolute_rejected(self):
+        for ref in ("/etc/hostname", os.path.join(self.root, "sofa", "1.jpg")):
+            with self.subTest(ref=ref), self.assertRaises(ValueError):
+                resolve_image_source(ref, self.root)
+
+    def test_local_without_images_dir_rejected(self):
+        for ref in ("sofa/1.jpg", "/etc/hostname"):
+            with self.subTest(ref=ref), self.assertRaises(ValueError):
+                resolve_image_source(ref)
+
+    def test_other_schemes_rejected(self):
+        for ref in ("file:///etc/hostname", "ftp://example.com/a.jpg"):
+            with self.subTest(ref=ref), self.assertRaises(ValueError):
+                resolve_image_source(ref, self.root)
+
+
+class FetchCatalogImageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        images = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(images.cleanup)
+        self.media = media.name
+        self.root = os.path.realpath(images.name)
+        settings = override_settings(MEDIA_ROOT=self.media)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.product = Product.objects.create(title="Диван", slug="divan", sku="D-1", price=Decimal("100"))
+
+    def _stored(self):
+        return [f for _, _, files in os.walk(self.media) for f in files]
+
+    def test_outside_root_not_read(self):
+        for source in ("/etc/hostname", os.path.join(self.root, "..", "x.jpg")):
+            with self.subTest(source=source):
+                self.assertEqual(fetch_catalog_image(self.product.pk, source, 1, self.root), "failed")
+                self.assertEqual(fetch_catalog_image(self.product.pk, source, 1), "failed")
+        self.assertFalse(ProductImage.objects.exists())
+        self.assertEqual(self._stored(), [])
+
+    def test_non_image_not_stored(self):
+        path = os.path.join(self.root, "notes.jpg")
+        with open(path, "wb") as f:
+            f.write(b"not an image at all")
+        self.assertEqual(fetch_catalog_image(self.product.pk, path, 0, self.root), "failed")
+        self.product.refresh_from_db()
+        self.assertFalse(self.product.image)
+        self.assertEqual(self._stored(), [])
+
+
+class CatalogImporterTests(TestCase):
+    def _run(self, rows):
+        importer = CatalogImporter(images=False)
+        importer.run(rows)
+        return importer
+
+    def test_partial_rows_update_existing(self):
+        self._run([{"sku": "T-1", "title": "Стол", "price": "100", "discount_price": "90", "stock": 3}])
+        importer = self._run([{"sku": "T-1", "stock": 7}])
+        self.assertEqual(importer.errors, [])
+        p = Product.objects.get(sku="T-1")
+        self.assertEqual((p.title, p.price, p.discount_price, p.stock), ("Стол", Decimal("100"), Decimal("90"), 7))
+
+    def test_new_sku_needs_title_and_price(self):
+        importer = self._run([{"sku": "T-2", "stock": 5}])
+        self.assertEqual(len(importer.errors), 1)
+        self.assertFalse(Product.objects.filter(sku="T-2").exists())
+
+    def test_duplicate_skus_merged(self):
+        self._run([
+            {"sku": "T-3", "title": "Шкаф", "price": "200", "discount_price": "150"},
+            {"sku": "T-3", "stock": 4},
+            {"sku": "T-3", "price": "120"},
+        ])
+        p = Product.objects.get(sku="T-3")
+        # скидка 150 не дешевле итоговой цены 120 — снимается
+        self.assertEqual((p.title, p.price, p.discount_price, p.stock), ("Шкаф", Decimal("120"), None, 4))
+
+
+class SlugAllocatorTests(SimpleTestCase):
+    def test_no_trailing_dash_after_truncation(self):
+        alloc = SlugAllocator(max_length=10)
+        slug = alloc.allocate("abcdefghi jkl")  # abcdefghi-jkl -> abcdefghi-
+        self.assertEqual(slug, "abcdefghi")
+        self.assertEqual(ascii_slug(slug), slug)
+
+    def test_no_trailing_dash_before_suffix(self):
+        alloc = SlugAllocator(["abcdefg-ij"], max_length=10)
+        slug = alloc.allocate("abcdefg ij")  # abcdefg- + -2
+        self.assertEqual(slug, "abcdefg-2")
+        self.assertEqual(ascii_slug(slug), slug)
+
+
+class DownCache:
+    """Кэш, у которого любой вызов падает, как Redis без соединения."""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("cache is down")
+        return fail
+
+
+class CatalogCacheOutageTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(catalog_cache, "cache", DownCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_save_survives_bump_failure(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title="Диван", slug="divan", sku="D-1", price=Decimal("100"))
+        self.assertTrue(Product.objects.filter(sku="D-1").exists())
+
+
+class ParseDeltaTests(SimpleTestCase):
+    def test_valid(self):
+        self.assertEqual(parse_delta({"sku": " A-1 ", "stock": "3", "price": "1 990,5", "discount_price": None}),
+                         {"sku": "A-1", "stock": 3, "price": Decimal("1990.50"), "discount_price": None})
+        self.assertEqual(parse_delta({"sku": "A-1", "stock": "4.0"})["stock"], 4)
+
+    def test_invalid(self):
+        for raw in (
+            "A-1", {"stock": 1}, {"sku": "x" * 65, "stock": 1}, {"sku": "A-1"},
+            {"sku": "A-1", "stock": "2.5"}, {"sku": "A-1", "stock": "NaN"}, {"sku": "A-1", "stock": "Infinity"},
+            {"sku": "A-1", "stock": "abc"}, {"sku": "A-1", "stock": -1}, {"sku": "A-1", "stock": 2 ** 31},
+            {"sku": "A-1", "price": "0"}, {"sku": "A-1", "price": "100000000"},
+            {"sku": "A-1", "discount_price": "abc"},
+            {"sku": "A-1", "price": "100", "discount_price": "100"},
+        ):
+            with self.subTest(raw=raw), self.assertRaises(DeltaError):
+                parse_delta(raw)
+
+
+class ApplyStockDeltasTests(TestCase):
+    def setUp(self):
+        Product.objects.create(title="Стол", slug="stol", sku="A-1", price=Decimal("100"), stock=5)
+        Product.objects.create(title="Шкаф", slug="shkaf", sku="B-2", price=Decimal("200"),
+                               discount_price=Decimal("150"), stock=1)
+
+    def _statuses(self, items):
+        return [(r["sku"], r["status"]) for r in apply_stock_deltas(items)]
+
+    def test_statuses(self):
+        self.assertEqual(self._statuses([
+            {"sku": "A-1", "stock": 7}, {"sku": "B-2", "stock": 1}, {"sku": "C-3", "stock": 1}, {"sku": "A-1"},
+        ]), [("A-1", "updated"), ("B-2", "unchanged"), ("C-3", "not_found"), ("A-1", "invalid")])
+        self.assertEqual(Product.objects.get(sku="A-1").stock, 7)
+
+    def test_discount_checked_against_db_price(self):
+        self.assertEqual(self._statuses([{"sku": "A-1", "discount_price": "100"}]), [("A-1", "invalid")])
+        self.assertIsNone(Product.objects.get(sku="A-1").discount_price)
+        self.assertEqual(self._statuses([{"sku": "A-1", "discount_price": "90"}]), [("A-1", "updated")])
+
+    def test_discount_checked_after_merge(self):
+        results = self._statuses([{"sku": "A-1", "price": "80"}, {"sku": "A-1", "discount_price": "90"}])
+        self.assertEqual(results, [("A-1", "invalid"), ("A-1", "invalid")])
+        self.assertEqual(Product.objects.get(sku="A-1").price, Decimal("100"))
+
+    def test_price_below_discount_drops_discount(self):
+        self.assertEqual(self._statuses([{"sku": "B-2", "price": "140"}]), [("B-2", "updated")])
+        p = Product.objects.get(sku="B-2")
+        self.assertEqual((p.price, p.discount_price), (Decimal("140"), None))
+
+
+@override_settings(STOCK_FEED_TOKEN="feed-secret")
+class StockFeedAuthTests(TestCase):
+    def setUp(self):
+        Product.objects.create(title="Стол", slug="stol", sku="A-1", price=Decimal("100"))
+        self.url = reverse("stock-feed")
+        self.body = {"items": [{"sku": "A-1", "stock": 2}]}
+
+    def test_anonymous_rejected(self):
+        response = self.client.post(self.url, self.body, content_type="application/json")
+        self.assertIn(response.status_code, (401, 403))
+        self.assertEqual(Product.objects.get(sku="A-1").stock, 0)
+
+    def test_wrong_token_rejected(self):
+        response = self.client.post(self.url, self.body, content_type="application/json",
+                                    HTTP_AUTHORIZATION="Token wrong")
+        self.assertIn(response.status_code, (401, 403))
+
+    def test_token(self):
+        response = self.client.post(self.url, self.body, content_type="application/json",
+                                    HTTP_AUTHORIZATION="Token feed-secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["counts"], {"updated": 1})
+
+    def test_staff_session(self):
+        user = get_user_model().objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(user)
+        response = self.client.post(self.url, self.body, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_non_staff_session_rejected(self):
+        user = get_user_model().objects.create_user("user", password="x")
+        self.client.force_login(user)
+        response = self.client.post(self.url, self.body, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(ORDER_SNAPSHOT_CACHE=True)
+class OrderSnapshotCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.order = make_order()
+        cache.clear()  # снимок, записанный при создании, не нужен: начинаем с промаха
+
+    def test_miss_fill_does_not_overwrite_fresh_snapshot(self):
+        set_ = order_cache._set
+
+        def save_between_read_and_fill(order_id, snap, **kwargs):
+            if kwargs.get("fill"):
+                # строку уже прочитали; тут заказ оплачивают, и write-through успевает первым
+                with self.captureOnCommitCallbacks(execute=True):
+                    order = Order.objects.get(pk=order_id)
+                    order.status = "paid"
+                    order.save()
+            set_(order_id, snap, **kwargs)
+
+        with mock.patch.object(order_cache, "_set", side_effect=save_between_read_and_fill):
+            stale = order_cache.get_order_snapshot(self.order.pk)
+        self.assertEqual(stale["status"], "new")
+        self.assertEqual(order_cache.get_order_snapshot(self.order.pk)["status"], "paid")
+
+    def test_miss_fills_cache(self):
+        self.assertEqual(order_cache.get_order_snapshot(self.order.pk)["status"], "new")
+        Order.objects.filter(pk=self.order.pk).update(status="paid")  # мимо save — кэш не знает
+        self.assertEqual(order_cache.get_order_snapshot(self.order.pk)["status"], "new")
+
+
+class ComputeRelatedTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Шкафы", slug="shkafy")
+        white, oak, black = (Color.objects.create(name=n) for n in ("белый", "дуб сонома", "черный"))
+        material = ProductAttribute.objects.create(name="Материал")
+        self.ldsp = AttributeOption.objects.create(attribute=material, value="ЛДСП")
+        self.mdf = AttributeOption.objects.create(attribute=material, value="МДФ")
+
+        def product(sku, title, color, option, size):
+            p = Product.objects.create(sku=sku, slug=sku.lower(), title=title, price=Decimal("100"),
+                                       category=category, color=color, width=size[0], height=size[1], depth=size[2])
+            ProductAttributeValue.objects.create(product=p, attribute=material, option=option)
+            return p
+
+        self.mark_white = product("M-1", "Шкаф Марк белый", white, self.ldsp, (100, 200, 60))
+        self.mark_oak = product("M-2", "Шкаф Марк дуб сонома", oak, self.ldsp, (100, 200, 60))
+        self.mark_black = product("M-3", "Шкаф Марк черный", black, self.ldsp, (100, 200, 60))
+        self.nika = product("N-1", "Шкаф Ника белый", white, self.ldsp, (100, 210, 60))
+        self.loft = product("L-1", "Шкаф Лофт", white, self.mdf, (40, 80, 30))
+
+    def test_family_split(self):
+        compute_related()
+        self.assertEqual(set(self.mark_white.related_by_color.all()), {self.mark_oak, self.mark_black})
+        # семейство (тот же «Шкаф Марк» в других цветах) в похожие не попадает
+        similar = set(self.mark_white.related_products.all())
+        self.assertTrue(similar.isdisjoint({self.mark_white, self.mark_oak, self.mark_black}))
+        self.assertIn(self.nika, similar)
+        self.assertFalse(self.nika.related_by_color.exists())
+
+    def test_lists_rewritten_to_empty(self):
+        self.nika.related_by_color.add(self.mark_white)  # ручная правка из админки
+        self.mark_white.related_products.add(self.mark_oak)
+        compute_related()
+        self.assertFalse(self.nika.related_by_color.exists())
+        self.assertNotIn(self.mark_oak, self.mark_white.related_products.all())
+
+    def test_detail_returns_best_first(self):
+        compute_related()
+        response = self.client.get(reverse("product-detail", args=[self.mark_white.slug]),
+                                   {"related_limit": 1, "bought_together_limit": 0})
+        self.assertEqual([p["id"] for p in response.json()["related_products"]], [self.nika.pk])
+
+    def test_incremental_picks_up_attribute_change(self):
+        compute_related()
+        since = timezone.now()
+        Product.objects.update(updated_at=since - timedelta(hours=1))
+        self.assertEqual(compute_related(since=since)["categories"], 0)
+        pav = self.loft.attributes.get()
+        pav.option = self.ldsp
+        pav.save()
+        self.assertEqual(compute_related(since=since)["categories"], 1)
+
+
+class RunIdempotentTests(TestCase):
+    def setUp(self):
+        self.calls = 0
+
+    def _request(self, body, key="key-1"):
+        headers = {IDEMPOTENCY_HEADER: key} if key else {}
+        raw = APIRequestFactory().post("/api/orders/", body, format="json", headers=headers)
+        return Request(raw, parsers=[JSONParser()])
+
+    def _handler(self):
+        self.calls += 1
+        return Response({"id": self.calls}, status=201)
+
+    def _run(self, body, key="key-1", handler=None):
+        return run_idempotent(self._request(body, key), "orders.create", handler or self._handler)
+
+    def test_without_key_runs_every_time(self):
+        self._run({"a": 1}, key=None)
+        self._run({"a": 1}, key=None)
+        self.assertEqual(self.calls, 2)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_replay(self):
+        first = self._run({"a": 1, "b": [1, 2]})
+        again = self._run({"b": [1, 2], "a": 1})  # порядок ключей не важен
+        self.assertEqual(self.calls, 1)
+        self.assertEqual((again.status_code, again.data), (first.status_code, first.data))
+        self.assertEqual(again["Idempotent-Replayed"], "true")
+
+    def test_same_key_other_body(self):
+        self._run({"a": 1})
+        response = self._run({"a": 2})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.calls, 1)
+
+    def test_keys_are_per_scope(self):
+        self._run({"a": 1})
+        run_idempotent(self._request({"a": 1}), "other.scope", self._handler)
+        self.assertEqual(self.calls, 2)
+
+    def test_failed_handler_rolls_back_key(self):
+        def boom():
+            raise RuntimeError("db is down")
+        with self.assertRaises(RuntimeError):
+            self._run({"a": 1}, handler=boom)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self._run({"a": 1}).status_code, 201)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_key_reused(self):
+        self._run({"a": 1})
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        response = self._run({"a": 2})
+        self.assertEqual((response.status_code, self.calls), (201, 2))
+
+    def test_long_key_rejected(self):
+        self.assertEqual(self._run({"a": 1}, key="x" * 256).status_code, 400)
+        self.assertEqual(self.calls, 0)
+
+
+def cp_payload(order, tx="100", **kwargs):
+    payload = {"InvoiceId": str(order.pk), "TransactionId": tx, "Amount": str(order.total_price), "Currency": "RUB"}
+    payload.update(kwargs)
+    return payload
+
+
+class ApplyCPEventTests(TestCase):
+    def setUp(self):
+        self.order = make_order()
+
+    def _status(self):
+        self.order.refresh_from_db()
+        return self.order.status, list(Payment.objects.values_list("transaction_id", "status"))
+
+    def test_pay(self):
+        self.assertEqual(apply_cp_event("pay", cp_payload(self.order)).code, CP_OK)
+        self.assertEqual(self._status(), ("paid", [("100", "paid")]))
+
+    def test_duplicate_pay(self):
+        apply_cp_event("pay", cp_payload(self.order))
+        with mock.patch("core.payments.publish_order_status") as publish:
+            self.assertEqual(apply_cp_event("pay", cp_payload(self.order)).code, CP_OK)
+        publish.assert_not_called()
+        self.assertEqual(self._status(), ("paid", [("100", "paid")]))
+
+    def test_refund_moves_the_payment_row(self):
+        apply_cp_event("pay", cp_payload(self.order))
+        apply_cp_event("refund", cp_payload(self.order, tx="200", PaymentTransactionId="100", Amount="10"))
+        self.assertEqual(self._status(), ("canceled", [("100", "refunded")]))
+        self.assertEqual(Payment.objects.get().amount, self.order.total_price)  # сумма платежа, не возврата
+
+    def test_late_pay_after_refund_ignored(self):
+        apply_cp_event("refund", cp_payload(self.order, tx="200", PaymentTransactionId="100"))
+        self.assertEqual(apply_cp_event("pay", cp_payload(self.order)).code, CP_OK)
+        self.assertEqual(self._status(), ("canceled", [("100", "refunded")]))
+
+    def test_fail_after_pay_ignored(self):
+        apply_cp_event("pay", cp_payload(self.order))
+        apply_cp_event("fail", cp_payload(self.order))
+        self.assertEqual(self._status(), ("paid", [("100", "paid")]))
+
+    def test_amount_mismatch(self):
+        self.assertEqual(apply_cp_event("pay", cp_payload(self.order, Amount="999")).code, CP_BAD_AMOUNT)
+        self.assertEqual(self._status(), ("new", []))
+
+
+class CPInboxTests(TestCase):
+    def setUp(self):
+        self.order = make_order()
+
+    def test_receive_only_queues(self):
+        self.assertEqual(receive_cp_event("pay", cp_payload(self.order)).code, CP_OK)
+        self.assertEqual(receive_cp_event("pay", cp_payload(self.order)).code, CP_OK)  # повтор доставки
+        note = PaymentNotification.objects.get()
+        self.assertEqual(list(Job.objects.values_list("task", "payload")),
+                         [(PROCESS_TASK, {"notification_id": note.pk})])
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "new")
+        self.assertFalse(Payment.objects.exists())
+
+    def test_check_is_not_queued(self):
+        self.assertEqual(receive_cp_event("check", cp_payload(self.order)).code, CP_OK)
+        self.assertFalse(PaymentNotification.objects.exists())
+
+    def test_process(self):
+        receive_cp_event("pay", cp_payload(self.order))
+        note = PaymentNotification.objects.get()
+        process_notification(note.pk)
+        note.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual((note.status, note.result_code), (PaymentNotification.Status.PROCESSED, CP_OK))
+        self.assertEqual(self.order.status, "paid")
+
+    def test_reprocessing_is_noop(self):
+        receive_cp_event("pay", cp_payload(self.order))
+        note = PaymentNotification.objects.get()
+        process_notification(note.pk)
+        with mock.patch("core.payments.apply_cp_event") as apply:
+            process_notification(note.pk)  # ретрай задачи после успешной обработки
+        apply.assert_not_called()
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_rejected(self):
+        receive_cp_event("pay", cp_payload(self.order, Amount="1"))
+        note = PaymentNotification.objects.get()
+        process_notification(note.pk)
+        note.refresh_from_db()
+        self.assertEqual((note.status, note.result_code), (PaymentNotification.Status.REJECTED, CP_BAD_AMOUNT))
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "new")
+
+    def test_events_of_one_transaction_are_separate(self):
+        receive_cp_event("pay", cp_payload(self.order))
+        receive_cp_event("refund", cp_payload(self.order, tx="200", PaymentTransactionId="100"))
+        for note in PaymentNotification.objects.order_by("pk"):
+            process_notification(note.pk)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, "canceled")
+        self.assertEqual(list(Payment.objects.values_list("status", flat=True)), ["refunded"])
+
+
+@task("tests.noop")
+def _noop_task(**kwargs):
+    pass
+
+
+@task("tests.broken", max_attempts=2)
+def _broken_task():
+    raise RuntimeError("broken")
+
+
+class JobQueueTests(TestCase):
+    def test_claim(self):
+        now = timezone.now()
+        later = enqueue("tests.noop", n=1, run_at=now - timedelta(seconds=1))
+        first = enqueue("tests.noop", n=2, run_at=now - timedelta(seconds=5))
+        enqueue("tests.noop", n=3, run_at=now + timedelta(hours=1))  # ещё рано
+        jobs = claim(["default"], 10, "w1")
+        self.assertEqual([j.pk for j in jobs], [first.pk, later.pk])
+        self.assertTrue(all(j.status == Job.Status.RUNNING and j.attempts == 1 and j.locked_by == "w1"
+                            for j in jobs))
+        self.assertEqual(claim(["default"], 10, "w2"), [])
+        self.assertEqual(claim(["other"], 10, "w2"), [])
+
+    @override_settings(JOBS_RETRY_BASE_DELAY=30, JOBS_RETRY_MAX_DELAY=100)
+    def test_backoff(self):
+        with mock.patch("core.jobs.random.uniform", return_value=1.0):
+            self.assertEqual([backoff(n).total_seconds() for n in (1, 2, 3, 4)], [30, 60, 100, 100])
+
+    def test_retry_then_dead_letter(self):
+        job = enqueue("tests.broken")
+        [job] = claim(["default"], 1, "w1")
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.QUEUED, 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn("broken", job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        [job] = claim(["default"], 1, "w1")
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.DEAD, 2))
+        self.assertEqual(claim(["default"], 1, "w1"), [])
+
+    def test_done(self):
+        enqueue("tests.noop")
+        [job] = claim(["default"], 1, "w1")
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DONE)
+
+    def test_dedupe_key(self):
+        now = timezone.now()
+        first = enqueue("tests.noop", dedupe_key="digest", run_at=now + timedelta(minutes=10))
+        enqueue("tests.noop", dedupe_key="digest", run_at=now + timedelta(minutes=20))
+        again = enqueue("tests.noop", dedupe_key="digest", run_at=now + timedelta(minutes=5))
+        self.assertEqual(Job.objects.count(), 1)
+        self.assertEqual(again.pk, first.pk)
+        self.assertEqual(Job.objects.get().run_at, now + timedelta(minutes=5))  # подтянули раньше
+
+        # уникальность — только среди стоящих в очереди: взятая в работу не мешает новой
+        Job.objects.update(status=Job.Status.RUNNING)
+        enqueue("tests.noop", dedupe_key="digest")
+        self.assertEqual(Job.objects.filter(status=Job.Status.QUEUED).count(), 1)
+        self.assertEqual(Job.objects.count(), 2)
+
+
+class DisconnectingBackend(LocMemBackend):
+    """locmem, который рвёт сессию на письмах из disconnect_on (каждое — столько раз, сколько указано)."""
+    disconnect_on: list[str] = []
+    opened = 0
+
+    def open(self):
+        DisconnectingBackend.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for m in messages:
+            if m.subject in self.disconnect_on:
+                self.disconnect_on.remove(m.subject)
+                raise smtplib.SMTPServerDisconnected("connection closed")
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND="core.tests.DisconnectingBackend")
+class PooledMailerTests(SimpleTestCase):
+    def setUp(self):
+        mail.outbox = []
+        DisconnectingBackend.opened = 0
+        DisconnectingBackend.disconnect_on = []
+        self.mailer = PooledMailer()
+        self.addCleanup(self.mailer.close)
+
+    def _messages(self, *subjects):
+        return [EmailMessage(s, "body", "shop@example.com", ["ivan@example.com"]) for s in subjects]
+
+    def test_connection_reused(self):
+        self.mailer.send_messages(self._messages("1"))
+        self.mailer.send_messages(self._messages("2"))
+        self.assertEqual(DisconnectingBackend.opened, 1)
+
+    def test_disconnect_mid_batch_resends_only_the_rest(self):
+        DisconnectingBackend.disconnect_on = ["2"]
+        self.assertEqual(self.mailer.send_messages(self._messages("1", "2", "3")), 3)
+        self.assertEqual([m.subject for m in mail.outbox], ["1", "2", "3"])
+        self.assertEqual(DisconnectingBackend.opened, 2)
+
+    def test_second_disconnect_raises(self):
+        DisconnectingBackend.disconnect_on = ["2", "2"]
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            self.mailer.send_messages(self._messages("1", "2", "3"))
+        self.assertEqual([m.subject for m in mail.outbox], ["1"])
+        # соединение сброшено: следующая пачка открывает новое и уходит целиком
+        self.mailer.send_messages(self._messages("2", "3"))
+        self.assertEqual([m.subject for m in mail.outbox], ["1", "2", "3"])
+
+
+class CoPurchaseTests(TestCase):
+    def setUp(self):
+        self.a, self.b, self.c, self.d = (
+            Product.objects.create(title=f"Товар {n}", slug=f"tovar-{n}", sku=f"CP-{n}", price=Decimal("100"))
+            for n in "abcd"
+        )
+        baskets = [
+            ("new", [self.a, self.b, self.a]),  # a дважды в одном заказе — пара считается один раз
+            ("paid", [self.a, self.b]),
+            ("paid", [self.a, self.c]),
+            ("delivered", [self.a, self.c]),
+            ("canceled", [self.a, self.d]),
+            ("canceled", [self.a, self.d]),
+        ]
+        for status, products in baskets:
+            order = make_order(status=status)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=p, price_at_moment=p.price, final_price=p.price) for p in products
+            ])
+
+    def _rows(self, product):
+        return list(CoPurchase.objects.filter(product=product).order_by("rank").values_list("other", "rank", "orders"))
+
+    def test_compute(self):
+        stats = compute_copurchases(days=None, top=8, min_orders=2)
+        self.assertEqual(stats["orders"], 4)  # отменённые не считаются
+        self.assertEqual(self._rows(self.a), [(self.b.pk, 1, 2), (self.c.pk, 2, 2)])
+        self.assertEqual(self._rows(self.b), [(self.a.pk, 1, 2)])
+        self.assertFalse(CoPurchase.objects.filter(other=self.d).exists())
+
+    def test_top_and_dry_run(self):
+        compute_copurchases(days=None, top=1, min_orders=2, dry_run=True)
+        self.assertFalse(CoPurchase.objects.exists())
+        compute_copurchases(days=None, top=1, min_orders=2)
+        self.assertEqual(self._rows(self.a), [(self.b.pk, 1, 2)])
+
+    def test_detail_reads_block_in_one_query(self):
+        compute_copurchases(days=None, top=8, min_orders=2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("product-detail", args=[self.a.slug]),
+                                       {"include_related": 1, "bought_together_limit": 5})
+        self.assertEqual([p["id"] for p in response.json()["frequently_bought_together"]], [self.b.pk, self.c.pk])
+        self.assertEqual(sum("core_copurchase" in q["sql"] for q in queries.captured_queries), 1)
+
+    def test_bad_limit_falls_back_to_default(self):
+        compute_copurchases(days=None, top=8, min_orders=2)
+        response = self.client.get(reverse("product-detail", args=[self.a.slug]), {"bought_together_limit": "abc"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["frequently_bought_together"]), 2)
+
+
+class LoadReportTests(SimpleTestCase):
+    def _write(self, text, suffix=".csv"):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_csv_streamed_past_sniff_sample(self):
+        lines = ["InvoiceId;TransactionId;Status;Amount;Currency\n"]
+        lines += [f"{i};{100 + i};Completed;10,50;rub\n" for i in range(1, 51)]
+        lines += ["abc;1;Completed;1;RUB\n", "7;999;Unknown;1;RUB\n"]
+        path = self._write("\ufeff" + "".join(lines))
+        report = load_report(path)
+        self.assertEqual(len(report), 50)
+        self.assertEqual(report[50], [{"tx": "150", "status": Payment.Status.PAID, "amount": Decimal("10.50"), "currency": "RUB"}])
+        self.assertEqual(len(report[7]), 1)
+
+        # поток без read(): CSV разбирается только итерацией по строкам
+        @contextmanager
+        def lines_only(src, fmt):
+            yield iter(lines), "csv"
+
+        with mock.patch("core.management.commands.reconcile_payments._open_report", lines_only):
+            self.assertEqual(len(load_report("report.csv")), 50)
+
+    def test_json_api_response(self):
+        path = self._write('{"Model": [{"InvoiceId": "3", "TransactionId": 5, "Status": "Declined", "Amount": 9}]}', ".json")
+        self.assertEqual(load_report(path)[3][0]["tx"], "5")
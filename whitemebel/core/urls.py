@@ -7,14 +7,14 @@ from core.views import (CategoryViewSet, DeliveryRegionListView,
                         ProductListView, ServiceListView, SliderViewSet,
                         ProductsByIdsView, TagListView,
                         ContactRequestCreateView,CloudPaymentsWebhookView, 
-                        CloudPaymentsPayView, OrderStatusView)
+                        CloudPaymentsPayView, OrderStatusView, OrderStatusWaitView)
 
 from core.views import (         # HTML-виджет (только для теста)
     CloudPaymentsInitView,         # API: конфиг для виджета              # API: статус заказа (поллинг)
     PaymentSuccessView,            # success (можно редиректить на фронт)
     PaymentFailView,               # fail      # вебхук от CloudPayments
 )
-from .views import OneClickRequestCreateView, OrderAcceptedView
+from .views import ImageResizeView, OneClickRequestCreateView, OrderAcceptedView, StockFeedView
 
 # from core.views import ProductViewSet, CategoryViewSet, TagViewSet, ColorViewSet
 
@@ -44,6 +44,8 @@ urlpatterns = [
     # API для фронта
     path("payments/init/<int:order_id>/", CloudPaymentsInitView.as_view(), name="cp-init"),
     path("orders/<int:order_id>/status/", OrderStatusView.as_view(), name="order-status"),
+    # long-poll статуса (обслуживается ASGI-сервисом, см. nginx.conf)
+    path("orders/<int:order_id>/status/wait/", OrderStatusWaitView.as_view(), name="order-status-wait"),
     path("payments/success/", PaymentSuccessView.as_view(), name="payment-success"),
     path("payments/fail/", PaymentFailView.as_view(), name="payment-fail"),
 
@@ -51,6 +53,10 @@ urlpatterns = [
     path("payments/cloudpayments/webhook/", CloudPaymentsWebhookView.as_view(), name="cp-webhook"),
     path("services/", ServiceListView.as_view(), name="service-list"),
     path("one-click/", OneClickRequestCreateView.as_view(), name="one-click-create"),
+    # ресайз по подписанной ссылке (core/utils/resize.py)
+    path("img/resize/", ImageResizeView.as_view(), name="image-resize"),
+    # остатки/цены из учётки пачкой (core/stock_feed.py)
+    path("catalog/stock-feed/", StockFeedView.as_view(), name="stock-feed"),
     ]
 
 urlpatterns += [
@@ -0,0 +1,49 @@
+# core/utils/catalog_cache.py
+"""
+Версия каталога в общем кэше: ключи кэшированных ответов каталога содержат её номер,
+так что «сбросить всё» — это один INCR, без перебора ключей.
+
+Поднимают её Product.save()/delete() (после коммита) и массовые пути
+(фид остатков, импорт, связанные товары) — один раз на пачку, а не на строку.
+Версия меняется только вместе с товарами: кэшировать под ней то, что читает
+категории/цвета/характеристики (например, /api/filters/), нельзя — их правки её не поднимают.
+
+Кэш — только ускорение: если Redis лежит, bump пишет предупреждение в лог
+(запись в БД уже закоммичена, 500 из-за кэша ей не нужен).
+"""
+import logging
+
+from django.core.cache import cache
+from django.db import transaction
+
+log = logging.getLogger(__name__)
+
+VERSION_KEY = "catalog:version"
+
+
+def catalog_version() -> int:
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY) or 1
+    return version
+
+
+def bump_catalog_version() -> None:
+    try:
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:  # ключа ещё нет (или кэш очистили)
+            cache.add(VERSION_KEY, 2, None)
+    except Exception:
+        log.warning("catalog cache: bump failed", exc_info=True)
+
+
+def bump_catalog_version_on_commit() -> None:
+    transaction.on_commit(bump_catalog_version, robust=True)
+
+
+def catalog_cache_key(name: str, params) -> str:
+    query = "&".join(f"{k}={v}" for k, v in sorted(params.items()))
+    return f"catalog:{catalog_version()}:{name}:{query}"
+
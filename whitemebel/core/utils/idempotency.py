@@ -0,0 +1,83 @@
+# core/utils/idempotency.py
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from core.models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+def request_fingerprint(data) -> str:
+    """sha256 от канонического JSON тела запроса (ключи отсортированы)."""
+    if hasattr(data, "lists"):  # QueryDict из form-data
+        data = {k: v if len(v) > 1 else v[0] for k, v in data.lists()}
+    raw = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _ttl() -> timedelta:
+    return timedelta(hours=getattr(settings, "IDEMPOTENCY_KEY_TTL_HOURS", 24))
+
+
+def _replay(rec: IdempotencyKey) -> Response:
+    resp = Response(rec.response_body, status=rec.response_status)
+    resp["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def run_idempotent(request, scope: str, handler):
+    """
+    Выполнить handler() не больше одного раза на (scope, Idempotency-Key).
+
+    - без заголовка — просто вызываем handler;
+    - ретрай с тем же телом — отдаём сохранённый ответ, handler не зовём
+      (ни валидации, ни вставок, ни писем);
+    - тот же ключ с другим телом — 422;
+    - параллельный дубль ждёт на уникальном индексе / select_for_update,
+      пока первый запрос не закоммитится, и получает его ответ.
+
+    Если handler бросил исключение — транзакция откатывается вместе с ключом,
+    и следующий ретрай выполнится заново.
+    """
+    key = (request.headers.get(IDEMPOTENCY_HEADER) or "").strip()
+    if not key:
+        return handler()
+    if len(key) > 255:
+        return Response({"detail": f"{IDEMPOTENCY_HEADER} длиннее 255 символов."}, status=400)
+
+    fingerprint = request_fingerprint(request.data)
+
+    with transaction.atomic():
+        rec, created = IdempotencyKey.objects.select_for_update().get_or_create(
+            scope=scope, key=key, defaults={"fingerprint": fingerprint},
+        )
+        if not created and rec.created_at < timezone.now() - _ttl():
+            # протухший ключ — используем заново
+            rec.fingerprint = fingerprint
+            rec.response_status = None
+            rec.response_body = None
+            rec.created_at = timezone.now()
+            rec.save(update_fields=["fingerprint", "response_status", "response_body", "created_at"])
+        elif not created:
+            if rec.fingerprint != fingerprint:
+                return Response(
+                    {"detail": f"{IDEMPOTENCY_HEADER} уже использован с другим телом запроса."},
+                    status=422,
+                )
+            if rec.response_status is not None:
+                return _replay(rec)
+
+        response = handler()
+
+        # сохраняем ровно то, что ушло клиенту (Decimal/даты — уже строками/числами)
+        rec.response_status = response.status_code
+        rec.response_body = json.loads(JSONRenderer().render(response.data) or b"null")
+        rec.save(update_fields=["response_status", "response_body"])
+        return response
@@ -1,13 +1,60 @@
-from io import BytesIO
-from PIL import Image
-from django.core.files.base import ContentFile
+import math
+import os
+from tempfile import SpooledTemporaryFile
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files import File
+
+# результат кодирования до такого размера живёт в памяти, больше — уходит во временный файл
+SPOOL_MAX_SIZE = 2 * 1024 * 1024
+
+
+def image_changed(field_file) -> bool:
+    """
+    Пришёл ли в поле новый файл. Уже сохранённый в storage файл (_committed=True) —
+    это обычное редактирование карточки (цена, остаток, название): картинку не трогаем.
+    """
+    return bool(field_file) and not getattr(field_file, "_committed", True)
+
+
+def open_bounded(image, max_side: int | None = None) -> Image.Image:
+    """
+    Открыть картинку, не раскрывая её целиком в память.
+
+    JPEG декодируется сразу в уменьшенном масштабе (draft: 1/2, 1/4, 1/8 — не меньше max_side),
+    остальное ужимается через reduce() внутри thumbnail(). Если и после draft пикселей больше
+    IMAGE_MAX_PIXELS — ValueError, такое не декодируем вовсе (PNG 20000×20000 = 1.6 ГБ в RGBA).
+    """
+    max_side = max_side or getattr(settings, "IMAGE_MAX_SIDE", 2560)
+    budget = getattr(settings, "IMAGE_MAX_PIXELS", 50_000_000)
+
+    try:
+        img = Image.open(image)  # пока прочитан только заголовок
+    except Image.DecompressionBombError as e:
+        # больше 2×MAX_IMAGE_PIXELS PIL отказывается уже на заголовке — до нашей проверки бюджета
+        raise ValueError(f"Слишком большая картинка: {e}") from e
+    scale = max_side / max(img.size)
+    if scale < 1:
+        # draft выбирает наименьший масштаб, при котором обе стороны не меньше запрошенных
+        img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+    w, h = img.size
+    if w * h > budget:
+        raise ValueError(f"Слишком большая картинка: {w}×{h} px (лимит {budget} px)")
+    img.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=3.0)
+    # EXIF-поворот применяем к уже уменьшенной картинке; WEBP на выходе его не сохранит
+    return ImageOps.exif_transpose(img)
+
 
 def compress_image(image, format="WEBP", quality=85):
-    img = Image.open(image)
-    img_io = BytesIO()
+    img = open_bounded(image)
 
     if img.mode != 'RGB':
         img = img.convert('RGB')
 
-    img.save(img_io, format=format, quality=quality, optimize=True)
-    return ContentFile(img_io.getvalue(), name=image.name.split('.')[0] + f'.{format.lower()}')
\ No newline at end of file
+    out = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    img.save(out, format=format, quality=quality, optimize=True)
+    out.seek(0)
+    # только имя файла: путь upload_to допишет поле, иначе каталоги вкладываются друг в друга
+    base = os.path.splitext(os.path.basename(image.name))[0]
+    return File(out, name=f"{base}.{format.lower()}")
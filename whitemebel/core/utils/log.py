@@ -0,0 +1,162 @@
+# core/utils/log.py
+"""
+Логирование без блокировок в потоке запроса.
+
+    QueueLogHandler — кладёт LogRecord в очередь как есть (без форматирования),
+    а форматирование и запись в stderr делает QueueListener в своём треде.
+    JsonFormatter   — одна строка JSON на запись, extra-поля попадают как ключи.
+    PlainFormatter  — текст для локалки (LOG_JSON=0), extra-поля дописываются key=value.
+    LazyJson        — обёртка для тяжёлых payload'ов: json.dumps случится только
+                      в треде листенера и только если запись не отброшена.
+    SampleFilter    — пропускает долю шумных INFO/DEBUG-записей по префиксу сообщения.
+
+Подключается в settings.LOGGING через "()" (см. config/settings.py).
+"""
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# атрибуты, которые есть у любого LogRecord — всё остальное считаем extra
+_STD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+
+class LazyJson:
+    """
+    Сериализуется при форматировании, а не при вызове logger.*().
+    obj может быть callable — тогда и сам payload соберётся лениво.
+    Данные не копируются: не мутируй их после логирования.
+    """
+    __slots__ = ("obj", "limit")
+
+    def __init__(self, obj, limit: int = 4000):
+        self.obj = obj
+        self.limit = limit
+
+    def value(self):
+        return self.obj() if callable(self.obj) else self.obj
+
+    def __str__(self):
+        return json.dumps(self.value(), ensure_ascii=False, default=str)[: self.limit]
+
+
+def _json_default(o):
+    if isinstance(o, LazyJson):
+        return o.value()
+    if isinstance(o, bytes):
+        return o.decode("utf-8", errors="replace")
+    return str(o)
+
+
+def _extras(record: logging.LogRecord) -> dict:
+    return {k: v for k, v in record.__dict__.items() if k not in _STD_ATTRS and not k.startswith("_")}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        data.update(_extras(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=_json_default)
+
+
+class PlainFormatter(logging.Formatter):
+    """Обычный текстовый формат + extra-поля (order_id, job_id, …) хвостом key=value."""
+
+    def __init__(self, fmt="%(asctime)s %(levelname)s %(name)s: %(message)s", **kwargs):
+        super().__init__(fmt, **kwargs)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        extras = _extras(record)
+        if extras:
+            line += " " + " ".join(f"{k}={v}" for k, v in extras.items())  # LazyJson -> JSON-строкой
+        return line
+
+
+class SampleFilter(logging.Filter):
+    """
+    Пропускает rate (0..1) записей уровня ниже WARNING, чьё сообщение начинается
+    с одного из prefixes. Остальное — без изменений. Работает в потоке вызова,
+    поэтому отброшенные записи не стоят ни очереди, ни форматирования.
+    """
+
+    def __init__(self, rate: float = 1.0, prefixes=()):
+        super().__init__()
+        self.rate = float(rate)
+        self.prefixes = tuple(prefixes)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate >= 1 or record.levelno >= logging.WARNING:
+            return True
+        if self.prefixes and not (isinstance(record.msg, str) and record.msg.startswith(self.prefixes)):
+            return True
+        return random.random() < self.rate
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    QueueHandler со своим листенером и приёмником (по умолчанию stderr).
+    Форматтер, выставленный через dictConfig, уходит приёмнику.
+    Очередь ограничена: если листенер не успевает — записи теряются (счётчик dropped),
+    но поток запроса не ждёт никогда.
+    """
+
+    def __init__(self, sink: logging.Handler | None = None, maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.sink = sink or logging.StreamHandler(sys.stderr)
+        self.dropped = 0
+        self.listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        self.sink.setFormatter(fmt)
+
+    def _ensure_listener(self) -> None:
+        # после fork() (gunicorn --preload) треда листенера в дочернем процессе нет — поднимаем свой
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.listener = QueueListener(self.queue, self.sink, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Базовый prepare() форматирует сообщение здесь же, в потоке запроса, — этого и избегаем.
+        # Трейсбек рендерим сразу: он редкий, а кадры к моменту форматирования могут уйти.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        # logging.shutdown() при выходе: листенер дописывает хвост очереди и останавливается
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self._pid = None
+        super().close()
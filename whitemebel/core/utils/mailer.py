@@ -0,0 +1,167 @@
+# core/utils/mailer.py
+"""
+Отправка писем через переиспользуемое SMTP-соединение.
+
+На каждый поток воркера — одно открытое соединение (TLS-рукопожатие один раз,
+а не на каждое письмо), пачка идёт по нему письмо за письмом. Общий на процесс
+token bucket держит темп в рамках лимитов провайдера (EMAIL_RATE_LIMIT_PER_MINUTE).
+
+Локально удобно гонять против mailpit (docker compose --profile dev up mailpit,
+EMAIL_HOST=mailpit EMAIL_PORT=1025 EMAIL_USE_TLS=0).
+"""
+import logging
+import smtplib
+import threading
+import time
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+log = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Token bucket: не больше rate_per_minute писем в минуту, всплески до burst."""
+
+    def __init__(self, rate_per_minute: int, burst: int | None = None):
+        self.rate = max(1, rate_per_minute) / 60.0
+        self.capacity = float(burst or max(1, rate_per_minute // 6))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, n: int = 1) -> None:
+        n = min(float(n), self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class PooledMailer:
+    """
+    Соединение на поток: открывается лениво, живёт между задачами,
+    перед переиспользованием после простоя проверяется NOOP'ом,
+    переоткрывается после max_per_connection писем (провайдеры рвут длинные сессии).
+    """
+
+    def __init__(self, *, idle_check: float = 30.0, max_idle: float = 300.0,
+                 max_per_connection: int = 50, limiter: RateLimiter | None = None):
+        self.idle_check = idle_check
+        self.max_idle = max_idle
+        self.max_per_connection = max_per_connection
+        self.limiter = limiter
+        self._local = threading.local()
+        self._all = set()
+        self._all_lock = threading.Lock()
+
+    # ---------- соединение ----------
+
+    def _alive(self, conn) -> bool:
+        smtp = getattr(conn, "connection", None)
+        if smtp is None:  # locmem/console и т.п. — проверять нечего
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _open(self):
+        conn = get_connection(fail_silently=False)
+        conn.open()
+        self._local.conn = conn
+        self._local.sent = 0
+        self._local.last_used = time.monotonic()
+        with self._all_lock:
+            self._all.add(conn)
+        return conn
+
+    def _drop(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        if conn is None:
+            return
+        with self._all_lock:
+            self._all.discard(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            idle = time.monotonic() - self._local.last_used
+            if (idle > self.max_idle
+                    or self._local.sent >= self.max_per_connection
+                    or (idle > self.idle_check and not self._alive(conn))):
+                self._drop()
+                conn = None
+        return conn or self._open()
+
+    # ---------- отправка ----------
+
+    def send_messages(self, messages) -> int:
+        """
+        Письма уходят по одному: если сессия оборвалась посреди пачки, на свежем
+        соединении досылаются только неотправленные — уже ушедшие второй раз не шлём.
+        """
+        messages = [m for m in messages if m is not None]
+        if not messages:
+            return 0
+        if self.limiter:
+            self.limiter.acquire(len(messages))
+        conn = self._connection()
+        sent = 0
+        reconnected = False
+        try:
+            while sent < len(messages):
+                try:
+                    conn.send_messages([messages[sent]])
+                except smtplib.SMTPServerDisconnected:
+                    # сервер закрыл сессию (после NOOP или между письмами) — одна попытка на свежем соединении
+                    if reconnected:
+                        raise
+                    log.info("SMTP disconnected after %s/%s messages, reconnecting", sent, len(messages))
+                    reconnected = True
+                    self._drop()
+                    conn = self._open()
+                    continue
+                sent += 1
+                self._local.sent += 1
+        except Exception:
+            # соединение в непонятном состоянии — следующая отправка откроет новое
+            self._drop()
+            raise
+        finally:
+            self._local.last_used = time.monotonic()
+        return sent
+
+    def close(self) -> None:
+        """Закрыть соединение текущего потока."""
+        self._drop()
+
+    def close_all(self) -> None:
+        """Закрыть соединения всех потоков (при остановке воркера)."""
+        with self._all_lock:
+            conns, self._all = list(self._all), set()
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+
+mailer = PooledMailer(
+    max_per_connection=getattr(settings, "EMAIL_MAX_MESSAGES_PER_CONNECTION", 50),
+    limiter=RateLimiter(
+        getattr(settings, "EMAIL_RATE_LIMIT_PER_MINUTE", 30),
+        burst=getattr(settings, "EMAIL_RATE_BURST", None),
+    ),
+)
@@ -0,0 +1,96 @@
+# core/utils/order_cache.py
+"""
+Снимок заказа для ручек оплаты (статус, сумма, контакты) в общем кэше.
+
+Пишется сквозняком после коммита любого Order.save() — это и создание заказа,
+и смена статуса вебхуком CloudPayments. Промах кэша — один запрос в БД и прогрев.
+
+Нужен общий для всех процессов кэш (Redis, ORDER_SNAPSHOT_CACHE): с LocMem снимок,
+записанный WSGI-процессом, ASGI-сервис не увидит, а свой протухший держал бы сутки —
+поэтому без Redis снимков нет, всегда читается БД. Кэш — только ускорение: если Redis
+лежит, ошибка пишется в лог, а заказ читается из БД (сам заказ уже закоммичен, и 500
+после коммита клиент без Idempotency-Key повторил бы вторым заказом).
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_FIELDS = ("id", "status", "total_price", "email", "phone")
+SNAPSHOT_TTL = 60 * 60 * 24  # заказы на оплате живут часы, не дни
+
+
+def _key(order_id: int) -> str:
+    return f"order:snap:{int(order_id)}"
+
+
+def _normalize(row: dict) -> dict:
+    row = dict(row)
+    row["total_price"] = str(row["total_price"])
+    return row
+
+
+def _enabled() -> bool:
+    return getattr(settings, "ORDER_SNAPSHOT_CACHE", False)
+
+
+def _set(order_id: int, snap: dict, *, fill: bool = False) -> None:
+    """
+    fill=True — прогрев после промаха: только add. Строка из БД могла устареть, пока мы
+    её читали (save успел закоммитить и записать свежий снимок) — перезаписывать его нельзя.
+    """
+    try:
+        if fill:
+            cache.add(_key(order_id), snap, SNAPSHOT_TTL)
+        else:
+            cache.set(_key(order_id), snap, SNAPSHOT_TTL)
+    except Exception:
+        log.warning("order cache: set failed", exc_info=True, extra={"order_id": order_id})
+
+
+def cache_order(order) -> None:
+    if _enabled():
+        _set(order.pk, _normalize({f: getattr(order, f) for f in SNAPSHOT_FIELDS}))
+
+
+def cache_order_on_commit(order) -> None:
+    """Обновить снимок, когда (и если) транзакция закоммитится."""
+    transaction.on_commit(lambda: cache_order(order), robust=True)
+
+
+def forget_orders(order_ids) -> None:
+    if not _enabled():
+        return
+    try:
+        cache.delete_many([_key(pk) for pk in order_ids])
+    except Exception:
+        log.warning("order cache: delete failed", exc_info=True)
+
+
+def get_order_snapshot(order_id: int) -> dict | None:
+    """dict с полями SNAPSHOT_FIELDS (total_price — строкой) или None, если заказа нет."""
+    if _enabled():
+        try:
+            snap = cache.get(_key(order_id))
+        except Exception:
+            log.warning("order cache: get failed", exc_info=True, extra={"order_id": order_id})
+            snap = None
+        if snap is not None:
+            return snap
+    from core.models import Order
+
+    row = Order.objects.filter(pk=order_id).values(*SNAPSHOT_FIELDS).first()
+    if row is None:
+        return None
+    snap = _normalize(row)
+    if _enabled():
+        _set(order_id, snap, fill=True)
+    return snap
+
+
+def snapshot_total(snap: dict) -> Decimal:
+    return Decimal(snap["total_price"])
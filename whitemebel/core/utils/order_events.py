@@ -0,0 +1,132 @@
+# core/utils/order_events.py
+"""
+Канал «статус заказа изменился» для long-poll'а страниц оплаты.
+
+Postgres: вебхук делает pg_notify() внутри своей транзакции (уходит на коммите),
+а ASGI-процесс держит ОДНО соединение с LISTEN в фоновом треде и будит ждущих.
+На других БД (локалка на sqlite) — in-process фоллбэк, работает в пределах процесса.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, transaction
+
+log = logging.getLogger(__name__)
+
+CHANNEL = "order_status"
+
+
+def _is_postgres() -> bool:
+    return settings.DATABASES["default"]["ENGINE"].endswith("postgresql")
+
+
+def publish_order_status(order_id: int, status: str) -> None:
+    """Сообщить ждущим, что у заказа сменился статус. Доставка — после коммита."""
+    if _is_postgres():
+        payload = json.dumps({"order_id": int(order_id), "status": status})
+        with connection.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s)", [CHANNEL, payload])
+    else:
+        transaction.on_commit(lambda: order_status_hub.dispatch(int(order_id), status))
+
+
+def _resolve(fut: asyncio.Future, status: str) -> None:
+    if not fut.done():
+        fut.set_result(status)
+
+
+class OrderStatusHub:
+    """Реестр ждущих long-poll'ов: order_id -> futures (каждый на своём event loop)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: dict[int, set] = {}
+        self._listener: threading.Thread | None = None
+
+    @contextmanager
+    def subscribe(self, order_id: int):
+        """
+        Подписаться ДО чтения текущего статуса, чтобы не проспать NOTIFY между
+        чтением и ожиданием. Отдаёт future, который резолвится новым статусом.
+        """
+        self._ensure_listener()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        entry = (loop, fut)
+        with self._lock:
+            self._waiters.setdefault(order_id, set()).add(entry)
+        try:
+            yield fut
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(order_id)
+                if waiters is not None:
+                    waiters.discard(entry)
+                    if not waiters:
+                        del self._waiters[order_id]
+
+    def dispatch(self, order_id: int, status: str) -> None:
+        with self._lock:
+            entries = list(self._waiters.get(order_id, ()))
+        for loop, fut in entries:
+            loop.call_soon_threadsafe(_resolve, fut, status)
+
+    # ---------- LISTEN ----------
+
+    def _ensure_listener(self) -> None:
+        if not _is_postgres() or self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(
+                    target=self._listen_forever, daemon=True, name="order-status-listen",
+                )
+                self._listener.start()
+
+    def _listen_forever(self) -> None:
+        import psycopg2
+        import psycopg2.extensions
+
+        db = settings.DATABASES["default"]
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(
+                    dbname=db["NAME"], user=db["USER"], password=db["PASSWORD"],
+                    host=db["HOST"], port=db["PORT"],
+                )
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CHANNEL};")
+                log.info("order status listener: LISTEN %s", CHANNEL)
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._on_notify(conn.notifies.pop(0).payload)
+            except Exception:
+                log.exception("order status listener failed, reconnecting")
+                time.sleep(1)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _on_notify(self, payload: str) -> None:
+        try:
+            data = json.loads(payload)
+            self.dispatch(int(data["order_id"]), data["status"])
+        except Exception:
+            log.warning("order status listener: bad payload %r", payload)
+
+
+order_status_hub = OrderStatusHub()
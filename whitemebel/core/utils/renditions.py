@@ -0,0 +1,122 @@
+# core/utils/renditions.py
+"""
+Ресайзы картинок под srcset: несколько ширин в WEBP и AVIF рядом с оригиналом.
+
+    renditions/<upload_to>/<имя>-<хэш>-<ширина>.<fmt>
+
+Хэш содержимого в имени делает файл неизменяемым (nginx отдаёт /media/renditions/
+с immutable на год): новая картинка — новое имя, старое в кэшах не протухает.
+ContentHashStorage (STORAGES["default"]) переименует в renditions/<upload_to>/<ab>/<sha256>.<fmt> —
+возвращённое storage имя и пишем в image_renditions.
+"""
+import base64
+import hashlib
+import os
+import posixpath
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, features
+
+RENDITIONS_DIR = "renditions"
+PLACEHOLDER_SIDE = 20  # px по большей стороне: ~200–400 байт base64, клиент растягивает с blur
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+_PIL_FORMAT = {"avif": "AVIF", "webp": "WEBP"}
+
+
+def rendition_widths() -> list[int]:
+    return sorted(getattr(settings, "IMAGE_RENDITION_WIDTHS", [320, 640, 960, 1280]))
+
+
+def rendition_formats() -> list[str]:
+    # AVIF — только если Pillow собран с ним; порядок = приоритет в <picture>
+    fmts = getattr(settings, "IMAGE_RENDITION_FORMATS", ["avif", "webp"])
+    return [f for f in fmts if f in _PIL_FORMAT and features.check(f)]
+
+
+def _quality(fmt: str) -> int:
+    return getattr(settings, "IMAGE_RENDITION_QUALITY", {}).get(fmt, 60 if fmt == "avif" else 78)
+
+
+def placeholder_data_uri(img: Image.Image) -> str:
+    """Крошечный WEBP (LQIP) data: URI — рисуется сразу, пока грузится настоящая картинка."""
+    scale = PLACEHOLDER_SIDE / max(img.size)
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    out = BytesIO()
+    img.resize(size, Image.BOX, reducing_gap=2.0).convert("RGB").save(out, format="WEBP", quality=40)
+    return "data:image/webp;base64," + base64.b64encode(out.getvalue()).decode("ascii")
+
+
+def build_renditions(source, upload_dir: str = "", storage=None) -> tuple[dict, tuple[int, int], str]:
+    """
+    source — файл поля (уже перекодированный в WEBP или новый ContentFile),
+    upload_dir — upload_to поля, если у несохранённого файла в имени ещё нет каталога.
+    Пишет ресайзы в storage и возвращает
+    (описание для поля image_renditions, (ширина, высота), плейсхолдер data: URI):
+
+        {"avif": {"320": "renditions/products/x-ab12-320.avif", ...}, "webp": {...}}
+
+    Ширины не больше исходной: мелкую картинку не раздуваем.
+    """
+    storage = storage or default_storage
+    source.seek(0)
+    sha = hashlib.sha1()
+    while block := source.read(64 * 1024):
+        sha.update(block)
+    source.seek(0)
+    digest = sha.hexdigest()[:10]
+    dirname, filename = posixpath.split(source.name.replace(os.sep, "/"))
+    dirname = upload_dir.strip("/") or dirname
+    base = os.path.splitext(filename)[0][:60]
+    target_dir = posixpath.join(RENDITIONS_DIR, dirname)
+
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGB")
+        result = {}
+        widths = [w for w in rendition_widths() if w < img.width]
+        for fmt in rendition_formats():
+            result[fmt] = {}
+            for w in widths:
+                h = max(1, round(img.height * w / img.width))
+                out = BytesIO()
+                img.resize((w, h), Image.LANCZOS, reducing_gap=3.0).save(
+                    out, format=_PIL_FORMAT[fmt], quality=_quality(fmt),
+                )
+                name = posixpath.join(target_dir, f"{base}-{digest}-{w}.{fmt}")
+                if not storage.exists(name):
+                    name = storage.save(name, ContentFile(out.getvalue()))
+                result[fmt][str(w)] = name
+        return result, (img.width, img.height), placeholder_data_uri(img)
+
+
+def image_set(field_file, renditions: dict | None, width, height, build_url, placeholder: str = "") -> dict | None:
+    """
+    srcset-готовая структура для API:
+
+        {"src": ".../x.webp", "width": 1600, "height": 1200, "placeholder": "data:image/webp;base64,...",
+         "sources": [{"type": "image/avif", "srcset": "... 320w, ... 640w"},
+                     {"type": "image/webp", "srcset": "... 320w, ..., .../x.webp 1600w"}]}
+
+    Оригинал (он и так WEBP) добавляется в webp-набор самой большой ширины.
+    build_url(path) -> абсолютный URL (обычно через request.build_absolute_uri).
+    """
+    if not field_file:
+        return None
+    renditions = renditions or {}
+    src = build_url(field_file.url)
+    sources = []
+    for fmt, mime in MIME_TYPES.items():
+        variants = renditions.get(fmt) or {}
+        items = [
+            f"{build_url(default_storage.url(name))} {w}w"
+            for w, name in sorted(variants.items(), key=lambda kv: int(kv[0]))
+        ]
+        if fmt == "webp" and width and items:
+            items.append(f"{src} {width}w")
+        if items:
+            sources.append({"type": mime, "srcset": ", ".join(items)})
+    return {"src": src, "width": width, "height": height, "placeholder": placeholder or "", "sources": sources}
@@ -0,0 +1,120 @@
+# core/utils/resize.py
+"""
+Ресайз по запросу: /api/img/resize/?src=products/x.webp&w=1200&h=630&fit=cover&fmt=jpeg&s=<подпись>
+
+Параметры подписываются (SECRET_KEY, salt "image-resize"), так что произвольные размеры
+с улицы не заказать — ссылки выдаёт signed_resize_url() / manage.py resize_url.
+Результат пишется в IMAGE_RESIZE_CACHE_DIR под именем из хэша параметров:
+
+    <cache>/<ab>/<sha1>.<fmt>
+
+Первый запрос рендерит (одновременные ждут на flock и берут готовый файл), дальше вьюха только проверяет подпись и отдаёт файл через X-Accel-Redirect (nginx, /_resized/).
+"""
+import fcntl
+import hashlib
+import math
+import os
+import tempfile
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from core.utils.image import open_bounded
+
+FITS = ("cover", "contain", "scale")
+FORMATS = {"webp": "image/webp", "avif": "image/avif", "jpeg": "image/jpeg"}
+_PIL_FORMAT = {"webp": "WEBP", "avif": "AVIF", "jpeg": "JPEG"}
+_QUALITY = {"webp": 80, "avif": 60, "jpeg": 85}
+
+_signer = signing.Signer(salt="image-resize")
+
+
+def _canonical(src: str, w: int, h: int, fit: str, fmt: str) -> str:
+    return f"{src}|{w}|{h}|{fit}|{fmt}"
+
+
+def resize_signature(src: str, w: int, h: int, fit: str, fmt: str) -> str:
+    return _signer.signature(_canonical(src, w, h, fit, fmt))
+
+
+def check_resize_params(src: str, w: int, h: int, fit: str, fmt: str) -> None:
+    """ValueError с понятным текстом, если параметры невалидны."""
+    max_side = getattr(settings, "IMAGE_MAX_SIDE", 2560)
+    if not src or src.startswith("/") or ".." in src.split("/"):
+        raise ValueError("src: путь относительно MEDIA_ROOT")
+    if fit not in FITS:
+        raise ValueError(f"fit: одно из {', '.join(FITS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt: одно из {', '.join(FORMATS)}")
+    if not (0 <= w <= max_side and 0 <= h <= max_side) or not (w or h):
+        raise ValueError(f"w/h: 1..{max_side}, хотя бы один")
+    if fit != "scale" and not (w and h):
+        raise ValueError(f"fit={fit} требует и w, и h")
+
+
+def signed_resize_url(src: str, w: int = 0, h: int = 0, fit: str = "cover", fmt: str = "webp") -> str:
+    """Относительный URL ресайза; src — имя файла в storage (field_file.name)."""
+    check_resize_params(src, w, h, fit, fmt)
+    query = {"src": src, "w": w, "h": h, "fit": fit, "fmt": fmt, "s": resize_signature(src, w, h, fit, fmt)}
+    return f"{reverse('image-resize')}?{urlencode(query)}"
+
+
+def cache_name(src: str, w: int, h: int, fit: str, fmt: str) -> str:
+    key = hashlib.sha1(_canonical(src, w, h, fit, fmt).encode()).hexdigest()
+    return f"{key[:2]}/{key}.{fmt}"
+
+
+def _render(src: str, w: int, h: int, fit: str, fmt: str, dest: str) -> None:
+    with default_storage.open(src, "rb") as f:
+        with Image.open(f) as probe:  # только заголовок — сколько пикселей реально нужно
+            sw, sh = probe.size
+        f.seek(0)
+        if fit == "cover":
+            scale = max(w / sw, h / sh)
+        else:
+            scale = min(w / sw if w else math.inf, h / sh if h else math.inf)
+        img = open_bounded(f, max_side=max(1, math.ceil(max(sw, sh) * min(scale, 1))))
+
+        if fit == "cover":
+            img = ImageOps.fit(img, (w, h), Image.LANCZOS)
+        elif img.width > (w or img.width) or img.height > (h or img.height):
+            img = ImageOps.contain(img, (w or img.width, h or img.height), Image.LANCZOS)
+        if fmt == "jpeg" and img.mode != "RGB":
+            img = img.convert("RGB")
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                img.save(out, format=_PIL_FORMAT[fmt], quality=_QUALITY[fmt])
+            os.replace(tmp, dest)  # атомарно: читатели видят либо ничего, либо готовый файл
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+def get_resized(src: str, w: int, h: int, fit: str, fmt: str) -> str:
+    """
+    Имя готового файла относительно IMAGE_RESIZE_CACHE_DIR; рендерит при первом обращении.
+    FileNotFoundError — нет исходника; ValueError/PIL-ошибки — исходник не картинка.
+    """
+    name = cache_name(src, w, h, fit, fmt)
+    dest = os.path.join(settings.IMAGE_RESIZE_CACHE_DIR, name)
+    if os.path.exists(dest):
+        return name
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    # один рендер на ключ: остальные воркеры ждут на блокировке и забирают готовый файл.
+    # Блокировки — не рядом с файлами (кэш публичный), а 256 штук на всё, по префиксу имени
+    lock_dir = settings.IMAGE_RESIZE_LOCK_DIR
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, name[:2] + ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(dest):
+                _render(src, w, h, fit, fmt, dest)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return name
@@ -4,3 +4,29 @@ from unidecode import unidecode
 
 def ascii_slug(value: str) -> str:
     return slugify(unidecode(value or ""), allow_unicode=False)
+
+
+class SlugAllocator:
+    """
+    Уникальные слаги в памяти: занятые грузятся один раз, дальше — ни одного запроса.
+    Коллизию решает суффиксом -2, -3, …; счётчик на базу, чтобы не перебирать заново.
+    """
+
+    def __init__(self, taken=(), max_length: int = 255, fallback: str = "item"):
+        self.taken = set(taken)
+        self.max_length = max_length
+        self.fallback = fallback
+        self._next = {}
+
+    def allocate(self, value: str) -> str:
+        # обрезка может оставить «-» в конце — убираем, иначе повторный slugify даст другой слаг
+        base = ascii_slug(value)[: self.max_length].strip("-") or self.fallback
+        slug, i = base, self._next.get(base, 2)
+        while slug in self.taken:
+            suffix = f"-{i}"
+            slug = base[: self.max_length - len(suffix)].strip("-") + suffix
+            i += 1
+        self._next[base] = i
+        self.taken.add(slug)
+        return slug
+
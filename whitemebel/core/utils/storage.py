@@ -0,0 +1,47 @@
+# core/utils/storage.py
+"""
+Хранилище media с именами по содержимому.
+
+    products/photo.webp  ->  products/3f/3fa2…c9.webp   (sha256, 32 hex)
+
+Одинаковый файл сохраняется один раз (сид кладёт одну заглушку сотням товаров),
+а файл под именем никогда не меняется — nginx отдаёт /media/ как immutable на год.
+Раз файлы общие, синхронно их не удаляем вовсе: неиспользуемые собирает
+core.images.collect_garbage (manage.py gc_media) по истечении grace-периода. Поэтому
+переиспользованный файл «трогается» (mtime) — сборщик считает его свежим.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+HASH_LEN = 32
+
+
+def content_hash(content) -> str:
+    sha = hashlib.sha256()
+    for chunk in content.chunks():
+        sha.update(chunk)
+    content.seek(0)
+    return sha.hexdigest()[:HASH_LEN]
+
+
+class ContentHashStorage(FileSystemStorage):
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest = content_hash(content)
+        dirname = posixpath.dirname(name.replace(os.sep, "/"))
+        ext = os.path.splitext(name)[1].lower()
+        name = posixpath.join(dirname, digest[:2], f"{digest}{ext}")
+        try:
+            os.utime(self.path(name))  # такой же файл уже лежит — переиспользуем (и он снова «свежий»)
+            return name
+        except FileNotFoundError:
+            pass
+        # гонка двух одинаковых загрузок: вторая получит суффикс от get_available_name — просто дубль
+        return super().save(name, content, max_length=max_length)
@@ -1,9 +1,10 @@
 # core/views.py
 import logging
+import os
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
-from django.db.models import Case, When, IntegerField, Count, Min, Max, Q, Value ,Prefetch
+from django.db.models import Case, When, IntegerField, Count, Min, Max, Q, Value
 from rest_framework.response import Response
 from django_filters import rest_framework as dj_filters
 from drf_spectacular.utils import extend_schema, OpenApiParameter, OpenApiTypes,OpenApiResponse
@@ -52,7 +53,21 @@ from core.serializers import (
 from rest_framework.throttling import AnonRateThrottle
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 from core.serializers import OneClickRequestSerializer
+from core.serializers import StockFeedRequestSerializer, StockFeedResponseSerializer
 from core.models import OneClickRequest
+from core.utils.idempotency import IDEMPOTENCY_HEADER, run_idempotent
+from core.utils.order_events import order_status_hub
+from core.utils.order_cache import get_order_snapshot, snapshot_total
+from core.stock_feed import apply_stock_deltas
+from collections import Counter
+from core.payments import detect_event, receive_cp_event
+from core.utils.log import LazyJson
+from core.utils.resize import FORMATS, check_resize_params, get_resized, resize_signature
+from PIL import UnidentifiedImageError
+import asyncio
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.views import View
 
 
 
@@ -139,6 +154,15 @@ def _parse_bool(v, default=None):
     if v is None:
         return default
     return str(v).lower() in {"1","true","yes","y","on"}
+
+
+def _parse_int(v, default):
+    """Целое из query-параметра; мусор и отрицательные — default (а не 500)."""
+    try:
+        n = int(v)
+    except (TypeError, ValueError):
+        return default
+    return n if n >= 0 else default
 class FiltersView(APIView):
     """
     Возвращает фильтры для каталога:
@@ -484,29 +508,25 @@ class ProductListView(APIView):
 # core/views.py
 class ProductDetailView(APIView):
     """
-    GET /api/products/<slug>/?include_related=1&related_limit=8&related_by_color_limit=8
+    GET /api/products/<slug>/?include_related=1&related_limit=8&related_by_color_limit=8&bought_together_limit=8
     """
     @extend_schema(
         parameters=[
             OpenApiParameter("include_related", OpenApiTypes.INT, OpenApiParameter.QUERY, description="1/0 — включить блоки related_* (по умолчанию 1)"),
             OpenApiParameter("related_limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Сколько связанных вернуть (default 8)"),
             OpenApiParameter("related_by_color_limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Сколько связанных по цвету вернуть (default 8)"),
+            OpenApiParameter("bought_together_limit", OpenApiTypes.INT, OpenApiParameter.QUERY, description="Сколько «покупают вместе» вернуть (default 8)"),
         ],
         responses=ProductDetailSerializer,
         summary="Детальная карточка товара",
     )
     def get(self, request, slug):
         include_related = str(request.query_params.get("include_related", "1")).lower() in {"1","true","yes","on"}
-        related_limit = int(request.query_params.get("related_limit", 8))
-        related_by_color_limit = int(request.query_params.get("related_by_color_limit", 8))
-
-        # queryset для карточек, как в листинге
-        rel_card_qs = (
-            Product.objects.filter(is_active=True)
-            .select_related("color", "category")
-            .prefetch_related("tags")
-        )
+        related_limit = _parse_int(request.query_params.get("related_limit"), 8)
+        related_by_color_limit = _parse_int(request.query_params.get("related_by_color_limit"), 8)
+        bought_together_limit = _parse_int(request.query_params.get("bought_together_limit"), 8)
 
+        # related-блоки сериализатор читает сам, в порядке ранга (запрос на блок, как и prefetch)
         qs = (
             Product.objects.filter(is_active=True, slug=slug)
             .select_related("color", "category")
@@ -515,11 +535,6 @@ class ProductDetailView(APIView):
                 "images",
                 "attributes__attribute",
                 "attributes__option",
-                # related блоки — сразу карточными данными
-                *( [
-                    Prefetch("related_products", queryset=rel_card_qs),
-                    Prefetch("related_by_color", queryset=rel_card_qs),
-                ] if include_related else [] )
             )
         )
 
@@ -529,6 +544,7 @@ class ProductDetailView(APIView):
             "request": request,
             "related_limit": related_limit if include_related else 0,
             "related_by_color_limit": related_by_color_limit if include_related else 0,
+            "bought_together_limit": bought_together_limit if include_related else 0,
         }
         data = ProductDetailSerializer(obj, context=ctx).data
         return Response(data)
@@ -942,6 +958,13 @@ class OrderCreateView(CreateAPIView):
     @extend_schema(
         summary="Оформление заказа",
         tags=["orders"],
+        parameters=[
+            OpenApiParameter(
+                IDEMPOTENCY_HEADER, OpenApiTypes.STR, OpenApiParameter.HEADER,
+                description="Ключ идемпотентности: ретрай с тем же ключом и телом вернёт исходный ответ, "
+                            "не создавая новый заказ",
+            ),
+        ],
         request=OrderCreateSerializer,
         responses=OrderCreateSerializer,
         examples=[
@@ -999,6 +1022,7 @@ class OrderCreateView(CreateAPIView):
                     "delivery_discount": "0.00",
                     "delivery_cost": "1500.00",
                     "status_api": "https://white-mebel.com/api/orders/10/status/",
+                    "status_wait_api": "https://white-mebel.com/api/orders/10/status/wait/",
                     "pay_url": "https://white-mebel.com/api/payments/pay/10/"
                 },
                 response_only=True,
@@ -1025,6 +1049,7 @@ class OrderCreateView(CreateAPIView):
                     "delivery_discount": "0.00",
                     "delivery_cost": "0.00",
                     "status_api": "https://white-mebel.com/api/orders/11/status/",
+                    "status_wait_api": "https://white-mebel.com/api/orders/11/status/wait/",
                     "accepted_url": "https://white-mebel.com/api/orders/11/accepted/"
                 },
                 response_only=True,
@@ -1035,13 +1060,19 @@ class OrderCreateView(CreateAPIView):
         return super().post(request, *args, **kwargs)
 
     def perform_create(self, serializer):
-        # создаём заказ (расчёты внутри сериализатора)
-        self.order = serializer.save()
-        # неблокирующие побочные действия — строго после коммита
-        transaction.on_commit(lambda: send_order_notifications_async(self.order.id))
+        with transaction.atomic():
+            # создаём заказ (расчёты внутри сериализатора)
+            self.order = serializer.save()
+            # письма — задачей в очереди (core/jobs.py): она коммитится вместе с заказом,
+            # воркер run_jobs увидит её только после коммита и не потеряет при рестарте веба
+            send_order_notifications_async(self.order.id)
         # transaction.on_commit(lambda: push_order_to_amocrm_async(self.order.id))  # когда подключишь
 
     def create(self, request, *args, **kwargs):
+        # ретраи мобилок с тем же Idempotency-Key получают исходный ответ
+        return run_idempotent(request, "orders.create", lambda: self._create(request))
+
+    def _create(self, request):
         """
         Переопределяем create(), чтобы добавить полезные ссылки (pay_url / accepted_url, status_api)
         без задержки ответа фронту.
@@ -1059,6 +1090,9 @@ class OrderCreateView(CreateAPIView):
                     reverse("order-status", kwargs={"order_id": self.order.id})
                 )
                 data["status_api"] = status_url
+                data["status_wait_api"] = request.build_absolute_uri(
+                    reverse("order-status-wait", kwargs={"order_id": self.order.id})
+                )
 
                 if self.order.payment_method == "online":
                     # ссылка на страницу с виджетом CloudPayments
@@ -1094,6 +1128,7 @@ class CloudPaymentsPayView(TemplateView):
         success_url = request.build_absolute_uri(f"/api/payments/success/?order_id={order.id}")
         fail_url    = request.build_absolute_uri(f"/api/payments/fail/?order_id={order.id}")
         status_api  = request.build_absolute_uri(f"/api/orders/{order.id}/status/")
+        status_wait_api = request.build_absolute_uri(f"/api/orders/{order.id}/status/wait/")
 
         # сумма в копейках (int)
         amount_minor = int((order.total_price * Decimal('100')).quantize(0, ROUND_HALF_UP))
@@ -1108,6 +1143,7 @@ class CloudPaymentsPayView(TemplateView):
             "success_url": success_url,
             "fail_url": fail_url,
             "status_api": status_api,
+            "status_wait_api": status_wait_api,
         })
         return ctx
 
@@ -1123,21 +1159,25 @@ class CloudPaymentsInitView(APIView):
         summary="CloudPayments: получить конфиг для оплаты заказа",
     )
     def get(self, request, order_id: int):
-        order = get_object_or_404(Order, pk=order_id)
+        # снимок из кэша, в БД идём только на промахе
+        order = get_order_snapshot(order_id)
+        if order is None:
+            raise NotFound("Заказ не найден")
+        oid = order["id"]
 
-        success_url = request.build_absolute_uri(f"/api/payments/success/?order_id={order.id}")
-        fail_url    = request.build_absolute_uri(f"/api/payments/fail/?order_id={order.id}")
-        status_api  = request.build_absolute_uri(f"/api/orders/{order.id}/status/")
-        pay_url     = request.build_absolute_uri(reverse("cp-pay", args=[order.id]))
+        success_url = request.build_absolute_uri(f"/api/payments/success/?order_id={oid}")
+        fail_url    = request.build_absolute_uri(f"/api/payments/fail/?order_id={oid}")
+        status_api  = request.build_absolute_uri(f"/api/orders/{oid}/status/")
+        pay_url     = request.build_absolute_uri(reverse("cp-pay", args=[oid]))
 
         payload = {
-            "order_id": order.id,
+            "order_id": oid,
             "public_id": settings.CLOUDPAYMENTS_PUBLIC_ID,
-            "amount": float(order.total_price),
+            "amount": float(snapshot_total(order)),
             "currency": "RUB",
-            "customer_email": order.email or "",
-            "account_id": order.email or order.phone or f"user-{order.id}",
-            "description": f"Оплата заказа #{order.id} на WhiteMebel",
+            "customer_email": order["email"] or "",
+            "account_id": order["email"] or order["phone"] or f"user-{oid}",
+            "description": f"Оплата заказа #{oid} на WhiteMebel",
             "status_api": status_api,
             "success_url": success_url,
             "fail_url": fail_url,
@@ -1157,8 +1197,58 @@ class OrderStatusView(APIView):
         summary="Статус заказа (для поллинга оплаты)",
     )
     def get(self, request, order_id: int):
-        order = get_object_or_404(Order, pk=order_id)
-        return Response({"order_id": order.id, "status": order.status, "paid": order.status == "paid"})
+        # поллинг бьёт в кэш; снимок обновляется при каждом сохранении заказа
+        order = get_order_snapshot(order_id)
+        if order is None:
+            raise NotFound("Заказ не найден")
+        return Response({"order_id": order["id"], "status": order["status"], "paid": order["status"] == "paid"})
+
+
+# ---------- long-poll статуса (ASGI, вместо частого поллинга) ----------
+@sync_to_async
+def _load_order_status(order_id: int):
+    snap = get_order_snapshot(order_id)
+    return snap["status"] if snap else None
+
+
+class OrderStatusWaitView(View):
+    """
+    GET /api/orders/<id>/status/wait/?since=new&timeout=25
+
+    Держит запрос, пока статус равен ``since`` (или пока не выйдет timeout),
+    и отдаёт тот же payload, что /status/, плюс ``changed``.
+    Без ``since`` отвечает сразу. Будят его вебхуки через order_events (LISTEN/NOTIFY).
+    Асинхронная вьюха: обслуживать через config.asgi, чтобы ждущие не занимали sync-воркеры.
+    """
+    default_timeout = 25
+    max_timeout = 55  # < proxy_read_timeout в nginx
+
+    async def get(self, request, order_id: int):
+        since = request.GET.get("since") or ""
+        try:
+            timeout = int(request.GET.get("timeout", self.default_timeout))
+        except ValueError:
+            timeout = self.default_timeout
+        timeout = max(1, min(timeout, self.max_timeout))
+
+        with order_status_hub.subscribe(order_id) as changed:
+            status = await _load_order_status(order_id)
+            if status is None:
+                return JsonResponse({"detail": "Заказ не найден"}, status=404)
+            is_changed = bool(since) and status != since
+            if since and not is_changed:
+                try:
+                    status = await asyncio.wait_for(changed, timeout)
+                    is_changed = status != since
+                except asyncio.TimeoutError:
+                    pass
+
+        return JsonResponse({
+            "order_id": order_id,
+            "status": status,
+            "paid": status == "paid",
+            "changed": is_changed,
+        })
 
 
 # ---------- success/fail (можно редиректить на фронт) ----------
@@ -1212,10 +1302,6 @@ def _client_ip(request):
     xff = request.META.get("HTTP_X_FORWARDED_FOR")
     return xff.split(",")[0].strip() if xff else request.META.get("REMOTE_ADDR", "")
 
-def _to_minor(amount: Decimal) -> int:
-    # безопасно переводим в копейки
-    return int((Decimal(str(amount)) * 100).quantize(Decimal("1")))
-
 def _pick_hmac(request):
     return request.META.get("HTTP_CONTENT_HMAC") or request.META.get("HTTP_X_CONTENT_HMAC") or ""
 
@@ -1248,30 +1334,6 @@ def _parse_cp_payload(raw: bytes, content_type: str) -> dict:
 
     return payload
 
-def _detect_event(payload: dict) -> str:
-    """
-    Унифицируем тип события:
-      - notificationType: check|pay|fail|refund|confirm
-      - либо OperationType=Payment + Status=Completed/Authorized/Declined/Refunded/Reversed/Voided
-    Возвращаем одну из: check|pay|fail|refund|confirm|unknown
-    """
-    ntype = (payload.get("NotificationType") or payload.get("notificationType") or "").lower()
-    if ntype:
-        return ntype
-
-    operation = (payload.get("OperationType") or "").lower()
-    status = (payload.get("Status") or "").lower()
-
-    if operation == "payment":
-        if status in {"completed", "authorized"}:
-            return "pay"
-        if status in {"refunded", "reversed", "voided"}:
-            return "refund"
-        if status in {"declined", "failed"}:
-            return "fail"
-    return "unknown"
-
-
 class CloudPaymentsWebhookView(APIView):
     authentication_classes = []
     permission_classes = []
@@ -1288,7 +1350,7 @@ class CloudPaymentsWebhookView(APIView):
 
     @extend_schema(
         summary="CloudPayments webhook",
-        description="Принимает webhooks от CP (JSON либо x-www-form-urlencoded). Проверка HMAC, сверка суммы, смена статуса заказа.",
+        description="Принимает webhooks от CP (JSON либо x-www-form-urlencoded). Проверка HMAC; check отвечается синхронно (сверка суммы и статуса), остальные события пишутся во входящие и подтверждаются сразу — журнал платежей и статус заказа обновляет фоновый воркер.",
         request=OpenApiTypes.OBJECT,
         responses={200: OpenApiTypes.OBJECT},
     )
@@ -1298,16 +1360,19 @@ class CloudPaymentsWebhookView(APIView):
         hdr_hmac = _pick_hmac(request)
         ip = _client_ip(request)
 
-        # Лог входящих данных (обрезаем тело, чтобы не заспамить)
-        headers_to_log = {
-            k: v for k, v in request.META.items()
-            if k.startswith("HTTP_") and k not in {"HTTP_COOKIE", "HTTP_AUTHORIZATION"}
-        }
-        logger.warning(
-            "CP webhook <-- ip=%s ct=%s hmac=%s headers=%s raw=%s",
-            ip, content_type, hdr_hmac,
-            json.dumps(headers_to_log, ensure_ascii=False),
-            raw.decode("utf-8", errors="replace")[:4000],
+        # Лог входящих данных: сэмплируется (LOG_CP_WEBHOOK_SAMPLE_RATE), заголовки и тело
+        # сериализуются лениво — уже в треде логгера (core/utils/log.py)
+        meta = request.META
+        logger.info(
+            "CP webhook <-- ip=%s ct=%s", ip, content_type,
+            extra={
+                "hmac": hdr_hmac,
+                "headers": LazyJson(lambda: {
+                    k: v for k, v in meta.items()
+                    if k.startswith("HTTP_") and k not in {"HTTP_COOKIE", "HTTP_AUTHORIZATION"}
+                }),
+                "raw": LazyJson(lambda: raw[:4000].decode("utf-8", errors="replace")),
+            },
         )
 
         # HMAC-подпись по «сырым» байтам
@@ -1322,88 +1387,14 @@ class CloudPaymentsWebhookView(APIView):
             return self._err("Bad payload", code=12)
 
         # Дайджест
-        logger.warning(
-            "CP webhook digest: payload=%s",
-            json.dumps(payload, ensure_ascii=False)[:4000],
-        )
+        logger.info("CP webhook digest: payload=%s", LazyJson(payload))
 
-        # Унифицированные поля
-        event = _detect_event(payload)  # check|pay|fail|refund|confirm|unknown
-        invoice_id = payload.get("InvoiceId") or payload.get("InvoiceID") or payload.get("invoiceId")
-        amount_raw = payload.get("Amount")
-        currency = (payload.get("Currency") or "").upper()
-        data = payload.get("Data") or {}
-
-        # Ищем order_id
-        order_id = (data.get("order_id") or invoice_id)
-        if not order_id:
-            return self._err("No order_id", code=12)
-
-        try:
-            order = Order.objects.get(pk=int(order_id))
-        except Order.DoesNotExist:
-            return self._err("Order not found", code=12)
-
-        # Сумма (если есть в событии)
-        if amount_raw not in (None, ""):
-            try:
-                amount = Decimal(str(amount_raw))
-            except Exception:
-                return self._err("Invalid amount", code=12)
-            cp_minor = _to_minor(amount)
-            ord_minor = _to_minor(order.total_price)
-        else:
-            cp_minor = ord_minor = None
-
-        # Обработка типов
-        if event == "check":
-            if currency and currency != "RUB":
-                return self._err("Invalid currency", code=13)
-            if cp_minor is not None and cp_minor != ord_minor:
-                logger.warning(
-                    "CP CHECK mismatch: order=%s got_minor=%s expected_minor=%s",
-                    order.id, cp_minor, ord_minor
-                )
-                # 11 = Invalid amount
-                return self._err("Invalid amount", code=11)
-            if order.status in ("paid", "canceled"):
-                return self._err("Order already closed", code=13)
-            return self._ok("Check OK")
-
-        if event == "pay":
-            # по-хорошему тоже сверяем сумму, если пришла
-            if cp_minor is not None and cp_minor != ord_minor:
-                logger.warning(
-                    "CP PAY mismatch: order=%s got_minor=%s expected_minor=%s",
-                    order.id, cp_minor, ord_minor
-                )
-                return self._err("Invalid amount", code=11)
-            if order.status != "paid":
-                order.status = "paid"
-                order.save(update_fields=["status"])
-            return self._ok("Pay OK")
-
-        if event == "refund":
-            if order.status != "canceled":
-                order.status = "canceled"
-                order.save(update_fields=["status"])
-            return self._ok("Refund OK")
-
-        if event == "fail":
-            # необязательно отменять, но логично
-            if order.status not in ("canceled", "paid"):
-                order.status = "canceled"
-                order.save(update_fields=["status"])
-            return self._ok("Fail OK")
-
-        if event == "confirm":
-            if order.status != "paid":
-                order.status = "paid"
-                order.save(update_fields=["status"])
-            return self._ok("Confirm OK")
-
-        logger.warning("CP webhook: unknown/ignored event=%s", event)
-        return self._ok("Ignored")
+        # check — синхронная проверка; pay/confirm/fail/refund — во входящие и сразу {"code": 0},
+        # журнал Payment и смену статуса заказа делает воркер (core/payments.py)
+        result = receive_cp_event(detect_event(payload), payload)
+        if result.ok:
+            return self._ok(result.message)
+        return self._err(result.message, code=result.code)
 
 class ServiceListView(ListAPIView):
     """
@@ -1449,6 +1440,7 @@ class OrderAcceptedView(TemplateView):
         ctx.update({
             "order": order,
             "status_api": req.build_absolute_uri(f"/api/orders/{order.id}/status/"),
+            "status_wait_api": req.build_absolute_uri(f"/api/orders/{order.id}/status/wait/"),
             # опциональная кнопка "Оплатить онлайн сейчас"
             "pay_url":  req.build_absolute_uri(f"/api/payments/pay/{order.id}/?autostart=1"),
         })
@@ -1484,4 +1476,88 @@ class OneClickRequestCreateView(CreateAPIView):
         ],
     )
     def post(self, request, *args, **kwargs):
-        return super().post(request, *args, **kwargs)
\ No newline at end of file
+        return super().post(request, *args, **kwargs)
+
+
+class ImageResizeView(View):
+    """
+    GET /api/img/resize/?src=&w=&h=&fit=cover|contain|scale&fmt=webp|avif|jpeg&s=<подпись>
+
+    Ссылки подписаны (core/utils/resize.py, manage.py resize_url). Первый запрос рендерит файл
+    в дисковый кэш, дальше — только проверка подписи и X-Accel-Redirect: байты отдаёт nginx.
+    Без IMAGE_RESIZE_ACCEL (dev без nginx) файл отдаёт сам Django.
+    """
+    cache_control = "public, max-age=31536000, immutable"
+
+    def get(self, request):
+        q = request.GET
+        src, fit, fmt = q.get("src", ""), q.get("fit", "cover"), q.get("fmt", "webp")
+        try:
+            w, h = int(q.get("w") or 0), int(q.get("h") or 0)
+            check_resize_params(src, w, h, fit, fmt)
+        except ValueError as e:
+            return JsonResponse({"detail": str(e)}, status=400)
+        if not hmac.compare_digest(q.get("s", ""), resize_signature(src, w, h, fit, fmt)):
+            return JsonResponse({"detail": "Неверная подпись"}, status=403)
+
+        try:
+            name = get_resized(src, w, h, fit, fmt)
+        except FileNotFoundError:
+            return JsonResponse({"detail": "Нет исходного файла"}, status=404)
+        except (UnidentifiedImageError, ValueError) as e:
+            return JsonResponse({"detail": f"Не удалось обработать: {e}"}, status=422)
+
+        if settings.IMAGE_RESIZE_ACCEL:
+            resp = HttpResponse(content_type=FORMATS[fmt])
+            resp["X-Accel-Redirect"] = settings.IMAGE_RESIZE_ACCEL_PREFIX + name
+        else:
+            resp = FileResponse(open(os.path.join(settings.IMAGE_RESIZE_CACHE_DIR, name), "rb"),
+                                content_type=FORMATS[fmt])
+        resp["Cache-Control"] = self.cache_control
+        return resp
+
+
+class StockFeedPermission(permissions.BasePermission):
+    """Учётка — по "Authorization: Token <STOCK_FEED_TOKEN>", руками — staff-сессия админки."""
+
+    def has_permission(self, request, view):
+        token = settings.STOCK_FEED_TOKEN
+        scheme, _, value = request.headers.get("Authorization", "").partition(" ")
+        if token and scheme.lower() == "token" and hmac.compare_digest(value.strip(), token):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+
+class StockFeedView(APIView):
+    """
+    POST /api/catalog/stock-feed/ — дельты остатков/цен пачкой (core/stock_feed.py).
+    Тело: {"items": [{"sku", "stock"?, "price"?, "discount_price"?}, …]} или просто список.
+    Кривые строки не валят запрос — у них status=invalid, остальные применяются.
+    """
+    permission_classes = [StockFeedPermission]
+
+    @extend_schema(
+        summary="Фид остатков и цен",
+        request=StockFeedRequestSerializer,
+        responses={200: StockFeedResponseSerializer},
+        examples=[
+            OpenApiExample(
+                name="Пример запроса",
+                value={"items": [
+                    {"sku": "WM-000123", "stock": 4},
+                    {"sku": "WM-000124", "price": "15990.00", "discount_price": None},
+                ]},
+                request_only=True,
+            )
+        ],
+    )
+    def post(self, request):
+        items = request.data.get("items") if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list):
+            return Response({"detail": "Ожидался список items"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.STOCK_FEED_MAX_ITEMS:
+            return Response({"detail": f"Больше {settings.STOCK_FEED_MAX_ITEMS} строк — разбейте на части"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        results = apply_stock_deltas(items)
+        counts = Counter(r["status"] for r in results)
+        return Response({"received": len(items), "counts": counts, "results": results})